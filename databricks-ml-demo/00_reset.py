@@ -1,29 +1,58 @@
 # Databricks notebook source
-# Load libraries
+# MAGIC %md
+# MAGIC ## Reset
+# MAGIC 
+# MAGIC - `snapshot` (default): restore `bronze_customers`, `churn_features` and `churn_preds` to a snapshot recorded with `00_snapshot`, in seconds. Falls back to a full reset if the snapshot is missing or can no longer be restored.
+# MAGIC - `full`: drop the database and Delta paths; everything has to be rebuilt from the CSV (`00b` → `01` → `06`).
+
+# COMMAND ----------
+
+# MAGIC %run ./bootstrap
+
+# COMMAND ----------
+
+# MAGIC %run ./snapshots
+
+# COMMAND ----------
+
 import shutil
-import numpy as np # linear algebra
-import pandas as pd # data processing, CSV file I/O (e.g. pd.read_csv)
-from pyspark.sql.functions import col, when
-from pyspark.sql.types import StructType,StructField,DoubleType, StringType, IntegerType, FloatType
 
 # Set config for database name, file paths, and table names
-database_name = 'kyber_db_ml'
-
-# Move file from driver to DBFS
-user = dbutils.notebook.entry_point.getDbutils().notebook().getContext().tags().apply('user')
-driver_to_dbfs_path = 'dbfs:/home/{}/ibm-telco-churn/Telco-Customer-Churn.csv'.format(user)
-# dbutils.fs.cp('file:/databricks/driver/Telco-Customer-Churn.csv', driver_to_dbfs_path)
+config = ChurnConfig(dbutils=dbutils)
+database_name = config.database_name
+user = config.user
+driver_to_dbfs_path = config.dbfs_csv_path
 
 # Paths for various Delta tables
-bronze_tbl_path = '/home/{}/ibm-telco-churn/bronze/'.format(user)
-silver_tbl_path = '/home/{}/ibm-telco-churn/silver/'.format(user)
-automl_tbl_path = '/home/{}/ibm-telco-churn/automl-silver/'.format(user)
-telco_preds_path = '/home/{}/ibm-telco-churn/preds/'.format(user)
+bronze_tbl_path = config.bronze_tbl_path
+quarantine_tbl_path = config.quarantine_tbl_path
+silver_tbl_path = config.silver_tbl_path
+automl_tbl_path = config.automl_tbl_path
+telco_preds_path = config.telco_preds_path
+traces_path = config.traces_path
+snapshots_path = config.snapshots_path
+
+bronze_tbl_name = config.bronze_tbl_name
+quarantine_tbl_name = config.quarantine_tbl_name
+silver_tbl_name = config.silver_tbl_name
+automl_tbl_name = config.automl_tbl_name
+telco_preds_tbl_name = config.telco_preds_tbl_name
+
+dbutils.widgets.dropdown('reset_mode', 'snapshot', ['snapshot', 'full'])
+dbutils.widgets.text('snapshot_name', 'baseline')
+reset_mode = dbutils.widgets.get('reset_mode')
+snapshot_name = dbutils.widgets.get('snapshot_name')
+
+# COMMAND ----------
 
-bronze_tbl_name = 'bronze_customers'
-silver_tbl_name = 'silver_customers'
-automl_tbl_name = 'gold_customers'
-telco_preds_tbl_name = 'telco_preds'
+full_reset = True
+if reset_mode == 'snapshot':
+  try:
+    restore_report = restore_snapshot(spark, snapshot_name, '/dbfs' + snapshots_path)
+    print(restore_report['tables'])
+    full_reset = False
+  except Exception as e:
+    print(f"Snapshot restore failed ({e}), doing a full reset")
 
 # COMMAND ----------
 
@@ -35,29 +64,24 @@ telco_preds_tbl_name = 'telco_preds'
 
 # COMMAND ----------
 
-# Delete the old database and tables if needed
-# uncomment if you need a reset
-_ = spark.sql('DROP DATABASE IF EXISTS {} CASCADE'.format(database_name))
+if full_reset:
+  # Delete the old database and tables if needed
+  _ = spark.sql('DROP DATABASE IF EXISTS {} CASCADE'.format(database_name))
 
-# Create database to house tables
-# _ = spark.sql('CREATE DATABASE {}'.format(database_name))
-# Drop any old delta lake files if needed (e.g. re-running this notebook with the same bronze_tbl_path and silver_tbl_path)
-shutil.rmtree('/dbfs'+bronze_tbl_path, ignore_errors=True)
-shutil.rmtree('/dbfs'+silver_tbl_path, ignore_errors=True)
-shutil.rmtree('/dbfs'+telco_preds_path, ignore_errors=True)
+  # Create database to house tables
+  # _ = spark.sql('CREATE DATABASE {}'.format(database_name))
+  # Drop any old delta lake files if needed (e.g. re-running this notebook with the same bronze_tbl_path and silver_tbl_path)
+  shutil.rmtree('/dbfs'+bronze_tbl_path, ignore_errors=True)
+  shutil.rmtree('/dbfs'+quarantine_tbl_path, ignore_errors=True)
+  shutil.rmtree('/dbfs'+silver_tbl_path, ignore_errors=True)
+  shutil.rmtree('/dbfs'+telco_preds_path, ignore_errors=True)
+  # Snapshots point at versions of the tables that were just dropped
+  shutil.rmtree('/dbfs'+snapshots_path, ignore_errors=True)
 
 # COMMAND ----------
 
-# MAGIC %sql
-# MAGIC CREATE DATABASE IF NOT EXISTS kyber_db_ml
-# MAGIC     COMMENT "CREATE A DATABASE WITH A LOCATION PATH"
-# MAGIC     LOCATION "/Users/duy.nguyen@disney.com/databases/kyber_db_ml" --this must be a location on dbfs (i.e. not direct access)
+# Recreate the database after a full reset, and switch to it
+ensure_database(spark, config, force=full_reset)
 
 # COMMAND ----------
 
-# MAGIC %sql
-# MAGIC USE kyber_db_ml
-
-# COMMAND ----------
-
-
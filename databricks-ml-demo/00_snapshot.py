@@ -0,0 +1,21 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Record a snapshot
+# MAGIC 
+# MAGIC Saves the current Delta versions of `bronze_customers`, `churn_features` and `churn_preds` under a name. Run it once the pipeline has been built (`00b` → `01` → `06`); after that, `00_reset` with `reset_mode=snapshot` brings the tables back to this state in seconds.
+
+# COMMAND ----------
+
+# MAGIC %run ./commons
+
+# COMMAND ----------
+
+# MAGIC %run ./snapshots
+
+# COMMAND ----------
+
+dbutils.widgets.text('snapshot_name', 'baseline')
+snapshot_name = dbutils.widgets.get('snapshot_name')
+
+manifest = create_snapshot(spark, snapshot_name, database_name, '/dbfs' + snapshots_path)
+manifest
@@ -20,10 +20,6 @@ spark.sql(f"USE {database_name}")
 
 # Load libraries
 import shutil
-import numpy as np # linear algebra
-import pandas as pd # data processing, CSV file I/O (e.g. pd.read_csv)
-from pyspark.sql.functions import col, when
-from pyspark.sql.types import StructType,StructField,DoubleType, StringType, IntegerType, FloatType
 
 # Move file from driver to DBFS
 user = dbutils.notebook.entry_point.getDbutils().notebook().getContext().tags().apply('user')
@@ -35,6 +31,7 @@ bronze_tbl_path = '/home/{}/ibm-telco-churn/bronze/'.format(user)
 silver_tbl_path = '/home/{}/ibm-telco-churn/silver/'.format(user)
 automl_tbl_path = '/home/{}/ibm-telco-churn/automl-silver/'.format(user)
 telco_preds_path = '/home/{}/ibm-telco-churn/preds/'.format(user)
+quarantine_tbl_path = '/home/{}/ibm-telco-churn/bronze_quarantine/'.format(user)
 
 bronze_tbl_name = 'bronze_customers'
 silver_tbl_name = 'silver_customers'
@@ -51,21 +48,26 @@ telco_preds_tbl_name = 'telco_preds'
 shutil.rmtree('/dbfs'+bronze_tbl_path, ignore_errors=True)
 shutil.rmtree('/dbfs'+silver_tbl_path, ignore_errors=True)
 shutil.rmtree('/dbfs'+telco_preds_path, ignore_errors=True)
+shutil.rmtree('/dbfs'+quarantine_tbl_path, ignore_errors=True)
 
 # COMMAND ----------
 
 # MAGIC %md
 # MAGIC # Read Data
+# MAGIC 
+# MAGIC Types come from the shared schema contract, so this is a single pass over the file (no `inferSchema`). Rows that break the contract are not dropped: they go to the quarantine table with their reason, and the reject count of the run is printed.
 
 # COMMAND ----------
 
-df = (spark.read
-      .option("header", "true")
-      .option("delimiter", ",")
-      .option("inferSchema", "true")
-      .csv("/home/duy.nguyen@disney.com/ibm-telco-churn/Telco-Customer-Churn.csv")
-     )
-      
+# MAGIC %run ./schema_contract
+
+# COMMAND ----------
+
+ingest_report = ingest_telco_csv(spark, "/home/duy.nguyen@disney.com/ibm-telco-churn/Telco-Customer-Churn.csv",
+                                 bronze_tbl_path, quarantine_tbl_path)
+print("Schema v{schema_version}: {accepted} rows accepted, {rejected} quarantined {rejects_by_reason}".format(**ingest_report))
+df = spark.read.format('delta').load(bronze_tbl_path)
+
 
 # COMMAND ----------
 
@@ -21,15 +21,33 @@
 
 # COMMAND ----------
 
-# MAGIC %run ./00_reset
+# MAGIC %run ./00_reset $reset_mode="full"
 
 # COMMAND ----------
 
-# copy the data from driver to DBFS
-user = dbutils.notebook.entry_point.getDbutils().notebook().getContext().tags().apply('user')
-driver_to_dbfs_path = 'dbfs:/home/{}/ibm-telco-churn/Telco-Customer-Churn.csv'.format(user)
-#dbutils.fs.cp('file:/databricks/driver/Telco-Customer-Churn.csv', driver_to_dbfs_path)
-dbutils.fs.cp('file:/Workspace/Repos/duy.nguyen@disney.com/duyhard-ml4fun/databricks-ml-demo/Telco-Customer-Churn.csv', driver_to_dbfs_path)
+# MAGIC %run ./pipeline_stages
+
+# COMMAND ----------
+
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./expectations
+
+# COMMAND ----------
+
+# MAGIC %run ./spark_sizing
+
+# COMMAND ----------
+
+tracer.start('00b_lakehouse_etl')
+
+# COMMAND ----------
+
+# copy the data from the repo to DBFS, unless DBFS already has the same file
+with span('stage_csv', path=config.dbfs_csv_path):
+  driver_to_dbfs_path = config.staged_csv_path
 
 
 # COMMAND ----------
@@ -39,36 +57,16 @@ dbutils.fs.cp('file:/Workspace/Repos/duy.nguyen@disney.com/duyhard-ml4fun/databr
 
 # COMMAND ----------
 
-# Define schema
-schema = StructType([
-  StructField('customerID', StringType()),
-  StructField('gender', StringType()),
-  StructField('seniorCitizen', DoubleType()),
-  StructField('partner', StringType()),
-  StructField('dependents', StringType()),
-  StructField('tenure', DoubleType()),
-  StructField('phoneService', StringType()),
-  StructField('multipleLines', StringType()),
-  StructField('internetService', StringType()), 
-  StructField('onlineSecurity', StringType()),
-  StructField('onlineBackup', StringType()),
-  StructField('deviceProtection', StringType()),
-  StructField('techSupport', StringType()),
-  StructField('streamingTV', StringType()),
-  StructField('streamingMovies', StringType()),
-  StructField('contract', StringType()),
-  StructField('paperlessBilling', StringType()),
-  StructField('paymentMethod', StringType()),
-  StructField('monthlyCharges', DoubleType()),
-  StructField('totalCharges', DoubleType()),
-  StructField('churnString', StringType())
-  ])
-
-# Read CSV, write to Delta and take a look
-bronze_df = spark.read.format('csv').schema(schema).option('header','true')\
-               .load(driver_to_dbfs_path)
-
-bronze_df.write.format('delta').mode('overwrite').save(bronze_tbl_path)
+# Read CSV against the schema contract, write to Delta and take a look
+# Rows that fail the contract land in the quarantine table instead of being dropped
+# Shuffle partitions, Arrow batches and output file sizes follow the CSV's size (see spark_sizing)
+with span('size_spark', stage='ingest_bronze') as s:
+  s.set(**apply_sizing(spark, 'ingest_bronze', driver_to_dbfs_path))
+with span('ingest_bronze', path=bronze_tbl_path) as s:
+  bronze_df, ingest_report = ingest_bronze(spark, driver_to_dbfs_path, bronze_tbl_path, quarantine_tbl_path)
+  s.set(schema_version=ingest_report['schema_version'], rows=ingest_report['accepted'], rejected=ingest_report['rejected'])
+
+print("Schema v{schema_version}: {accepted} rows accepted, {rejected} quarantined {rejects_by_reason}".format(**ingest_report))
 
 display(bronze_df)
 
@@ -80,8 +78,44 @@ display(bronze_df)
 # COMMAND ----------
 
 # Create bronze table
-_ = spark.sql('''
-  CREATE TABLE `{}`.{}
-  USING DELTA 
-  LOCATION '{}'
-  '''.format(database_name,bronze_tbl_name,bronze_tbl_path))
+with span('create_bronze_table', table=bronze_tbl_name):
+  _ = spark.sql('''
+    CREATE TABLE `{}`.{}
+    USING DELTA 
+    LOCATION '{}'
+    '''.format(database_name,bronze_tbl_name,bronze_tbl_path))
+
+# Quarantined rows from this and earlier runs
+if ingest_report['rejected']:
+  _ = spark.sql('''
+    CREATE TABLE IF NOT EXISTS `{}`.{}
+    USING DELTA 
+    LOCATION '{}'
+    '''.format(database_name,quarantine_tbl_name,quarantine_tbl_path))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Data-quality expectations
+# MAGIC
+# MAGIC All `bronze_expectations` in one pass over the new bronze version; results go to `data_quality_results`. A failed rule stops the job here, before features are computed from it.
+
+# COMMAND ----------
+
+with span('check_expectations', table=f'{database_name}.{bronze_tbl_name}') as s:
+  quality_report, quality_results = check_table(spark, f'{database_name}.{bronze_tbl_name}',
+                                                f'{database_name}.data_quality_results', bronze_expectations)
+  s.set(**quality_report)
+display(spark.createDataFrame(quality_results, results_schema))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
+
@@ -0,0 +1,85 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ### Bulk ingest from the landing zone
+# MAGIC
+# MAGIC At scale the churn extracts arrive as many small CSV files rather than one. This notebook loads everything in the landing folder into `bronze_customers` in one job, sized to ~`target_file_mb` per output file, then compacts, Z-orders on `customerID` and vacuums the table when it has accumulated small files.
+# MAGIC
+# MAGIC Use `00b` for the single-file demo load; schedule this one for the landing zone.
+
+# COMMAND ----------
+
+# MAGIC %run ./commons
+
+# COMMAND ----------
+
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./bulk_ingest
+
+# COMMAND ----------
+
+tracer.start('00c_bulk_ingest')
+
+dbutils.widgets.text('landing_path', 'dbfs:/home/{}/ibm-telco-churn/landing/'.format(user))
+dbutils.widgets.text('target_file_mb', '128')
+dbutils.widgets.dropdown('force_compaction', 'false', ['true', 'false'])
+landing_path = dbutils.widgets.get('landing_path')
+target_file_mb = int(dbutils.widgets.get('target_file_mb'))
+force_compaction = dbutils.widgets.get('force_compaction') == 'true'
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Load
+
+# COMMAND ----------
+
+with span('bulk_ingest', landing_path=landing_path) as s:
+  ingest_report = bulk_ingest_telco(spark, landing_path, bronze_tbl_path, quarantine_tbl_path, target_file_mb=target_file_mb)
+  s.set(input_files=ingest_report['input_files'], output_files=ingest_report['output_files'],
+        rows=ingest_report['accepted'], rejected=ingest_report['rejected'])
+
+print("{input_files} files ({input_bytes:,} bytes) -> {output_files} bronze files: "
+      "{accepted} rows accepted, {rejected} quarantined {rejects_by_reason}".format(**ingest_report))
+
+# COMMAND ----------
+
+_ = spark.sql('''
+  CREATE TABLE IF NOT EXISTS `{}`.{}
+  USING DELTA
+  LOCATION '{}'
+  '''.format(database_name,bronze_tbl_name,bronze_tbl_path))
+
+if ingest_report['rejected']:
+  _ = spark.sql('''
+    CREATE TABLE IF NOT EXISTS `{}`.{}
+    USING DELTA
+    LOCATION '{}'
+    '''.format(database_name,quarantine_tbl_name,quarantine_tbl_path))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Compact, cluster and vacuum
+
+# COMMAND ----------
+
+with span('maintain_bronze', table=bronze_tbl_name) as s:
+  maintenance_report = maintain_table(spark, bronze_tbl_path, target_file_mb=target_file_mb, force=force_compaction)
+  s.set(compacted=maintenance_report['compacted'],
+        files_before=maintenance_report['before']['num_files'], files_after=maintenance_report['after']['num_files'])
+
+display(spark.createDataFrame([dict(stage=k, **maintenance_report[k]) for k in ('before', 'after')]))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
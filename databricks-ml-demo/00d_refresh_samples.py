@@ -0,0 +1,67 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ### Refresh the stratified samples
+# MAGIC
+# MAGIC Builds `bronze_customers_sample` and `churn_features_sample` next to the full tables, stratified on the label and the demographic columns (see `sampling`). Run it after `00b`/`01` (or schedule it after them); it does nothing for a table whose Delta version has not changed since the last refresh.
+# MAGIC
+# MAGIC `01` and `05` read the samples when their `data_mode` widget is set to `sample`.
+
+# COMMAND ----------
+
+# MAGIC %run ./commons
+
+# COMMAND ----------
+
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./pipeline_stages
+
+# COMMAND ----------
+
+# MAGIC %run ./sampling
+
+# COMMAND ----------
+
+tracer.start('00d_refresh_samples')
+
+dbutils.widgets.text('sample_fraction', '0.05')
+dbutils.widgets.text('min_per_stratum', '500')
+dbutils.widgets.dropdown('force_rebuild', 'false', ['true', 'false'])
+sample_fraction = float(dbutils.widgets.get('sample_fraction'))
+min_per_stratum = int(dbutils.widgets.get('min_per_stratum'))
+force_rebuild = dbutils.widgets.get('force_rebuild') == 'true'
+
+# Bronze has the raw label and gender; the features have them one-hot encoded
+sample_strata = {
+  f'{database_name}.bronze_customers': ['churnString', 'seniorCitizen', 'gender'],
+  f'{database_name}.churn_features': ['churn'] + demographic_vars.split(','),
+}
+
+# COMMAND ----------
+
+sample_reports = []
+for table, strata_cols in sample_strata.items():
+  with span('refresh_sample', table=table) as s:
+    report = refresh_sample(spark, table, strata_cols, fraction=sample_fraction, min_per_stratum=min_per_stratum,
+                            force=force_rebuild)
+    s.set(action=report['action'], source_version=report['source_version'],
+          rows=sum(stratum['sampled'] for stratum in report['strata']))
+  sample_reports.append(report)
+  print(f"{report['sample_table']}: {report['action']} from version {report['source_version']}")
+
+display(spark.createDataFrame([dict(table=r['sample_table'], population=st['population'], sampled=st['sampled'],
+                                    fraction=st['fraction'], stratum=json.dumps(st['values']))
+                               for r in sample_reports for st in r['strata']]))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
@@ -8,6 +8,43 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./sampling
+
+# COMMAND ----------
+
+# MAGIC %run ./drift_sketches
+
+# COMMAND ----------
+
+# MAGIC %run ./point_in_time
+
+# COMMAND ----------
+
+# MAGIC %run ./expectations
+
+# COMMAND ----------
+
+# MAGIC %run ./spark_sizing
+
+# COMMAND ----------
+
+tracer.start('01_feature_engineering')
+
+# `sample` runs on bronze_customers_sample (see 00d_refresh_samples) and leaves the feature table untouched
+dbutils.widgets.dropdown('data_mode', 'full', data_modes)
+data_mode = dbutils.widgets.get('data_mode')
+
+# `false` records failed expectations (see expectations) without stopping the run
+dbutils.widgets.dropdown('quality_gate', 'true', ['true', 'false'])
+quality_gate = dbutils.widgets.get('quality_gate') == 'true'
+quality_table = f'{database_name}.data_quality_results'
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ### Featurization Logic
 # MAGIC 
@@ -16,47 +53,24 @@
 # COMMAND ----------
 
 # Read into Spark
-telcoDF = spark.table(f"{database_name}.bronze_customers")
+telco_source = resolve_table(f"{database_name}.bronze_customers", data_mode)
+telcoDF = spark.table(telco_source)
 #display(telcoDF)
 
+# Reuses the results 00b recorded for this bronze version; only an unchecked version is scanned
+with span('check_expectations', table=telco_source) as s:
+  s.set(**check_table(spark, telco_source, quality_table, bronze_expectations, gate=quality_gate)[0])
+
 # COMMAND ----------
 
 # MAGIC %md
 # MAGIC ##### Pandas API on Spark
+# MAGIC 
+# MAGIC `compute_churn_features` lives in `pipeline_stages` so the local benchmark harness runs the same featurization.
 
 # COMMAND ----------
 
-from databricks.feature_store import feature_table
-import pyspark.pandas as ps
-
-def compute_churn_features(data):
-  
-  # Convert to pandas
-  data = data.to_pandas_on_spark()
-  
-  # OHE
-  data = ps.get_dummies(data, 
-                        columns=['gender', 'partner', 'dependents',
-                                 'phoneService', 'multipleLines', 'internetService',
-                                 'onlineSecurity', 'onlineBackup', 'deviceProtection',
-                                 'techSupport', 'streamingTV', 'streamingMovies',
-                                 'contract', 'paperlessBilling', 'paymentMethod'],dtype = 'int64')
-  
-  # Convert label to int and rename column
-  data['churnString'] = data['churnString'].map({'Yes': 1, 'No': 0})
-  data = data.astype({'churnString': 'int32'})
-  data = data.rename(columns = {'churnString': 'churn'})
-  
-  # Clean up column names
-  data.columns = data.columns.str.replace(' ', '', regex=True)
-  data.columns = data.columns.str.replace('(', '-', regex=True)
-  data.columns = data.columns.str.replace(')', '', regex=True)
-  
-  # Drop missing values
-  data = data.dropna()
-  data = data.to_spark()
-  
-  return data
+# MAGIC %run ./pipeline_stages
 
 # COMMAND ----------
 
@@ -80,20 +94,71 @@ from databricks.feature_store import FeatureStoreClient
 fs = FeatureStoreClient()
 #fs._catalog_client.delete_feature_table(f"{database_name}.churn_features")
 
-churn_features_df = compute_churn_features(telcoDF)
+# get_dummies and the feature table write are sized from the bronze version being read (see spark_sizing)
+with span('size_spark', stage='compute_churn_features') as s:
+  s.set(**apply_sizing(spark, 'compute_churn_features', telco_source))
+with span('compute_churn_features', source=telco_source):
+  churn_features_df = compute_churn_features(telcoDF)
+
+if data_mode == 'sample':
+  display(churn_features_df.limit(100))
+  print(f"Sample run: {churn_features_df.count()} feature rows computed, feature table not written")
+else:
+  # Checked before the write, so a failing batch never replaces the table 05, 06 and 07 read
+  churn_features_df = churn_features_df.cache()
+  with span('check_expectations', table=f'{database_name}.churn_features') as s:
+    quality_report, quality_evaluated = check_dataframe(spark, churn_features_df, f'{database_name}.churn_features',
+                                                        quality_table, gate=quality_gate)
+    s.set(**quality_report)
+
+  with span('create_feature_table'):
+    churn_feature_table = fs.create_table(
+      name=f'{database_name}.churn_features',
+      primary_keys=['customerID'],
+      df=churn_features_df,
+      description='These features are derived from the ibm_telco_churn.bronze_customers table in the lakehouse.  I created dummy variables for the categorical columns, cleaned up their names, and added a boolean flag for whether the customer churned or not.  No aggregations were performed.'
+    )
+
+  with span('write_feature_table', table=f'{database_name}.churn_features') as s:
+    fs.write_table(
+      name=f'{database_name}.churn_features',
+      df=churn_features_df,
+      mode='overwrite'
+    )
+    s.set_from(lambda: delta_write_metrics(spark, f'{database_name}.churn_features'))
+
+  # The results go against the version the write created, where the next run's row count check finds them
+  features_version = table_version(spark, f'{database_name}.churn_features')
+  with span('record_expectations', table=f'{database_name}.churn_features', table_version=features_version):
+    quality_results = record_results(spark, f'{database_name}.churn_features', features_version, quality_table,
+                                     *quality_evaluated)
+  display(pd.DataFrame(quality_results))
+
+  # Sketch the new version for drift monitoring; the first one written becomes the baseline until 07 retrains
+  with span('record_drift_sketches', table=f'{database_name}.churn_features', source_version=features_version) as s:
+    new_features = spark.table(f'{database_name}.churn_features')
+    for batch_id in (baseline_batch, f'v{features_version}'):
+      sketch_report = record_sketches(spark, f'{database_name}.churn_drift_sketches', f'{database_name}.churn_features',
+                                      batch_id, new_features, source_version=features_version)
+    s.set(action=sketch_report['action'])
+
+  # Keep every version of each customer's features, so training sets can be rebuilt as of any label time
+  with span('record_feature_history', table=f'{database_name}.churn_features_history') as s:
+    history_reports = backfill_feature_history(spark, f'{database_name}.churn_features',
+                                               f'{database_name}.churn_features_history')
+    s.set(versions=len(history_reports), opened=sum(r['opened'] for r in history_reports),
+          closed=sum(r['closed'] for r in history_reports))
+
+# COMMAND ----------
 
-churn_feature_table = fs.create_table(
-  name=f'{database_name}.churn_features',
-  primary_keys=['customerID'],
-  df=churn_features_df,
-  description='These features are derived from the ibm_telco_churn.bronze_customers table in the lakehouse.  I created dummy variables for the categorical columns, cleaned up their names, and added a boolean flag for whether the customer churned or not.  No aggregations were performed.'
-)
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
 
-fs.write_table(
-  name=f'{database_name}.churn_features',
-  df=churn_features_df,
-  mode='overwrite'
-)
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
 
 # COMMAND ----------
 
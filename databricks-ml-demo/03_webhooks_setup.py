@@ -36,6 +36,14 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+tracer.start('03_webhooks_setup')
+
+# COMMAND ----------
+
 slack_webhook = dbutils.secrets.get("kyber_secrets","slack_token")
 
 # COMMAND ----------
@@ -52,12 +60,14 @@ host = host_creds.host
 token = host_creds.token
 
 def mlflow_call_endpoint(endpoint, method, body='{}'):
-  if method == 'GET':
-      response = http_request(
-          host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, params=json.loads(body))
-  else:
-      response = http_request(
-          host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, json=json.loads(body))
+  with span('mlflow_call_endpoint', endpoint=endpoint, method=method) as s:
+    if method == 'GET':
+        response = http_request(
+            host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, params=json.loads(body))
+    else:
+        response = http_request(
+            host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, json=json.loads(body))
+    s.set(http_status=response.status_code)
   return response.json()
 
 # COMMAND ----------
@@ -269,6 +279,17 @@ mlflow_call_endpoint("registry-webhooks/delete",
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Additional Topics & Resources
 # MAGIC 
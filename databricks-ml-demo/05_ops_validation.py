@@ -8,7 +8,50 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./sampling
+
+# COMMAND ----------
+
+# MAGIC %run ./slice_eval
+
+# COMMAND ----------
+
+# MAGIC %run ./notifications
+
+# COMMAND ----------
+
+# MAGIC %run ./request_capture
+
+# COMMAND ----------
+
+# MAGIC %run ./spark_sizing
+
+# COMMAND ----------
+
+tracer.start('05_ops_validation')
+
+# `sample` scores the stratified sample of the feature table (see 00d_refresh_samples) and reports error bounds
+dbutils.widgets.dropdown('data_mode', 'full', data_modes)
+data_mode = dbutils.widgets.get('data_mode')
+
+# Slices are evaluated over the model's demographic columns plus these, up to `max_slice_order` columns at a time
+dbutils.widgets.text('slice_cols', ','.join(default_slice_cols))
+dbutils.widgets.text('min_slice_support', '30')
+dbutils.widgets.text('max_slice_order', '2')
+
+# Traffic captured by 08's score_model (e.g. /tmp/churn_capture/<endpoint>) to replay through this version; empty skips
+dbutils.widgets.text('capture_path', '')
+dbutils.widgets.text('replay_days', '7')
+
+# COMMAND ----------
+
 slack_webhook = dbutils.secrets.get("kyber_secrets","slack_token")
+# Posts in the background: a slow or failing webhook never blocks the checks or the transition
+notifier = Notifier(http_sink(slack_webhook))
 
 # COMMAND ----------
 
@@ -32,8 +75,9 @@ except Exception:
 print(model_name, version)
 
 # Use webhook payload to load model details and run info
-model_details = client.get_model_version(model_name, version)
-run_info = client.get_run(run_id=model_details.run_id)
+with span('get_model_details', model_name=model_name, model_version=version):
+  model_details = client.get_model_version(model_name, version)
+  run_info = client.get_run(run_id=model_details.run_id)
 
 # COMMAND ----------
 
@@ -45,20 +89,38 @@ run_info = client.get_run(run_id=model_details.run_id)
 
 # Read from feature store prod table?
 data_source = run_info.data.tags['db_table']
-features = fs.read_table(data_source)
+if data_mode == 'sample':
+  data_source = resolve_table(data_source, data_mode)
+  with span('read_features', table=data_source):
+    features = spark.table(data_source)
+  sample_strata = sample_properties(spark, data_source)['strata']
+else:
+  with span('read_features', table=data_source):
+    features = fs.read_table(data_source)
+  sample_strata = None
+client.set_model_version_tag(name=model_name, version=version, key="validation_data", value=data_mode)
+
+# Scoring and the slice aggregation below are sized from the feature table (see spark_sizing)
+with span('size_spark', stage='validation') as s:
+  s.set(**apply_sizing(spark, 'validation', data_source))
 
 # Load model as a Spark UDF
 model_uri = f'models:/{model_name}/{version}'
-loaded_model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri)
-
-# Predict on a Spark DataFrame
-try:
-  display(features.withColumn('predictions', loaded_model(*features.columns)))
-  client.set_model_version_tag(name=model_name, version=version, key="predicts", value=1)
-except Exception: 
-  print("Unable to predict on features.")
-  client.set_model_version_tag(name=model_name, version=version, key="predicts", value=0)
-  pass
+with span('load_model', model_uri=model_uri, model_version=version):
+  loaded_model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri)
+
+# Predict on a Spark DataFrame, once: the demographic check below reuses the cached predictions
+scored = score_once(features, loaded_model)
+with span('validate_prediction', model_version=version) as s:
+  try:
+    display(scored)
+    client.set_model_version_tag(name=model_name, version=version, key="predicts", value=1)
+    s.set(predicts=1)
+  except Exception: 
+    print("Unable to predict on features.")
+    client.set_model_version_tag(name=model_name, version=version, key="predicts", value=0)
+    s.set(predicts=0)
+    pass
 
 # COMMAND ----------
 
@@ -87,26 +149,38 @@ else:
 
 # COMMAND ----------
 
-import numpy as np
-features = features.withColumn('predictions', loaded_model(*features.columns)).toPandas()
-features['accurate'] = np.where(features.churn == features.predictions, 1, 0)
-
-# Check run tags for demographic columns and accuracy in each segment
+# Check run tags for demographic columns
 try:
   demographics = run_info.data.tags['demographic_vars'].split(",")
-  slices = features.groupby(demographics).accurate.agg(acc = 'sum', obs = lambda x:len(x), pct_acc = lambda x:sum(x)/len(x))
-  
-  # Threshold for passing on demographics is 55%
-  demo_test = "pass" if slices['pct_acc'].any() > 0.55 else "fail"
-  
-  # Set tags in registry
-  client.set_model_version_tag(name=model_name, version=version, key="demo_test", value=demo_test)
-
-  print(slices)
 except KeyError:
   print("KeyError: No demographics_vars tagged with this model version.")
+  demographics = []
+
+# Accuracy, precision and recall for every slice in one aggregation; only the slice table is collected
+extra_slice_cols = [c for c in dbutils.widgets.get('slice_cols').split(',') if c and c not in demographics]
+with span('slice_metrics', model_version=version) as s:
+  slices = slice_metrics(spark, scored, demographics + extra_slice_cols,
+                         min_support=int(dbutils.widgets.get('min_slice_support')),
+                         max_order=int(dbutils.widgets.get('max_slice_order')),
+                         include=[demographics])
+  s.set(slices=len(slices), worst_accuracy=float(slices[slices.worst].accuracy.min()) if slices.worst.any() else None)
+display(slices)
+
+# COMMAND ----------
+
+if demographics:
+  # On the sample, pct_acc is reweighted to the full table and comes with 95% bounds (pct_acc_low/high)
+  # Counts per stratum on the sample, per demographic slice on the full table
+  count_cols = list(sample_strata[0]['values']) if sample_strata else demographics
+  demo_slices = stratified_accuracy(stratum_counts(scored, count_cols), demographics, sample_strata)
+
+  # Threshold for passing on demographics is 55%, in every slice
+  demo_test = "pass" if (demo_slices['pct_acc'] > 0.55).all() else "fail"
+  client.set_model_version_tag(name=model_name, version=version, key="demo_test", value=demo_test)
+  print(demo_slices)
+else:
   client.set_model_version_tag(name=model_name, version=version, key="demo_test", value="none")
-  pass
+scored.unpersist()
 
 # COMMAND ----------
 
@@ -149,7 +223,8 @@ if not os.path.exists(local_dir):
     os.mkdir(local_dir)
 
 # Download artifacts from tracking server - no need to specify DBFS path here
-local_path = client.download_artifacts(run_info.info.run_id, "", local_dir)
+with span('download_artifacts', run_id=run_info.info.run_id):
+  local_path = client.download_artifacts(run_info.info.run_id, "", local_dir)
 
 # Tag model version as possessing artifacts or not
 if not os.listdir(local_path):
@@ -162,6 +237,30 @@ else:
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC #### Replay captured traffic
+# MAGIC
+# MAGIC Runs recent real requests (see `request_capture`) through this version and compares with what was served. The agreement rate is tagged on the version as `replay_agreement`.
+
+# COMMAND ----------
+
+import time
+
+capture_path = dbutils.widgets.get('capture_path')
+if capture_path:
+  captured = load_capture('/dbfs' + capture_path, since=time.time() - float(dbutils.widgets.get('replay_days')) * 86400)
+  with span('replay_capture', rows=len(captured), model_version=version) as s:
+    candidate = mlflow.pyfunc.load_model(f'models:/{model_name}/{version}')
+    replay_report, replay_changed = replay(captured, candidate)
+    s.set(agreement=replay_report['agreement'], changed_rows=replay_report['changed_rows'],
+          requests=replay_report['requests'])
+  client.set_model_version_tag(name=model_name, version=version, key="replay_agreement",
+                               value=replay_report['agreement'] if replay_report['rows'] else "none")
+  print(json.dumps(replay_report, indent=2))
+  display(replay_changed)
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Results
 # MAGIC 
@@ -175,26 +274,13 @@ results.tags
 # COMMAND ----------
 
 # MAGIC %md
-# MAGIC Notify the Slack channel with the same webhook used to alert on transition change in MLflow.
+# MAGIC Notify the Slack channel with the same webhook used to alert on transition change in MLflow. The check results are queued and sent as one message per model version, with the transition decision if it follows shortly after.
 
 # COMMAND ----------
 
-
-import requests, json
-
-slack_message = "Registered model '{}' version {} baseline test results: {}".format(model_name, version, results.tags)
-webhook_url = slack_webhook
-
-body = {'text': slack_message}
-response = requests.post(
-    webhook_url, data=json.dumps(body),
-    headers={'Content-Type': 'application/json'}
-)
-if response.status_code != 200:
-    raise ValueError(
-        'Request to slack returned an error %s, the response is:\n%s'
-        % (response.status_code, response.text)
-)
+with span('slack_notify', model_version=version):
+  for check, value in sorted(results.tags.items()):
+    notifier.notify((model_name, version), f'{check}: {value}')
 
 # COMMAND ----------
 
@@ -218,12 +304,14 @@ host = host_creds.host
 token = host_creds.token
 
 def mlflow_call_endpoint(endpoint, method, body='{}'):
-  if method == 'GET':
-      response = http_request(
-          host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, params=json.loads(body))
-  else:
-      response = http_request(
-          host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, json=json.loads(body))
+  with span('mlflow_call_endpoint', endpoint=endpoint, method=method) as s:
+    if method == 'GET':
+        response = http_request(
+            host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, params=json.loads(body))
+    else:
+        response = http_request(
+            host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, json=json.loads(body))
+    s.set(http_status=response.status_code)
   return response.json()
 
 
@@ -248,6 +336,7 @@ try:
                             'comment': 'Tests failed - check the tags or the job run to see what happened.'}
     
       mlflow_call_endpoint('transition-requests/reject', 'POST', json.dumps(reject_request_body))
+      notifier.notify((model_name, version), 'transition to Staging rejected')
     
     else: 
       approve_request_body = {'name': model_details.name,
@@ -257,6 +346,7 @@ try:
                             'comment': 'All tests passed!  Moving to staging.'}
     
       mlflow_call_endpoint('transition-requests/approve', 'POST', json.dumps(approve_request_body))
+      notifier.notify((model_name, version), 'transition to Staging approved')
 
   if 'to_stage' in registry_event and registry_event['to_stage'] == 'Production':
     if '0' in results or 'fail' in results: 
@@ -266,6 +356,7 @@ try:
                             'comment': 'Tests failed - check the tags or the job run to see what happened.'}
     
       mlflow_call_endpoint('transition-requests/reject', 'POST', json.dumps(reject_request_body))
+      notifier.notify((model_name, version), 'transition to Production rejected')
     
     else: 
       approve_request_body = {'name': model_details.name,
@@ -275,9 +366,30 @@ try:
                             'comment': 'All tests passed!  Moving to production.'}
     
       mlflow_call_endpoint('transition-requests/approve', 'POST', json.dumps(approve_request_body))
-except Exception:
+      notifier.notify((model_name, version), 'transition to Production approved')
+except Exception as e:
+  # No webhook payload, or the transition call failed: the job stops here as before, with the spans so far exported
+  with span('transition_request') as s:
+    s.set(error=f'{type(e).__name__}: {e}')
+  notifier.close(timeout=15)
+  tracer.export_jsonl('/dbfs' + traces_path)
   dbutils.notebook.exit()
 
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+# Give queued notifications a few seconds to go out; undelivered ones are counted, not raised
+with span('notifications_flush') as s:
+  s.set(flushed=notifier.close(timeout=15), **notifier.stats())
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
+
 
 # COMMAND ----------
 
@@ -8,6 +8,33 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./drift_sketches
+
+# COMMAND ----------
+
+# MAGIC %run ./registry_index
+
+# COMMAND ----------
+
+# MAGIC %run ./reason_codes
+
+# COMMAND ----------
+
+# MAGIC %run ./spark_sizing
+
+# COMMAND ----------
+
+tracer.start('06_staging_batch_inference')
+
+# Top features behind each customer's score (see reason_codes), written next to the predictions; 0 turns it off
+dbutils.widgets.text('reason_codes', '0')
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC #### Load Model
 # MAGIC 
@@ -17,7 +44,14 @@
 
 import mlflow
 
-model = mlflow.pyfunc.spark_udf(spark, model_uri=f"models:/{database_name}_churn/staging") # may need to replace with your own model name
+# Resolve the Staging version from the local registry index rather than the registry server
+# The index is kept on DBFS between runs, so a job cluster does not start from an empty one
+with span('resolve_model', model_name=f"{database_name}_churn", stage='staging') as s:
+  model_uri = RegistryIndex(durable_path='/dbfs' + registry_index_path).model_uri(f"{database_name}_churn", 'staging') # may need to replace with your own model name
+  s.set(model_uri=model_uri)
+
+with span('load_model', model_uri=model_uri):
+  model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri)
 
 # COMMAND ----------
 
@@ -29,7 +63,12 @@ model = mlflow.pyfunc.spark_udf(spark, model_uri=f"models:/{database_name}_churn
 from databricks.feature_store import FeatureStoreClient
 
 fs = FeatureStoreClient()
-features = fs.read_table(f'{database_name}.churn_features')
+with span('read_features', table=f'{database_name}.churn_features'):
+  features = fs.read_table(f'{database_name}.churn_features')
+
+# Scoring and the predictions write are sized from the feature table (see spark_sizing)
+with span('size_spark', stage='batch_inference') as s:
+  s.set(**apply_sizing(spark, 'batch_inference', f'{database_name}.churn_features'))
 
 # COMMAND ----------
 
@@ -39,7 +78,20 @@ features = fs.read_table(f'{database_name}.churn_features')
 # COMMAND ----------
 
 predictions = features.withColumn('predictions', model(*features.columns))
-display(predictions.select("customerId", "predictions"))
+top_k = int(dbutils.widgets.get('reason_codes'))
+if top_k:
+  with span('reason_codes', top_k=top_k) as s:
+    try:
+      predictions = with_reason_codes(spark, predictions, model_uri, top_k)
+    except ValueError as e:
+      # The compiled transform does not cover this model's preprocessing; predictions are written without reasons
+      print(f"No reason codes: {e}")
+      s.set(skipped=str(e))
+
+# Cached so the display, the write and the drift sketches below score the batch only once
+predictions = predictions.cache()
+with span('display_predictions'):
+  display(predictions.select("customerId", "predictions", *[c for c in predictions.columns if c.startswith('reason_')]))
 
 # COMMAND ----------
 
@@ -48,7 +100,45 @@ display(predictions.select("customerId", "predictions"))
 
 # COMMAND ----------
 
-predictions.write.format("delta").mode("append").saveAsTable(f"{database_name}.churn_preds")
+with span('write_predictions', table=f"{database_name}.churn_preds") as s:
+  predictions.write.format("delta").mode("append").option("mergeSchema", "true").saveAsTable(f"{database_name}.churn_preds")
+  s.set_from(lambda: delta_write_metrics(spark, f"{database_name}.churn_preds"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Drift
+# MAGIC
+# MAGIC Sketch this batch of predictions (see `drift_sketches`) and compare the latest feature and prediction batches with their baselines. Nothing is reread except the sketch table.
+
+# COMMAND ----------
+
+sketches_table = f'{database_name}.churn_drift_sketches'
+preds_version = table_version(spark, f"{database_name}.churn_preds")
+with span('record_drift_sketches', table=f"{database_name}.churn_preds", source_version=preds_version) as s:
+  # The first batch scored becomes the prediction baseline
+  for batch_id in (baseline_batch, f'v{preds_version}'):
+    sketch_report = record_sketches(spark, sketches_table, f"{database_name}.churn_preds", batch_id,
+                                    predictions.select('churn', 'predictions'), source_version=preds_version)
+  s.set(action=sketch_report['action'])
+predictions.unpersist()
+
+with span('drift_report'):
+  drift = (drift_report(spark, sketches_table, f'{database_name}.churn_features')
+           + drift_report(spark, sketches_table, f"{database_name}.churn_preds"))
+if drift:
+  display(spark.createDataFrame(drift))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
 
 # COMMAND ----------
 
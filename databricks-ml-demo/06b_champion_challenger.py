@@ -0,0 +1,93 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Champion/Challenger Batch Inference
+# MAGIC
+# MAGIC Scores the `churn_features` table with several versions of the churn model at once (by default the Production champion and the Staging challenger), reading the features once. Predictions are written side by side to `churn_preds_compare`, followed by agreement, accuracy and lift per model.
+
+# COMMAND ----------
+
+# MAGIC %run ./commons
+
+# COMMAND ----------
+
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./multi_model_scoring
+
+# COMMAND ----------
+
+tracer.start('06b_champion_challenger')
+
+# Stages or version numbers; the first one is the champion
+dbutils.widgets.text('models', 'Production,Staging')
+model_refs = dbutils.widgets.get('models').split(',')
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Resolve model versions
+
+# COMMAND ----------
+
+from mlflow.tracking import MlflowClient
+
+client = MlflowClient()
+model_name = f"{database_name}_churn"
+with span('resolve_models', model_name=model_name) as s:
+  model_uris = resolve_model_versions(client, model_name, model_refs)
+  s.set(models=','.join(f'{alias}={uri}' for alias, uri in model_uris.items()))
+aliases = list(model_uris)
+print(model_uris)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Load Features
+
+# COMMAND ----------
+
+from databricks.feature_store import FeatureStoreClient
+
+fs = FeatureStoreClient()
+with span('read_features', table=f'{database_name}.churn_features'):
+  features = fs.read_table(f'{database_name}.churn_features')
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Score and write
+
+# COMMAND ----------
+
+# Cached so the comparison below reuses this batch's predictions instead of scoring again
+with span('score_models', models=len(aliases)):
+  scored = score_models(spark, features, model_uris).withColumn('scored_at', F.current_timestamp()).cache()
+
+with span('write_predictions', table=f"{database_name}.churn_preds_compare") as s:
+  scored.write.format("delta").mode("append").option("mergeSchema", "true").saveAsTable(f"{database_name}.churn_preds_compare")
+  s.set_from(lambda: delta_write_metrics(spark, f"{database_name}.churn_preds_compare"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Compare
+
+# COMMAND ----------
+
+with span('comparison_stats', models=len(aliases)):
+  stats = comparison_stats(scored, aliases)
+scored.unpersist()
+display(pd.DataFrame(stats))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
@@ -1,6 +1,14 @@
 # Databricks notebook source
 # MAGIC %md
 # MAGIC ## AutoML Retrain
+# MAGIC
+# MAGIC `retrain_mode`:
+# MAGIC - `full`: a new AutoML run on the feature table
+# MAGIC - `incremental`: continue boosting the Production model on the rows that changed since it was trained (see `warm_start`). It is registered only if it beats Production on the holdout.
+# MAGIC - `auto` (default): incremental, unless the last full retrain is more than `full_retrain_days` old or there is nothing to warm-start from
+# MAGIC - `compare`: both, with their wall-clock time and holdout metrics side by side; the better one is registered
+# MAGIC
+# MAGIC With `labels_table` set (`customerID`, `label_ts`, `churn`), the training set is built point in time from `churn_features_history` instead of the latest `churn_features` (see `point_in_time`). That is always a full retrain.
 
 # COMMAND ----------
 
@@ -8,6 +16,33 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./drift_sketches
+
+# COMMAND ----------
+
+# MAGIC %run ./warm_start
+
+# COMMAND ----------
+
+# MAGIC %run ./point_in_time
+
+# COMMAND ----------
+
+tracer.start('07_retrain_churn_automl')
+
+dbutils.widgets.dropdown('retrain_mode', 'auto', retrain_modes)
+dbutils.widgets.text('full_retrain_days', '7')
+# An incremental model must beat Production's holdout F1 by at least this much
+dbutils.widgets.text('min_improvement', '0.0')
+dbutils.widgets.text('labels_table', '')
+labels_table = dbutils.widgets.get('labels_table')
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC #### Load Features
 
@@ -27,41 +62,160 @@ feature_table = f'{database_name}.churn_features'
 
 fs = FeatureStoreClient()
 
-features = fs.read_table(feature_table)
+features_version = table_version(spark, feature_table)
+with span('read_features', table=feature_table, source_version=features_version):
+  features = fs.read_table(feature_table)
 
-# COMMAND ----------
-
-dbutils.fs.ls('dbfs:/tmp/duy.nguyen@disney.com/')
+if labels_table:
+  # Each label joined to the features as they were at its timestamp
+  with span('point_in_time_training_set', labels_table=labels_table) as s:
+    features = (point_in_time_training_set(spark, spark.table(labels_table), f'{database_name}.churn_features_history')
+                .drop('label_ts', 'features_effective_from')
+                .cache())
+    s.set(rows=features.count())
 
 # COMMAND ----------
 
-import databricks.automl
-model = databricks.automl.classify(features, 
-                                   target_col = "churn",
-                                   data_dir= f"dbfs:/tmp/{user}/",
-                                   timeout_minutes=120,
-                                   experiment_name="kyber_db_ml_churn") 
+dbutils.fs.ls('dbfs:/tmp/duy.nguyen@disney.com/')
 
 # COMMAND ----------
 
 # MAGIC %md
-# MAGIC #### Promote to Registry
+# MAGIC #### Plan the retrain
 
 # COMMAND ----------
 
+import time
 import mlflow
 from mlflow.tracking.client import MlflowClient
 
 client = MlflowClient()
-
-run_id = model.best_trial.mlflow_run_id
 model_name = f"{database_name}_churn"
+experiment_name = "kyber_db_ml_churn"
+
+try:
+  production = client.get_latest_versions(model_name, ['Production'])
+except Exception:
+  production = []
+incumbent_tags = client.get_run(production[0].run_id).data.tags if production else None
+
+plan, plan_reason = plan_retrain(dbutils.widgets.get('retrain_mode'), incumbent_tags,
+                                 float(dbutils.widgets.get('full_retrain_days')))
+if plan != 'full' and not production:
+  plan, plan_reason = 'full', 'no Production model to warm-start from'
+if plan != 'full' and labels_table:
+  # The incremental retrain diffs churn_features versions, which don't line up with label events
+  plan, plan_reason = 'full', 'point-in-time training set'
+print(f'{plan}: {plan_reason}')
+
+# Every candidate, and Production, is scored on the same holdout, which none of them trains on
+train_df, early_stop_df, holdout_df = holdout_split(features)
+holdout_pdf = holdout_df.toPandas()
+comparison = []
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Incremental retrain
+
+# COMMAND ----------
+
+if plan in ('incremental', 'compare'):
+  incumbent_version = production[0].version
+  since_version = incumbent_tags.get('features_version')
+  with span('warm_start_retrain', incumbent_version=incumbent_version, since_version=since_version) as s:
+    started = time.time()
+    incumbent_model = mlflow.sklearn.load_model(f'models:/{model_name}/{incumbent_version}')
+    try:
+      train_pdf = incremental_training_rows(changed_rows(spark, feature_table, since_version), train_df).toPandas()
+      warm_model, warm_info = warm_start_fit(incumbent_model, train_pdf, early_stop_df.toPandas())
+    except ValueError as e:
+      # The Production pipeline can't be warm-started (e.g. not XGBoost)
+      print(f'Incremental retrain not possible: {e}')
+      warm_model = None
+    if warm_model is not None:
+      warm_metrics = holdout_metrics(warm_model, holdout_pdf)
+      warm_run_id = log_warm_start_model(warm_model, train_pdf, dict(warm_metrics, **warm_info),
+                                         tags={'retrain_mode': 'incremental',
+                                               'warm_start_from': f'{model_name}/{incumbent_version}',
+                                               'features_version': str(features_version),
+                                               'full_retrain_at': incumbent_tags.get('full_retrain_at', '')},
+                                         experiment_name=experiment_name)
+      comparison.append(dict(candidate='incremental', run_id=warm_run_id, seconds=round(time.time() - started, 1),
+                             **warm_info, **warm_metrics))
+      s.set(run_id=warm_run_id, **warm_info, **warm_metrics)
+    comparison.append(dict(candidate='production', run_id=production[0].run_id, seconds=0.0,
+                           **holdout_metrics(incumbent_model, holdout_pdf)))
+  if warm_model is None and plan == 'incremental':
+    plan, plan_reason = 'full', 'incremental retrain not possible'
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Full retrain
+
+# COMMAND ----------
+
+if plan in ('full', 'compare'):
+  import databricks.automl
+  started = time.time()
+  with span('automl_classify', timeout_minutes=120) as s:
+    model = databricks.automl.classify(features.where(split_bucket() != holdout_bucket),
+                                       target_col = "churn",
+                                       data_dir= f"dbfs:/tmp/{user}/",
+                                       timeout_minutes=120,
+                                       experiment_name=experiment_name)
+    s.set(best_run_id=model.best_trial.mlflow_run_id)
+  full_run_id = model.best_trial.mlflow_run_id
+  client.set_tag(full_run_id, key='retrain_mode', value='full')
+  client.set_tag(full_run_id, key='features_version', value=str(features_version))
+  client.set_tag(full_run_id, key='full_retrain_at', value=str(started))
+  comparison.append(dict(candidate='full', run_id=full_run_id, seconds=round(time.time() - started, 1),
+                         **holdout_metrics(mlflow.sklearn.load_model(f'runs:/{full_run_id}/model'), holdout_pdf)))
+
+# COMMAND ----------
+
+import pandas as pd
+display(pd.DataFrame(comparison))
+
+# A full retrain is always registered (05 still tests it); an incremental one only if it beats Production
+production_metrics = next((c for c in comparison if c['candidate'] == 'production'), None)
+eligible = [c for c in comparison
+            if c['candidate'] == 'full'
+            or (c['candidate'] == 'incremental'
+                and beats_incumbent(c, production_metrics, float(dbutils.widgets.get('min_improvement'))))]
+if not eligible:
+  tracer.export_jsonl('/dbfs' + traces_path)
+  tracer.log_to_mlflow(warm_run_id)
+  dbutils.notebook.exit('The incremental model did not beat Production on the holdout; nothing registered')
+chosen = max(eligible, key=lambda c: c['holdout_f1'])
+run_id = chosen['run_id']
+client.log_dict(run_id, comparison, 'retrain_comparison.json')
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Promote to Registry
+
+# COMMAND ----------
+
 model_uri = f"runs:/{run_id}/model"
 
 client.set_tag(run_id, key='db_table', value=f'{database_name}.churn_features')
 client.set_tag(run_id, key='demographic_vars', value='seniorCitizen,gender_Female')
 
-model_details = mlflow.register_model(model_uri, model_name)
+with span('register_model', model_name=model_name, run_id=run_id) as s:
+  model_details = mlflow.register_model(model_uri, model_name)
+  s.set(model_version=model_details.version)
+
+# The features this model was trained on are the new drift baseline. The current version is sketched again on its
+# cut points, so the latest batch drift_report picks up by default is comparable with it
+with span('record_drift_baseline', table=feature_table, source_version=features_version):
+  record_sketches(spark, f'{database_name}.churn_drift_sketches', feature_table, baseline_batch, features, replace=True)
+  if features_version is not None:
+    record_sketches(spark, f'{database_name}.churn_drift_sketches', feature_table, f'v{features_version}',
+                    spark.sql(f'SELECT * FROM {feature_table} VERSION AS OF {features_version}'),
+                    source_version=features_version, replace=True)
 
 # COMMAND ----------
 
@@ -80,7 +234,8 @@ client.update_registered_model(
 client.update_model_version(
   name=model_details.name,
   version=model_details.version,
-  description="This model version was built using sklearn's LogisticRegression."
+  description="This model version was built using sklearn's LogisticRegression." if chosen['candidate'] == 'full'
+              else f"This model version continues boosting version {incumbent_version} on the feature rows changed since it was trained."
 )
 
 # COMMAND ----------
@@ -103,12 +258,14 @@ host = host_creds.host
 token = host_creds.token
 
 def mlflow_call_endpoint(endpoint, method, body='{}'):
-  if method == 'GET':
-      response = http_request(
-          host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, params=json.loads(body))
-  else:
-      response = http_request(
-          host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, json=json.loads(body))
+  with span('mlflow_call_endpoint', endpoint=endpoint, method=method) as s:
+    if method == 'GET':
+        response = http_request(
+            host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, params=json.loads(body))
+    else:
+        response = http_request(
+            host_creds=host_creds, endpoint="/api/2.0/mlflow/{}".format(endpoint), method=method, json=json.loads(body))
+    s.set(http_status=response.status_code)
   return response.json()
 
 
@@ -121,10 +278,22 @@ mlflow_call_endpoint('transition-requests/create', 'POST', json.dumps(staging_re
 # COMMAND ----------
 
 # Leave a comment for the ML engineer who will be reviewing the tests
-comment = "This was the best model from AutoML, I think we can use it as a baseline."
+comment = ("This was the best model from AutoML, I think we can use it as a baseline." if chosen['candidate'] == 'full'
+           else f"Warm-started from version {incumbent_version}; holdout F1 {chosen['holdout_f1']:.3f} vs {production_metrics['holdout_f1']:.3f} for Production.")
 comment_body = {'name': model_name, 'version': model_details.version, 'comment': comment}
 mlflow_call_endpoint('comments/create', 'POST', json.dumps(comment_body))
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow(run_id)
+display(tracer.summary())
+
+# COMMAND ----------
+
 
@@ -0,0 +1,106 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Segmented Models
+# MAGIC
+# MAGIC Trains one churn model per segment of `churn_features` (contract type, internet service tier, or both crossed) in a single parallel `applyInPandas` job, all logged under one MLflow parent run (see `segmented_models`). Then scores the feature table, routing each row to its segment's model in one pass, writes the predictions to `churn_preds_segmented`, and compares accuracy per segment.
+
+# COMMAND ----------
+
+# MAGIC %run ./commons
+
+# COMMAND ----------
+
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./segmented_models
+
+# COMMAND ----------
+
+tracer.start('07b_segmented_models')
+
+# Several segmentations are crossed: contract,internet_service trains one model per (contract, tier) pair
+dbutils.widgets.multiselect('segment_by', 'contract', list(segmentations))
+segment_by = dbutils.widgets.get('segment_by').split(',')
+dbutils.widgets.text('min_rows', '200')
+# Rows of skipped segments are scored with this model, e.g. Production; empty leaves them unscored
+dbutils.widgets.text('fallback_model', 'Production')
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Load Features
+
+# COMMAND ----------
+
+from databricks.feature_store import FeatureStoreClient
+
+fs = FeatureStoreClient()
+with span('read_features', table=f'{database_name}.churn_features'):
+  features = fs.read_table(f'{database_name}.churn_features')
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Train one model per segment
+
+# COMMAND ----------
+
+with span('train_segment_models', segment_by=','.join(segment_by)) as s:
+  parent_run_id, segment_summary = train_segment_models(spark, features, segment_by,
+                                                        min_rows=int(dbutils.widgets.get('min_rows')))
+  s.set(parent_run_id=parent_run_id, segments=len(segment_summary),
+        trained=sum(1 for r in segment_summary if r['status'] == 'trained'))
+display(pd.DataFrame(segment_summary))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Score and write
+
+# COMMAND ----------
+
+from mlflow.tracking import MlflowClient
+
+model_name = f"{database_name}_churn"
+fallback_ref = dbutils.widgets.get('fallback_model')
+fallback_uri = None
+if fallback_ref:
+  fallback = MlflowClient().get_latest_versions(model_name, [fallback_ref])
+  fallback_uri = f'models:/{model_name}/{fallback[0].version}' if fallback else None
+
+with span('score_segments', parent_run_id=parent_run_id):
+  scored = (score_segments(spark, features, segment_by, segment_model_uris(parent_run_id), fallback_uri)
+            .withColumn('segment_run_id', F.lit(parent_run_id))
+            .withColumn('scored_at', F.current_timestamp())
+            .cache())
+
+with span('write_predictions', table=f"{database_name}.churn_preds_segmented") as s:
+  scored.write.format("delta").mode("append").option("mergeSchema", "true").saveAsTable(f"{database_name}.churn_preds_segmented")
+  s.set_from(lambda: delta_write_metrics(spark, f"{database_name}.churn_preds_segmented"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Accuracy per segment
+
+# COMMAND ----------
+
+display(scored.groupBy('segment', 'model_segment')
+              .agg(F.count(F.lit(1)).alias('rows'),
+                   F.avg((F.col('predictions') == F.col('churn')).cast('int')).alias('accuracy'),
+                   F.avg('predictions').alias('positive_rate'))
+              .orderBy('segment'))
+scored.unpersist()
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow(parent_run_id)
+display(tracer.summary())
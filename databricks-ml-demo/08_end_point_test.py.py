@@ -1,11 +1,38 @@
 # Databricks notebook source
+# MAGIC %run ./commons
+
+# COMMAND ----------
+
+# MAGIC %run ./tracing
+
+# COMMAND ----------
+
+# MAGIC %run ./registry_index
+
+# COMMAND ----------
+
+# MAGIC %run ./prediction_cache
+
+# COMMAND ----------
+
+# MAGIC %run ./request_capture
+
+# COMMAND ----------
+
+tracer.start('08_end_point_test')
+
+# COMMAND ----------
+
 dbutils.widgets.text("model_name", "kyber_db_ml_churn")
+dbutils.widgets.text("model_version", "7")
 model_name = dbutils.widgets.get("model_name")
+model_version = dbutils.widgets.get("model_version")
 ACCESS_TOKEN = dbutils.secrets.get("kyber_secrets","duyhard_key")
 
 # COMMAND ----------
 
 import os
+import time
 import requests
 import numpy as np
 import pandas as pd
@@ -14,12 +41,33 @@ import json
 def create_tf_serving_json(data):
     return {'inputs': {name: data[name].tolist() for name in data.keys()} if isinstance(data, dict) else data.tolist()}
 
+workspace_url = 'https://disney-cpdl-sbx.cloud.databricks.com'
+endpoint_name = 'kyber-db-ml-test1'
+
+# Requests and responses through score_model are kept for replay against candidate versions (see request_capture, 05)
+capture_path = f'/tmp/churn_capture/{endpoint_name}'
+request_capture = RequestCapture('/dbfs' + capture_path)
+
 def score_model(dataset):
-    url = 'https://disney-cpdl-sbx.cloud.databricks.com/serving-endpoints/kyber-db-ml-test1/invocations'
+    url = f'{workspace_url}/serving-endpoints/{endpoint_name}/invocations'
     headers = {'Authorization': f'Bearer {ACCESS_TOKEN}', 'Content-Type': 'application/json'}
     ds_dict = {'dataframe_split': dataset.to_dict(orient='split')} if isinstance(dataset, pd.DataFrame) else create_tf_serving_json(dataset)
     data_json = json.dumps(ds_dict, allow_nan=True)
-    response = requests.request(method='POST', headers=headers, url=url, data=data_json)
+    # The served version for the capture, looked up before the timed request (at most once per version_check_seconds,
+    # shared with the cache); a failed lookup is recorded as unknown rather than failing the request
+    try:
+        served_version = cached_scorer.refresh_version()
+    except Exception:
+        served_version = None
+    with span('score_model', rows=len(dataset)) as s:
+        started = time.perf_counter()
+        response = requests.request(method='POST', headers=headers, url=url, data=data_json)
+        latency_ms = (time.perf_counter() - started) * 1000
+        s.set(http_status=response.status_code)
+    if 'dataframe_split' in ds_dict:
+        predictions = response.json().get('predictions') if response.status_code == 200 else None
+        request_capture.record(ds_dict['dataframe_split']['columns'], ds_dict['dataframe_split']['data'], predictions,
+                               latency_ms, response.status_code, served_version)
     if response.status_code != 200:
         raise Exception(f'Request failed with status {response.status_code}, {response.text}')
 
@@ -27,9 +75,43 @@ def score_model(dataset):
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC #### Cached scoring
+# MAGIC
+# MAGIC Repeated rows are answered from a local cache keyed by the served model version and the feature row (see `prediction_cache`); only misses go to the endpoint, in one request. The cache is dropped when the endpoint starts serving another version.
+
+# COMMAND ----------
+
+def served_model_version():
+    # The version the endpoint serves now; the cache is keyed by it
+    response = requests.get(f'{workspace_url}/api/2.0/serving-endpoints/{endpoint_name}',
+                            headers={'Authorization': f'Bearer {ACCESS_TOKEN}'})
+    response.raise_for_status()
+    config = response.json()['config']
+    versions = [f"{m.get('entity_name', m.get('model_name'))}/{m.get('entity_version', m.get('model_version'))}"
+                for m in config.get('served_entities') or config.get('served_models')]
+    return ','.join(sorted(versions))
+
+# On driver-local disk, so cached predictions outlive the notebook session
+import tempfile
+prediction_cache = PredictionCache(max_entries=100000,
+                                   disk_path=os.path.join(tempfile.gettempdir(), f'{endpoint_name}_predictions.sqlite'))
+cached_scorer = CachedScorer(lambda dataset: score_model(dataset)['predictions'], served_model_version, prediction_cache)
+
+def score_model_cached(dataset):
+    with span('score_model_cached', rows=len(dataset)) as s:
+        predictions = cached_scorer.score(dataset)
+        s.set(**cached_scorer.stats())
+    return predictions
+
+# COMMAND ----------
+
 import mlflow
-path = mlflow.artifacts.download_artifacts(f'models:/{model_name}/7')
-model = mlflow.pyfunc.load_model(f'models:/{model_name}/7')
+# A version number or a stage; checked against the registry index kept on DBFS between runs
+model_uri = RegistryIndex(durable_path='/dbfs' + registry_index_path).model_uri(model_name, model_version)
+with span('load_model', model_name=model_name, model_uri=model_uri):
+  path = mlflow.artifacts.download_artifacts(model_uri)
+  model = mlflow.pyfunc.load_model(path)
 input_example = model.metadata.load_input_example(path)
 
 # COMMAND ----------
@@ -42,4 +124,27 @@ score_model(input_example)
 
 # COMMAND ----------
 
+# The second call is served from the cache
+score_model_cached(input_example)
+score_model_cached(input_example)
+cached_scorer.stats()
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Export trace
+
+# COMMAND ----------
+
+# Writes what is still buffered
+with span('request_capture_flush') as s:
+  request_capture.close()
+  s.set(**request_capture.stats())
+
+tracer.export_jsonl('/dbfs' + traces_path)
+tracer.log_to_mlflow()
+display(tracer.summary())
+
+# COMMAND ----------
+
 
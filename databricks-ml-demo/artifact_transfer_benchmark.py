@@ -0,0 +1,135 @@
+# Local check of promote_model between two file-based MLflow registries.
+#
+# Logs a run with a "model" directory of --files files of --file-mb MB each to a source store, then
+#   1. copies it the way register_model does (one serial download + upload) as the baseline,
+#   2. promotes it with promote_model,
+#   3. deletes half of the uploaded files and promotes again (resume: only those are re-sent),
+#   4. promotes a second time with the destination intact (dedup: nothing is uploaded),
+#   5. logs a second model version with one data file changed and promotes it (only that file is uploaded, the
+#      others are linked from the first version's copy),
+#   6. registers both runs in the source registry and promotes models:/<name>@champion before and after the alias
+#      moves from the first to the second (the changed file has the same size, so a stale staged copy would pass),
+# checking that every destination copy has the source checksums, and prints the timings as JSON.
+#
+#   python artifact_transfer_benchmark.py --files 40 --file-mb 8 --workers 8
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from artifact_transfer import list_files, promote_model, sha256_file
+
+
+def log_fake_model(tracking_uri, files, file_mb, workdir, changed=None):
+  # `changed`: only rewrite these data files of a model logged before, as a retrain that keeps most files does
+  import mlflow
+
+  model_dir = os.path.join(workdir, 'model')
+  os.makedirs(os.path.join(model_dir, 'data'), exist_ok=True)
+  with open(os.path.join(model_dir, 'MLmodel'), 'w') as f:
+    f.write('flavors: {}\n')
+  for i in (range(files) if changed is None else changed):
+    with open(os.path.join(model_dir, 'data', f'part-{i:04d}.bin'), 'wb') as f:
+      f.write(os.urandom(file_mb << 20))
+
+  mlflow.set_tracking_uri(tracking_uri)
+  with mlflow.start_run() as run:
+    mlflow.log_artifacts(model_dir, 'model')
+  return run.info.run_id, {os.path.relpath(os.path.join(root, name), workdir): sha256_file(os.path.join(root, name))
+                           for root, _, names in os.walk(model_dir) for name in names}
+
+
+def dest_checksums(dest_uri):
+  from mlflow.store.artifact.artifact_repository_registry import get_artifact_repository
+
+  repo = get_artifact_repository(dest_uri)
+  local = tempfile.mkdtemp(prefix='churn-transfer-check-')
+  try:
+    return {'model/' + info.path: sha256_file(repo.download_artifacts(info.path, dst_path=local))
+            for info in list_files(repo) if not info.path.startswith('.')}
+  finally:
+    shutil.rmtree(local, ignore_errors=True)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Parallel, resumable, deduplicating model promotion between two local registries')
+  parser.add_argument('--files', type=int, default=40)
+  parser.add_argument('--file-mb', type=int, default=8)
+  parser.add_argument('--workers', type=int, default=8)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  import mlflow
+  from mlflow.tracking import MlflowClient
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-artifact-transfer-')
+  source_store = 'file:' + os.path.join(workdir, 'source', 'mlruns')
+  dest_store = 'file:' + os.path.join(workdir, 'dest', 'mlruns')
+  dest_root = 'file:' + os.path.join(workdir, 'dest', 'artifacts')
+  run_id, expected = log_fake_model(source_store, args.files, args.file_mb, os.path.join(workdir, 'source'))
+  source_uri = f'runs:/{run_id}/model'
+  dest_client = MlflowClient(tracking_uri=dest_store, registry_uri=dest_store)
+  cache_dir = os.path.join(workdir, 'cache')
+  report = {'files': len(expected), 'mb': args.files * args.file_mb}
+
+  # Baseline: what register_model does for a remote registry
+  start = time.perf_counter()
+  local = mlflow.artifacts.download_artifacts(source_uri, dst_path=tempfile.mkdtemp(prefix='churn-serial-'))
+  serial_uri = dest_root + '/serial'
+  from mlflow.store.artifact.artifact_repository_registry import get_artifact_repository
+  get_artifact_repository(serial_uri).log_artifacts(local)
+  dest_client.create_registered_model('churn_serial')
+  dest_client.create_model_version('churn_serial', source=serial_uri)
+  report['serial_seconds'] = round(time.perf_counter() - start, 3)
+
+  first = promote_model(source_uri, dest_client, dest_root, 'churn_promoted', workers=args.workers, cache_dir=cache_dir)
+  assert dest_checksums(first['dest_uri']) == expected, 'checksum mismatch after promotion'
+  report['promote'] = first
+
+  # Simulate an interrupted upload: half the files never made it
+  dest_dir = first['dest_uri'][len('file:'):]
+  os.remove(os.path.join(dest_dir, '.transfer_manifest.json'))
+  for name in sorted(os.listdir(os.path.join(dest_dir, 'data')))[::2]:
+    os.remove(os.path.join(dest_dir, 'data', name))
+  resumed = promote_model(source_uri, dest_client, dest_root, 'churn_promoted', workers=args.workers, cache_dir=cache_dir)
+  assert dest_checksums(resumed['dest_uri']) == expected, 'checksum mismatch after resume'
+  assert resumed['downloaded'] == 0 and resumed['uploaded'] == (args.files + 1) // 2, resumed
+  report['resume'] = resumed
+
+  again = promote_model(source_uri, dest_client, dest_root, 'churn_promoted', workers=args.workers, cache_dir=cache_dir)
+  assert again['deduplicated'] and again['uploaded'] == 0, again
+  report['dedup'] = again
+
+  # A new version sharing all but one file with the first: only the changed file is uploaded
+  run_id_2, expected_2 = log_fake_model(source_store, args.files, args.file_mb, os.path.join(workdir, 'source'), [0])
+  second = promote_model(f'runs:/{run_id_2}/model', dest_client, dest_root, 'churn_promoted', workers=args.workers,
+                         cache_dir=cache_dir)
+  assert dest_checksums(second['dest_uri']) == expected_2, 'checksum mismatch after partial promotion'
+  assert second['uploaded'] == 1 and second['linked'] == len(expected_2) - 1, second
+  report['second_version'] = second
+
+  # A mutable models:/ source: the alias moves to a version whose changed file has the same size as before
+  source_client = MlflowClient(tracking_uri=source_store, registry_uri=source_store)
+  source_client.create_registered_model('churn_source')
+  for version, rid in ((1, run_id), (2, run_id_2)):
+    source_client.create_model_version('churn_source', source=f'runs:/{rid}/model', run_id=rid)
+  source_client.set_registered_model_alias('churn_source', 'champion', 1)
+  first_alias = promote_model('models:/churn_source@champion', dest_client, dest_root, 'churn_promoted',
+                              workers=args.workers, cache_dir=cache_dir)
+  source_client.set_registered_model_alias('churn_source', 'champion', 2)
+  moved_alias = promote_model('models:/churn_source@champion', dest_client, dest_root, 'churn_promoted',
+                              workers=args.workers, cache_dir=cache_dir)
+  assert first_alias['dest_uri'] == first['dest_uri'], first_alias
+  assert dest_checksums(moved_alias['dest_uri']) == expected_2, 'stale files promoted after the alias moved'
+  report['moved_alias'] = moved_alias
+
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,248 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Asynchronous MLflow logging
+# MAGIC
+# MAGIC Takes MLflow logging off a training loop's critical path. With a remote tracking server every `log_metric`, `log_param`, `set_tag` and artifact upload is a blocking round trip, and autologging plus three `mlflow.evaluate` calls make a lot of them per trial.
+# MAGIC
+# MAGIC - `AsyncRunLogger` buffers metrics, params and tags and a background thread sends them with `log_batch`, split to the tracking server's limits (1000 metrics, 100 params, 100 tags per call), every `flush_seconds` or as soon as a batch is full.
+# MAGIC - Artifacts are copied to a local staging directory right away, since callers such as `mlflow.evaluate` delete their temp files afterwards, then uploaded by a thread pool in parallel.
+# MAGIC - `batched_logging(run_id)` routes the fluent calls (`mlflow.log_metric(s)`, `log_param(s)`, `set_tag(s)`, `log_artifact(s)`, `log_dict`, `log_text`) and `MlflowClient.log_batch` / `log_artifact(s)` for that run through the logger while the block runs. Other runs go straight through. When the block exits it flushes everything and re-raises the first logging error, so nothing is lost silently. Use it inside `mlflow.start_run()`, so the flush happens before the run ends.
+
+# COMMAND ----------
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Per log_batch call, as enforced by the tracking server
+max_batch_metrics, max_batch_params, max_batch_tags, max_batch_entities = 1000, 100, 100, 1000
+
+# COMMAND ----------
+
+class AsyncRunLogger:
+
+  def __init__(self, run_id, client=None, flush_seconds=1.0, artifact_workers=4):
+    from mlflow.tracking import MlflowClient
+
+    self.run_id = run_id
+    self.client = client or MlflowClient()
+    self.flush_seconds = flush_seconds
+    self._metrics, self._params, self._tags = [], {}, {}
+    self._lock = threading.Condition()
+    self._closing = False
+    self._errors = []
+    self._staging = tempfile.mkdtemp(prefix='mlflow-async-')
+    self._uploads = ThreadPoolExecutor(max_workers=artifact_workers, thread_name_prefix='mlflow-artifacts')
+    self._pending_uploads = []
+    self._stats = {'metrics': 0, 'params': 0, 'tags': 0, 'batches': 0, 'artifacts': 0}
+    self._sender = threading.Thread(target=self._run, name='mlflow-batches', daemon=True)
+    self._sender.start()
+
+  # Buffered values
+
+  def log_metrics(self, metrics, step=None, timestamp=None):
+    from mlflow.entities import Metric
+
+    timestamp = timestamp or int(time.time() * 1000)
+    with self._lock:
+      self._metrics += [Metric(k, float(v), timestamp, step or 0) for k, v in metrics.items()]
+      self._lock.notify()
+
+  def log_metric(self, key, value, step=None, timestamp=None):
+    self.log_metrics({key: value}, step, timestamp)
+
+  def log_params(self, params):
+    with self._lock:
+      self._params.update({k: str(v) for k, v in params.items()})
+      self._lock.notify()
+
+  def log_param(self, key, value):
+    self.log_params({key: value})
+
+  def set_tags(self, tags):
+    with self._lock:
+      self._tags.update({k: str(v) for k, v in tags.items()})
+      self._lock.notify()
+
+  def set_tag(self, key, value):
+    self.set_tags({key: value})
+
+  def log_batch(self, metrics=(), params=(), tags=()):
+    # Entity objects, as passed to MlflowClient.log_batch
+    with self._lock:
+      self._metrics += list(metrics)
+      self._params.update({p.key: p.value for p in params})
+      self._tags.update({t.key: t.value for t in tags})
+      self._lock.notify()
+
+  # Artifacts
+
+  def log_artifact(self, local_path, artifact_path=None):
+    staged = os.path.join(tempfile.mkdtemp(dir=self._staging), os.path.basename(local_path))
+    shutil.copy2(local_path, staged)
+    self._upload(self.client.log_artifact, staged, artifact_path)
+
+  def log_artifacts(self, local_dir, artifact_path=None):
+    staged = tempfile.mkdtemp(dir=self._staging)
+    shutil.copytree(local_dir, staged, dirs_exist_ok=True)
+    self._upload(self.client.log_artifacts, staged, artifact_path)
+
+  def log_text(self, text, artifact_file):
+    staged = os.path.join(tempfile.mkdtemp(dir=self._staging), os.path.basename(artifact_file))
+    with open(staged, 'w') as f:
+      f.write(text)
+    self._upload(self.client.log_artifact, staged, os.path.dirname(artifact_file) or None)
+
+  def log_dict(self, dictionary, artifact_file):
+    self.log_text(json.dumps(dictionary, indent=2, default=str), artifact_file)
+
+  def _upload(self, fn, path, artifact_path):
+    def upload():
+      try:
+        fn(self.run_id, path, artifact_path)
+        with self._lock:
+          self._stats['artifacts'] += 1
+      except Exception as e:
+        self._errors.append(e)
+    self._pending_uploads.append(self._uploads.submit(upload))
+
+  # Sending
+
+  def _take_batch(self):
+    # Up to one log_batch call worth of buffered values; params and tags first, as they are few
+    params = list(self._params.items())[:max_batch_params]
+    tags = list(self._tags.items())[:max_batch_tags]
+    room = max_batch_entities - len(params) - len(tags)
+    metrics = self._metrics[:min(max_batch_metrics, room)]
+    for k, _ in params:
+      del self._params[k]
+    for k, _ in tags:
+      del self._tags[k]
+    del self._metrics[:len(metrics)]
+    return metrics, params, tags
+
+  def _buffered(self):
+    return len(self._metrics) + len(self._params) + len(self._tags)
+
+  def _send(self):
+    from mlflow.entities import Param, RunTag
+
+    with self._lock:
+      metrics, params, tags = self._take_batch()
+    if not (metrics or params or tags):
+      return False
+    try:
+      self.client.log_batch(self.run_id, metrics=metrics, params=[Param(k, v) for k, v in params],
+                            tags=[RunTag(k, v) for k, v in tags])
+      with self._lock:
+        self._stats['batches'] += 1
+        self._stats['metrics'] += len(metrics)
+        self._stats['params'] += len(params)
+        self._stats['tags'] += len(tags)
+    except Exception as e:
+      self._errors.append(e)
+    return True
+
+  def _run(self):
+    while True:
+      with self._lock:
+        if not self._closing and len(self._metrics) < max_batch_metrics:
+          self._lock.wait(self.flush_seconds)
+        closing = self._closing
+      while self._send():
+        pass
+      if closing:
+        with self._lock:
+          if not self._buffered():
+            return
+
+  def flush(self):
+    # Waits for every buffered value and upload queued so far
+    while True:
+      with self._lock:
+        if not self._buffered():
+          break
+      self._send()
+    for future in list(self._pending_uploads):
+      future.result()
+
+  def close(self):
+    with self._lock:
+      self._closing = True
+      self._lock.notify()
+    self._sender.join()
+    self.flush()
+    self._uploads.shutdown(wait=True)
+    shutil.rmtree(self._staging, ignore_errors=True)
+    if self._errors:
+      raise self._errors[0]
+
+  def stats(self):
+    with self._lock:
+      return dict(self._stats, errors=len(self._errors))
+
+# COMMAND ----------
+
+_fluent = ['log_metric', 'log_metrics', 'log_param', 'log_params', 'set_tag', 'set_tags', 'log_artifact',
+           'log_artifacts', 'log_dict', 'log_text']
+_client_methods = ['log_batch', 'log_artifact', 'log_artifacts']
+# Keyword arguments the logger's methods take; calls with any other option go straight to MLflow
+_routable_options = {'step', 'timestamp', 'artifact_path', 'metrics', 'params', 'tags'}
+
+
+@contextmanager
+def batched_logging(run_id=None, **logger_args):
+  # Routes MLflow logging for `run_id` (the active run by default) through an AsyncRunLogger while the block runs
+  import mlflow
+  from mlflow.tracking import MlflowClient
+
+  run_id = run_id or mlflow.active_run().info.run_id
+  logger = AsyncRunLogger(run_id, **logger_args)
+  originals = {name: getattr(mlflow, name) for name in _fluent}
+  client_originals = {name: getattr(MlflowClient, name) for name in _client_methods}
+
+  def routed(options, target_run_id):
+    # Calls for this run with no options the logger doesn't know go to the logger
+    return target_run_id == run_id and not set(options) - _routable_options
+
+  def fluent(name):
+    original = originals[name]
+
+    def log(*args, **kwargs):
+      active = mlflow.active_run()
+      target = kwargs.get('run_id') or (active.info.run_id if active else None)
+      options = {k: v for k, v in kwargs.items() if k not in ('run_id', 'synchronous')}
+      if not routed(options, target):
+        return original(*args, **kwargs)
+      return getattr(logger, name)(*args, **options)
+    return log
+
+  def client_method(name):
+    original = client_originals[name]
+
+    def log(self, *args, **kwargs):
+      # run_id comes first, positionally or (as from autologging) by keyword
+      target = kwargs['run_id'] if 'run_id' in kwargs else args[0] if args else None
+      options = {k: v for k, v in kwargs.items() if k not in ('run_id', 'synchronous')}
+      if self is logger.client or not routed(options, target):
+        return original(self, *args, **kwargs)
+      return getattr(logger, name)(*(args if 'run_id' in kwargs else args[1:]), **options)
+    return log
+
+  for name in _fluent:
+    setattr(mlflow, name, fluent(name))
+  for name in _client_methods:
+    setattr(MlflowClient, name, client_method(name))
+  try:
+    yield logger
+  finally:
+    for name, original in originals.items():
+      setattr(mlflow, name, original)
+    for name, original in client_originals.items():
+      setattr(MlflowClient, name, original)
+    logger.close()
@@ -0,0 +1,178 @@
+# Per-trial MLflow logging overhead, blocking vs batched_logging (async_logging.py), against a slow tracking server.
+#
+# Starts a local `mlflow server` (SQLite backend, artifacts served through the server) behind a small proxy that
+# adds a fixed latency to every request, like a remote workspace. Each trial then logs what an AutoML trial with
+# autologging and three mlflow.evaluate calls roughly does (params, tags, per-step metrics and a few artifacts)
+# around a simulated fit, once with plain fluent calls and once inside batched_logging. Prints the logging
+# overhead per trial and the number of requests the server saw as JSON, and exits non-zero if a batched run is
+# missing any param, metric value or artifact.
+#
+#   python async_logging_benchmark.py --trials 5 --latency-ms 50 --steps 50 --artifacts 6
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import async_logging
+
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+def start_latency_proxy(upstream, latency_ms):
+  # Forwards every request to `upstream` after `latency_ms`; counts requests
+  counter = {'requests': 0}
+  lock = threading.Lock()
+
+  class Handler(BaseHTTPRequestHandler):
+    def forward(self):
+      with lock:
+        counter['requests'] += 1
+      time.sleep(latency_ms / 1000)
+      length = int(self.headers.get('Content-Length') or 0)
+      body = self.rfile.read(length) if length else None
+      headers = {k: v for k, v in self.headers.items() if k.lower() not in ('host', 'content-length')}
+      request = urllib.request.Request(upstream + self.path, data=body, headers=headers, method=self.command)
+      try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+          status, payload, content_type = response.status, response.read(), response.headers.get('Content-Type')
+      except urllib.error.HTTPError as e:
+        status, payload, content_type = e.code, e.read(), e.headers.get('Content-Type')
+      self.send_response(status)
+      if content_type:
+        self.send_header('Content-Type', content_type)
+      self.send_header('Content-Length', str(len(payload)))
+      self.end_headers()
+      self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = forward
+
+    def log_message(self, *args):
+      pass
+
+  server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server, f'http://127.0.0.1:{server.server_address[1]}', counter
+
+
+def start_tracking_server(workdir):
+  port = free_port()
+  process = subprocess.Popen([sys.executable, '-m', 'mlflow', 'server', '--host', '127.0.0.1', '--port', str(port),
+                              '--backend-store-uri', 'sqlite:///' + os.path.join(workdir, 'mlflow.db'),
+                              '--artifacts-destination', os.path.join(workdir, 'artifacts'), '--serve-artifacts'],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  url = f'http://127.0.0.1:{port}'
+  for _ in range(120):
+    try:
+      urllib.request.urlopen(url + '/health', timeout=1)
+      return process, url
+    except OSError:
+      time.sleep(0.5)
+  process.kill()
+  raise RuntimeError('mlflow server did not start')
+
+
+def run_trial(i, args, batched):
+  import mlflow
+
+  started = time.perf_counter()
+  with mlflow.start_run(run_name=f"{'batched' if batched else 'blocking'}_{i}") as run:
+    with batched_logging_or_not(run.info.run_id, batched):
+      mlflow.log_params({f'param_{k}': k for k in range(args.params)})
+      mlflow.set_tags({'trial': i, 'mode': 'batched' if batched else 'blocking'})
+      for step in range(args.steps):
+        # Per-iteration training metrics, as autologging reports them
+        mlflow.log_metrics({f'metric_{k}': step * 0.01 + k for k in range(args.metrics)}, step=step)
+      time.sleep(args.fit_seconds)
+      for a in range(args.artifacts):
+        # Evaluation plots and tables
+        mlflow.log_dict({'trial': i, 'artifact': a, 'values': list(range(1000))}, f'eval/artifact_{a}.json')
+  return run.info.run_id, time.perf_counter() - started - args.fit_seconds
+
+
+def batched_logging_or_not(run_id, batched):
+  return async_logging.batched_logging(run_id) if batched else nullcontext()
+
+
+def missing_data(client, run_id, args):
+  run = client.get_run(run_id)
+  missing = []
+  if len(run.data.params) != args.params:
+    missing.append(f'params {len(run.data.params)}/{args.params}')
+  for k in range(args.metrics):
+    history = client.get_metric_history(run_id, f'metric_{k}')
+    if len(history) != args.steps:
+      missing.append(f'metric_{k} {len(history)}/{args.steps}')
+  artifacts = client.list_artifacts(run_id, 'eval')
+  if len(artifacts) != args.artifacts:
+    missing.append(f'artifacts {len(artifacts)}/{args.artifacts}')
+  return missing
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='MLflow logging overhead per trial: blocking vs batched_logging')
+  parser.add_argument('--trials', type=int, default=5)
+  parser.add_argument('--latency-ms', type=float, default=50)
+  parser.add_argument('--params', type=int, default=20)
+  parser.add_argument('--metrics', type=int, default=5)
+  parser.add_argument('--steps', type=int, default=50)
+  parser.add_argument('--artifacts', type=int, default=6)
+  parser.add_argument('--fit-seconds', type=float, default=0.5)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  import mlflow
+  from mlflow.tracking import MlflowClient
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-mlflow-logging-')
+  process, upstream = start_tracking_server(workdir)
+  try:
+    proxy, url, counter = start_latency_proxy(upstream, args.latency_ms)
+    mlflow.set_tracking_uri(url)
+    mlflow.set_experiment('churn_logging_overhead')
+    client = MlflowClient()
+
+    report = {'latency_ms': args.latency_ms, 'trials': args.trials}
+    batched_runs = []
+    for mode in ('blocking', 'batched'):
+      before = counter['requests']
+      overheads = []
+      for i in range(args.trials):
+        run_id, overhead = run_trial(i, args, batched=mode == 'batched')
+        overheads.append(overhead)
+        if mode == 'batched':
+          batched_runs.append(run_id)
+      report[mode] = {'overhead_seconds_per_trial': round(sorted(overheads)[len(overheads) // 2], 3),
+                      'requests_per_trial': round((counter['requests'] - before) / args.trials, 1)}
+    report['speedup'] = (round(report['blocking']['overhead_seconds_per_trial']
+                               / report['batched']['overhead_seconds_per_trial'], 2)
+                         if report['batched']['overhead_seconds_per_trial'] else None)
+    missing = {run_id: m for run_id in batched_runs for m in [missing_data(client, run_id, args)] if m}
+    report['incomplete_batched_runs'] = missing
+    proxy.shutdown()
+  finally:
+    process.terminate()
+
+  print(json.dumps(report, indent=2))
+  if missing:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,168 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Bootstrap
+# MAGIC
+# MAGIC Notebook environment setup behind `commons` and `00_reset`, done lazily:
+# MAGIC
+# MAGIC - `ChurnConfig` resolves the user, paths and table names on first access. Nothing is copied just by loading it.
+# MAGIC - `config.staged_csv_path` copies the repo CSV to DBFS the first time it is read, and only if the DBFS copy's checksum differs from the source.
+# MAGIC - `ensure_database` creates/uses the database only when this session is not already on it.
+# MAGIC - `lazy_module('pandas')` gives a module that is imported on first attribute access, so notebooks that never touch pandas or numpy don't pay for the import.
+
+# COMMAND ----------
+
+import functools
+import hashlib
+import importlib
+import os
+import shutil
+import types
+
+repo_csv_path = 'file:/Workspace/Repos/duy.nguyen@disney.com/duyhard-ml4fun/databricks-ml-demo/Telco-Customer-Churn.csv'
+
+# COMMAND ----------
+
+class ChurnConfig:
+  bronze_tbl_name = 'bronze_customers'
+  quarantine_tbl_name = 'bronze_customers_quarantine'
+  silver_tbl_name = 'silver_customers'
+  automl_tbl_name = 'gold_customers'
+  telco_preds_tbl_name = 'telco_preds'
+
+  def __init__(self, dbutils=None, user=None, database_name='kyber_db_ml',
+               database_location='/Users/duy.nguyen@disney.com/databases/kyber_db_ml',
+               source_csv=repo_csv_path, dbfs_root='/dbfs'):
+    self._dbutils = dbutils
+    self._user = user
+    self.database_name = database_name
+    self.database_location = database_location
+    self.source_csv = source_csv
+    # Where dbfs:/ is mounted on the driver ('' when running locally against plain paths)
+    self.dbfs_root = dbfs_root
+
+  @functools.cached_property
+  def user(self):
+    if self._user:
+      return self._user
+    return self._dbutils.notebook.entry_point.getDbutils().notebook().getContext().tags().apply('user')
+
+  @functools.cached_property
+  def home_path(self):
+    return '/home/{}/ibm-telco-churn/'.format(self.user)
+
+  # Paths for various Delta tables
+  @property
+  def bronze_tbl_path(self):
+    return self.home_path + 'bronze/'
+
+  @property
+  def quarantine_tbl_path(self):
+    return self.home_path + 'bronze_quarantine/'
+
+  @property
+  def silver_tbl_path(self):
+    return self.home_path + 'silver/'
+
+  @property
+  def automl_tbl_path(self):
+    return self.home_path + 'automl-silver/'
+
+  @property
+  def telco_preds_path(self):
+    return self.home_path + 'preds/'
+
+  @property
+  def traces_path(self):
+    return self.home_path + 'traces/'
+
+  @property
+  def snapshots_path(self):
+    return self.home_path + 'snapshots/'
+
+  @property
+  def registry_index_path(self):
+    return self.home_path + 'registry_index.sqlite'
+
+  @property
+  def dbfs_csv_path(self):
+    return 'dbfs:' + self.home_path + 'Telco-Customer-Churn.csv'
+
+  @functools.cached_property
+  def staged_csv_path(self):
+    stage_file(self.source_csv, self.dbfs_csv_path, self._dbutils, self.dbfs_root)
+    return self.dbfs_csv_path
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Staging copy
+
+# COMMAND ----------
+
+def local_path(uri, dbfs_root='/dbfs'):
+  # file:/x -> /x, dbfs:/x -> /dbfs/x, so files can be checksummed from the driver
+  if uri.startswith('file:'):
+    return uri[len('file:'):]
+  if uri.startswith('dbfs:'):
+    return dbfs_root + uri[len('dbfs:'):]
+  return uri
+
+
+def file_md5(path, chunk_size=1 << 20):
+  md5 = hashlib.md5()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      md5.update(chunk)
+  return md5.hexdigest()
+
+
+def stage_file(source, destination, dbutils=None, dbfs_root='/dbfs'):
+  # Copy unless the destination already has the same content; returns True when a copy happened
+  src, dst = local_path(source, dbfs_root), local_path(destination, dbfs_root)
+  if os.path.exists(dst) and os.path.getsize(dst) == os.path.getsize(src) and file_md5(dst) == file_md5(src):
+    return False
+  if dbutils is not None:
+    dbutils.fs.cp(source, destination)
+  else:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst)
+  return True
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Database
+
+# COMMAND ----------
+
+def ensure_database(spark, config, force=False):
+  # Returns True when the database had to be created or switched to; `force` skips the current-database shortcut (e.g. right after a DROP)
+  if not force and spark.catalog.currentDatabase() == config.database_name:
+    return False
+  if not spark.catalog.databaseExists(config.database_name):
+    spark.sql('''
+      CREATE DATABASE IF NOT EXISTS {}
+      COMMENT "CREATE A DATABASE WITH A LOCATION PATH"
+      LOCATION "{}"
+      '''.format(config.database_name, config.database_location))
+  spark.catalog.setCurrentDatabase(config.database_name)
+  return True
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Deferred imports
+
+# COMMAND ----------
+
+class LazyModule(types.ModuleType):
+
+  def __getattr__(self, attr):
+    # Only called for attributes not yet in __dict__: import once, then serve everything from the real module
+    module = importlib.import_module(self.__name__)
+    self.__dict__.update(module.__dict__)
+    return getattr(module, attr)
+
+
+def lazy_module(name):
+  return LazyModule(name)
@@ -0,0 +1,88 @@
+# Local before/after timing of the per-notebook setup that `%run ./commons` does.
+#
+#   before: eager numpy/pandas/pyspark imports, unconditional copy of the CSV, CREATE DATABASE + USE
+#   after:  bootstrap.py -- lazy imports, checksum-skipped copy, ensure_database
+#
+# Imports are timed in a fresh interpreter per repetition (that is what a notebook pays); the copy
+# and database steps are timed in-process, the database ones against a local Spark session.
+#
+#   python bootstrap_benchmark.py --repeat 5 [--spark]
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import bootstrap
+
+legacy_imports = ('import numpy as np; import pandas as pd; '
+                  'from pyspark.sql.functions import col, when; '
+                  'from pyspark.sql.types import StructType,StructField,DoubleType, StringType, IntegerType, FloatType')
+lazy_imports = "import bootstrap; np = bootstrap.lazy_module('numpy'); pd = bootstrap.lazy_module('pandas')"
+
+
+def time_subprocess(code, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=here, check=True)
+    timings.append(time.perf_counter() - start)
+  return timings
+
+
+def time_calls(fn, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    timings.append(time.perf_counter() - start)
+  return timings
+
+
+def summarize(timings):
+  timings = sorted(timings)
+  return {'median_seconds': round(timings[len(timings) // 2], 4), 'min_seconds': round(timings[0], 4)}
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Per-notebook setup cost, before and after bootstrap.py')
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--spark', action='store_true', help='also time the database setup on local Spark')
+  args = parser.parse_args(argv)
+
+  workdir = tempfile.mkdtemp(prefix='churn-bootstrap-')
+  source = os.path.join(here, 'Telco-Customer-Churn.csv')
+  destination = os.path.join(workdir, 'Telco-Customer-Churn.csv')
+
+  report = {
+    'imports': {'before': summarize(time_subprocess(legacy_imports, args.repeat)),
+                'after': summarize(time_subprocess(lazy_imports, args.repeat))},
+    'csv_copy': {'before': summarize(time_calls(lambda: shutil.copyfile(source, destination), args.repeat)),
+                 'after': summarize(time_calls(lambda: bootstrap.stage_file(source, destination, dbfs_root=''), args.repeat))},
+  }
+
+  if args.spark:
+    import pipeline_stages
+
+    spark = pipeline_stages.local_spark('churn-bootstrap')
+    config = bootstrap.ChurnConfig(user='benchmark', database_name='churn_bootstrap_benchmark',
+                                   database_location=os.path.join(workdir, 'db'))
+
+    def legacy_database():
+      spark.sql(f'CREATE DATABASE IF NOT EXISTS {config.database_name} LOCATION "{config.database_location}"')
+      spark.sql(f'USE {config.database_name}')
+
+    report['database'] = {'before': summarize(time_calls(legacy_database, args.repeat)),
+                          'after': summarize(time_calls(lambda: bootstrap.ensure_database(spark, config), args.repeat))}
+
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()
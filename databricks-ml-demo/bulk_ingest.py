@@ -0,0 +1,159 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Bulk ingest and bronze maintenance
+# MAGIC
+# MAGIC Loading thousands of small landing files the way `00b` loads one CSV gives one read task and (at least) one tiny Parquet file per input file, and every downstream scan of `bronze_customers` pays for it.
+# MAGIC
+# MAGIC - `bulk_ingest_telco` reads the whole landing set in one job, packing many small files into each read task, and coalesces the bronze write to roughly `target_file_mb` per file. Parsing and quarantine go through the schema contract as usual.
+# MAGIC - `maintain_table` is meant to run after every bulk load: when the table has drifted into many small files it compacts and Z-orders it on `customerID` (`OPTIMIZE ... ZORDER BY`), then vacuums. It reports file count and scan times before and after.
+# MAGIC
+# MAGIC Everything works on a plain Delta path, so it runs the same on DBFS and on a local table (see `bulk_ingest_benchmark.py`).
+
+# COMMAND ----------
+
+# MAGIC %run ./schema_contract
+
+# COMMAND ----------
+
+import math
+import time
+
+from pyspark.sql import functions as F
+
+if 'ingest_telco_csv' not in globals():
+  from schema_contract import ingest_telco_csv
+
+# Snappy Parquet comes out at roughly this fraction of the CSV size
+csv_to_parquet_ratio = 0.3
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Bulk ingest
+
+# COMMAND ----------
+
+def list_input_files(spark, path):
+  # (path, bytes) for every data file under a path or glob, through the Hadoop FileSystem so DBFS, cloud storage and local disk all work
+  jvm = spark.sparkContext._jvm
+  hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+  fs = hadoop_path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+  files = []
+  for status in fs.globStatus(hadoop_path) or []:
+    children = fs.listStatus(status.getPath()) if status.isDirectory() else [status]
+    for child in children:
+      name = child.getPath().getName()
+      if child.isFile() and not name.startswith(('_', '.')):
+        files.append((child.getPath().toString(), child.getLen()))
+  return files
+
+
+def bulk_ingest_telco(spark, landing_path, bronze_path, quarantine_path, target_file_mb=128, mode='append'):
+  files = list_input_files(spark, landing_path)
+  if not files:
+    raise ValueError(f'No input files under {landing_path}')
+
+  input_bytes = sum(size for _, size in files)
+  target_bytes = target_file_mb * 1024 * 1024
+  num_files = max(1, math.ceil(input_bytes * csv_to_parquet_ratio / target_bytes))
+
+  # Pack small files into read tasks: a low open cost lets each task take many files up to the target size
+  read_conf = {'spark.sql.files.maxPartitionBytes': str(target_bytes),
+               'spark.sql.files.openCostInBytes': str(min(max(input_bytes // len(files), 64 * 1024), 4 * 1024 * 1024))}
+  previous = {k: spark.conf.get(k, None) for k in read_conf}
+  for k, v in read_conf.items():
+    spark.conf.set(k, v)
+  try:
+    report = ingest_telco_csv(spark, [p for p, _ in files], bronze_path, quarantine_path, mode=mode, num_files=num_files)
+  finally:
+    for k, v in previous.items():
+      if v is None:
+        spark.conf.unset(k)
+      else:
+        spark.conf.set(k, v)
+
+  report.update(input_files=len(files), input_bytes=input_bytes, output_files=num_files)
+  return report
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Layout metrics
+
+# COMMAND ----------
+
+def table_file_stats(spark, path):
+  detail = spark.sql(f"DESCRIBE DETAIL delta.`{path}`").first()
+  num_files, size = detail['numFiles'], detail['sizeInBytes']
+  return {'num_files': num_files, 'size_bytes': size, 'avg_file_bytes': size // num_files if num_files else 0}
+
+
+def time_scans(spark, path, customer_id):
+  # Full scan through the noop sink (count(*) would be answered from the Delta log) and a point lookup that benefits from data skipping
+  df = spark.read.format('delta').load(path)
+
+  start = time.perf_counter()
+  df.write.format('noop').mode('overwrite').save()
+  full_scan = time.perf_counter() - start
+
+  start = time.perf_counter()
+  df.filter(F.col('customerID') == customer_id).collect()
+  point_lookup = time.perf_counter() - start
+
+  return {'full_scan_seconds': round(full_scan, 3), 'point_lookup_seconds': round(point_lookup, 3)}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Compaction, clustering and vacuum
+
+# COMMAND ----------
+
+def needs_compaction(stats, target_file_mb=128, min_files=16):
+  # Compact once there are enough files and they average under a quarter of the target size
+  return stats['num_files'] >= min_files and stats['avg_file_bytes'] < target_file_mb * 1024 * 1024 / 4
+
+
+def compact_table(spark, path, target_file_mb=128, cluster_by=('customerID',)):
+  from delta.tables import DeltaTable
+
+  # The target size is for this OPTIMIZE only; the session's previous setting comes back afterwards
+  key = 'spark.databricks.delta.optimize.maxFileSize'
+  previous = spark.conf.get(key, None)
+  spark.conf.set(key, str(target_file_mb * 1024 * 1024))
+  try:
+    optimizer = DeltaTable.forPath(spark, path).optimize()
+    metrics = optimizer.executeZOrderBy(*cluster_by) if cluster_by else optimizer.executeCompaction()
+  finally:
+    if previous is None:
+      spark.conf.unset(key)
+    else:
+      spark.conf.set(key, previous)
+  return metrics.first()['metrics'].asDict(recursive=True)
+
+
+def vacuum_table(spark, path, retention_hours=168):
+  from delta.tables import DeltaTable
+
+  DeltaTable.forPath(spark, path).vacuum(retention_hours)
+
+
+def maintain_table(spark, path, target_file_mb=128, cluster_by=('customerID',), vacuum_retention_hours=168,
+                   force=False, measure=True):
+  stats_before = table_file_stats(spark, path)
+  report = {'path': path, 'before': stats_before, 'compacted': False}
+
+  customer_id = None
+  if measure:
+    customer_id = spark.read.format('delta').load(path).select('customerID').first()[0]
+    report['before'].update(time_scans(spark, path, customer_id))
+
+  if force or needs_compaction(stats_before, target_file_mb):
+    report['optimize'] = compact_table(spark, path, target_file_mb, cluster_by)
+    report['compacted'] = True
+  vacuum_table(spark, path, vacuum_retention_hours)
+
+  report['after'] = table_file_stats(spark, path)
+  if measure:
+    report['after'].update(time_scans(spark, path, customer_id))
+  return report
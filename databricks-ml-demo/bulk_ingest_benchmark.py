@@ -0,0 +1,80 @@
+# Local check of the bulk ingest path against a Delta table on disk.
+#
+# Splits the telco CSV (scaled up to --rows) into --files small landing files, then loads them
+#   1. the way 00b loads a single file (default read settings, no coalesce), and
+#   2. with bulk_ingest_telco,
+# and runs maintain_table on both tables, printing file counts and full-scan / point-lookup
+# times before and after compaction as JSON.
+#
+#   python bulk_ingest_benchmark.py --rows 200000 --files 2000
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bulk_ingest
+import pipeline_stages as stages
+from pipeline_benchmark import scale_telco_csv, telco_csv, run_stage
+from schema_contract import ingest_telco_csv
+
+
+def split_csv(src_csv, landing_dir, files):
+  # Round-robin the rows of src_csv into `files` CSVs, each with the header
+  os.makedirs(landing_dir, exist_ok=True)
+  with open(src_csv) as f:
+    header = f.readline()
+    outs = [open(os.path.join(landing_dir, f'part-{i:05d}.csv'), 'w') for i in range(files)]
+    try:
+      for out in outs:
+        out.write(header)
+      for i, line in enumerate(f):
+        outs[i % files].write(line)
+    finally:
+      for out in outs:
+        out.close()
+  return landing_dir
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Bulk ingest vs single-file ingest on many small landing files')
+  parser.add_argument('--rows', type=int, default=200000)
+  parser.add_argument('--files', type=int, default=2000)
+  parser.add_argument('--target-file-mb', type=int, default=128)
+  parser.add_argument('--workdir', default=None)
+  parser.add_argument('--output', default=None, help='also write the report to this JSON file')
+  args = parser.parse_args(argv)
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-bulk-ingest-')
+  landing = os.path.join(workdir, 'landing')
+  shutil.rmtree(landing, ignore_errors=True)
+  split_csv(scale_telco_csv(telco_csv, os.path.join(workdir, f'telco_{args.rows}.csv'), args.rows), landing, args.files)
+
+  # Vacuum with zero retention is only allowed once the safety check is off
+  spark = stages.local_spark('churn-bulk-ingest', {'spark.databricks.delta.retentionDurationCheck.enabled': 'false'})
+  report = {'rows': args.rows, 'landing_files': args.files}
+  for name, load in [
+    ('per_file', lambda bronze, quarantine: ingest_telco_csv(spark, landing, bronze, quarantine)),
+    ('bulk', lambda bronze, quarantine: bulk_ingest.bulk_ingest_telco(spark, landing, bronze, quarantine, args.target_file_mb)),
+  ]:
+    bronze = os.path.join(workdir, f'bronze_{name}')
+    quarantine = os.path.join(workdir, f'quarantine_{name}')
+    shutil.rmtree(bronze, ignore_errors=True)
+    shutil.rmtree(quarantine, ignore_errors=True)
+
+    _, ingest = run_stage('ingest', lambda: load(bronze, quarantine), lambda r: r['accepted'], [bronze])
+    maintenance = bulk_ingest.maintain_table(spark, bronze, target_file_mb=args.target_file_mb, force=True,
+                                             vacuum_retention_hours=0)
+    report[name] = {'ingest': ingest, 'maintenance': maintenance}
+
+  print(json.dumps(report, indent=2, default=str))
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,39 +1,43 @@
 # Databricks notebook source
-# Load libraries
-import shutil
-import numpy as np # linear algebra
-import pandas as pd # data processing, CSV file I/O (e.g. pd.read_csv)
-from pyspark.sql.functions import col, when
-from pyspark.sql.types import StructType,StructField,DoubleType, StringType, IntegerType, FloatType
+# MAGIC %run ./bootstrap
+
+# COMMAND ----------
+
+import time
+_commons_start = time.perf_counter()
 
 # Set config for database name, file paths, and table names
-database_name = 'kyber_db_ml'
+# Everything resolves lazily; see bootstrap for what is copied and created, and when
+config = ChurnConfig(dbutils=dbutils)
+database_name = config.database_name
+user = config.user
 
-# Move file from driver to DBFS
-user = dbutils.notebook.entry_point.getDbutils().notebook().getContext().tags().apply('user')
-driver_to_dbfs_path = 'dbfs:/home/{}/ibm-telco-churn/Telco-Customer-Churn.csv'.format(user)
-dbutils.fs.cp('file:/Workspace/Repos/duy.nguyen@disney.com/duyhard-ml4fun/databricks-ml-demo/Telco-Customer-Churn.csv', driver_to_dbfs_path)
+# Source CSV on DBFS; read `config.staged_csv_path` instead to copy it there first (skipped when the checksum matches)
+driver_to_dbfs_path = config.dbfs_csv_path
 
 # Paths for various Delta tables
-bronze_tbl_path = '/home/{}/ibm-telco-churn/bronze/'.format(user)
-silver_tbl_path = '/home/{}/ibm-telco-churn/silver/'.format(user)
-automl_tbl_path = '/home/{}/ibm-telco-churn/automl-silver/'.format(user)
-telco_preds_path = '/home/{}/ibm-telco-churn/preds/'.format(user)
-
-bronze_tbl_name = 'bronze_customers'
-silver_tbl_name = 'silver_customers'
-automl_tbl_name = 'gold_customers'
-telco_preds_tbl_name = 'telco_preds'
+bronze_tbl_path = config.bronze_tbl_path
+quarantine_tbl_path = config.quarantine_tbl_path
+silver_tbl_path = config.silver_tbl_path
+automl_tbl_path = config.automl_tbl_path
+telco_preds_path = config.telco_preds_path
+traces_path = config.traces_path
+snapshots_path = config.snapshots_path
+registry_index_path = config.registry_index_path
+
+bronze_tbl_name = config.bronze_tbl_name
+quarantine_tbl_name = config.quarantine_tbl_name
+silver_tbl_name = config.silver_tbl_name
+automl_tbl_name = config.automl_tbl_name
+telco_preds_tbl_name = config.telco_preds_tbl_name
+
+# Load libraries on first use only
+np = lazy_module('numpy') # linear algebra
+pd = lazy_module('pandas') # data processing, CSV file I/O (e.g. pd.read_csv)
 
 # COMMAND ----------
 
-# MAGIC %sql
-# MAGIC --USE catalog hive_metastore;
-# MAGIC CREATE DATABASE IF NOT EXISTS kyber_db_ml
-# MAGIC     COMMENT "CREATE A DATABASE WITH A LOCATION PATH"
-# MAGIC     LOCATION "/Users/duy.nguyen@disney.com/databases/kyber_db_ml" 
-
-# COMMAND ----------
+ensure_database(spark, config)
 
-# MAGIC %sql
-# MAGIC USE kyber_db_ml
+commons_seconds = time.perf_counter() - _commons_start
+print(f"commons ready in {commons_seconds:.2f}s")
@@ -0,0 +1,267 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Compiled scorer
+# MAGIC
+# MAGIC Exports the churn model (the sklearn `Pipeline` logged by AutoML or `train_churn_model`) to a single `.npz` file that is scored with NumPy only:
+# MAGIC
+# MAGIC - The preprocessing (`ColumnSelector`, nested `ColumnTransformer`s, `SimpleImputer`, `StandardScaler`, `OneHotEncoder` and value-preserving `FunctionTransformer`s) is folded into one per-column transform: fill missing, scale and shift, and for one-hot outputs compare with the category.
+# MAGIC - The boosted trees are flattened into node arrays (feature, threshold, children, default direction, leaf value), taken from XGBoost's JSON model so thresholds match bit for bit. All trees are walked at once, one vectorized step per tree level.
+# MAGIC
+# MAGIC Loading `CompiledChurnScorer` imports neither sklearn nor xgboost. Anything the compiler does not recognise raises `ValueError`, so the pyfunc model stays the fallback. Inputs are cast to float32 before the tree walk, as XGBoost does, so predictions match the pyfunc model (checked in `04`; benchmarked in `compiled_scorer_benchmark.py`).
+
+# COMMAND ----------
+
+import json
+
+import numpy as np
+
+_affine, _indicator = 0, 1
+
+# COMMAND ----------
+
+class CompiledChurnScorer:
+
+  def __init__(self, arrays, meta):
+    self.input_columns = meta['input_columns']
+    self.classes = meta['classes']
+    self.base_margin = meta['base_margin']
+    self.max_depth = meta['max_depth']
+    self.__dict__.update(arrays)
+
+  @classmethod
+  def load(cls, path):
+    with np.load(path, allow_pickle=False) as data:
+      arrays = {k: data[k] for k in data.files if k != 'meta'}
+      meta = json.loads(str(data['meta']))
+    return cls(arrays, meta)
+
+  def save(self, path):
+    meta = {'input_columns': self.input_columns, 'classes': self.classes, 'base_margin': self.base_margin,
+            'max_depth': self.max_depth}
+    arrays = {k: getattr(self, k) for k in ('src', 'kind', 'fill', 'scale', 'offset', 'match',
+                                            'roots', 'feature', 'threshold', 'left', 'right', 'default_left', 'value')}
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+    return path
+
+  def transform(self, X):
+    # Raw input columns (in `input_columns` order) -> model features, as float32 like XGBoost's DMatrix
+    X = self._as_array(X)[:, self.src]
+    X = np.where(np.isnan(X) & ~np.isnan(self.fill), self.fill, X) * self.scale + self.offset
+    X = np.where(self.kind == _indicator, (X == self.match).astype(np.float64), X)
+    return X.astype(np.float32)
+
+  def margin(self, X):
+    Z = self.transform(X)
+    rows = np.arange(Z.shape[0])[:, None]
+    nodes = np.broadcast_to(self.roots, (Z.shape[0], self.roots.size)).copy()
+    for _ in range(self.max_depth):
+      f = self.feature[nodes]
+      x = Z[rows, np.maximum(f, 0)]
+      go_left = np.where(np.isnan(x), self.default_left[nodes], x < self.threshold[nodes])
+      nodes = np.where(f < 0, nodes, np.where(go_left, self.left[nodes], self.right[nodes]))
+    return self.value[nodes].sum(axis=1, dtype=np.float32) + np.float32(self.base_margin)
+
+  def predict_proba(self, X):
+    p = 1.0 / (1.0 + np.exp(-self.margin(X).astype(np.float64)))
+    return np.column_stack([1.0 - p, p])
+
+  def predict(self, X):
+    return np.asarray(self.classes)[(self.margin(X) > 0).astype(int)]
+
+  def _as_array(self, X):
+    if hasattr(X, 'columns'):
+      X = X[self.input_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.asarray(X, dtype=np.float64)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Compiling
+
+# COMMAND ----------
+
+def _identity(name, src):
+  return {'name': name, 'src': src, 'kind': _affine, 'fill': np.nan, 'scale': 1.0, 'offset': 0.0, 'match': 0.0}
+
+
+def _select(plans, columns):
+  if isinstance(columns, slice):
+    return plans[columns]
+  columns = list(columns) if not isinstance(columns, str) else [columns]
+  if columns and isinstance(columns[0], (bool, np.bool_)):
+    return [p for p, keep in zip(plans, columns) if keep]
+  if columns and isinstance(columns[0], str):
+    by_name = {p['name']: p for p in plans}
+    missing = [c for c in columns if c not in by_name]
+    if missing:
+      raise ValueError(f'Columns {missing[:5]} are not available at this step')
+    return [by_name[c] for c in columns]
+  return [plans[int(i)] for i in columns]
+
+
+def _check_value_preserving(step, plans):
+  # FunctionTransformers (e.g. AutoML's astype(object)) are folded only if they leave 0/1/NaN/float values unchanged
+  import pandas as pd
+
+  probe = pd.DataFrame({p['name'] or str(i): [0.0, 1.0, np.nan, 2.5] for i, p in enumerate(plans)})
+  out = np.asarray(step.transform(probe), dtype=np.float64)
+  if out.shape != probe.shape or not np.allclose(out, probe.to_numpy(), equal_nan=True):
+    raise ValueError(f'Cannot fold {step!r}: it changes values')
+
+
+def _compile_step(step, plans):
+  from sklearn.compose import ColumnTransformer
+  from sklearn.impute import SimpleImputer
+  from sklearn.pipeline import Pipeline
+  from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+
+  if step is None or step == 'passthrough':
+    return plans
+  if step == 'drop':
+    return []
+  if isinstance(step, Pipeline):
+    for _, sub in step.steps:
+      plans = _compile_step(sub, plans)
+    return plans
+  if type(step).__name__ == 'ColumnSelector':
+    return _select(plans, step.cols)
+  if isinstance(step, ColumnTransformer):
+    out = []
+    for _, transformer, columns in step.transformers_:
+      out += [dict(p, name=None) for p in _compile_step(transformer, _select(plans, columns))]
+    return out
+  if isinstance(step, FunctionTransformer):
+    if step.func is not None:
+      _check_value_preserving(step, plans)
+    return plans
+  if isinstance(step, SimpleImputer):
+    if getattr(step, 'add_indicator', False) or not (isinstance(step.missing_values, float) and np.isnan(step.missing_values)):
+      raise ValueError(f'Cannot fold {step!r}: only NaN imputation without indicators is supported')
+    out = []
+    for p, stat in zip(plans, np.asarray(step.statistics_, dtype=np.float64)):
+      if np.isnan(stat) and not getattr(step, 'keep_empty_features', False):
+        continue
+      if p['kind'] != _affine or not np.isnan(p['fill']) or p['scale'] == 0:
+        raise ValueError(f'Cannot fold {step!r} after a non-identity transform')
+      out.append(dict(p, fill=(stat - p['offset']) / p['scale']))
+    return out
+  if isinstance(step, StandardScaler):
+    mean = step.mean_ if step.mean_ is not None else np.zeros(len(plans))
+    scale = step.scale_ if step.scale_ is not None else np.ones(len(plans))
+    return [dict(p, scale=p['scale'] / s, offset=(p['offset'] - m) / s) for p, m, s in zip(plans, mean, scale)]
+  if isinstance(step, OneHotEncoder):
+    if any(c is not None for c in getattr(step, 'infrequent_categories_', None) or []):
+      raise ValueError(f'Cannot fold {step!r}: infrequent categories are not supported')
+    drop_idx = step.drop_idx_ if step.drop_idx_ is not None else [None] * len(plans)
+    out = []
+    for p, categories, dropped in zip(plans, step.categories_, drop_idx):
+      if p['kind'] != _affine:
+        raise ValueError(f'Cannot fold {step!r} on an already encoded column')
+      for k, category in enumerate(categories):
+        if dropped is not None and k == dropped:
+          continue
+        out.append(dict(p, kind=_indicator, match=float(category)))
+    return out
+  raise ValueError(f'Cannot compile pipeline step {step!r}')
+
+
+def _xgb_of(classifier):
+  # The XGBClassifier itself, or the one inside AutoML's TransformedTargetClassifier
+  for candidate in (classifier, getattr(classifier, 'classifier_', None), getattr(classifier, 'classifier', None)):
+    if candidate is not None and hasattr(candidate, 'get_booster'):
+      return candidate
+  raise ValueError(f'Cannot compile classifier {classifier!r}: no XGBoost booster found')
+
+
+def _compile_trees(xgb):
+  import os
+  import tempfile
+
+  booster = xgb.get_booster()
+  path = os.path.join(tempfile.mkdtemp(prefix='churn-xgb-'), 'model.json')
+  booster.save_model(path)
+  with open(path) as f:
+    learner = json.load(f)['learner']
+  if learner['objective']['name'] != 'binary:logistic':
+    raise ValueError(f"Cannot compile objective {learner['objective']['name']}: only binary:logistic is supported")
+
+  model = learner['gradient_booster']['model']
+  trees = model['trees']
+  best_iteration = getattr(xgb, 'best_iteration', None)
+  if best_iteration is not None:
+    per_iteration = int(model['gbtree_model_param'].get('num_parallel_tree', 1))
+    trees = trees[:(best_iteration + 1) * per_iteration]
+
+  base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+  arrays = {k: [] for k in ('roots', 'feature', 'threshold', 'left', 'right', 'default_left', 'value')}
+  offset, max_depth = 0, 0
+  for tree in trees:
+    if tree.get('categories'):
+      raise ValueError('Cannot compile categorical splits')
+    left = np.asarray(tree['left_children'])
+    right = np.asarray(tree['right_children'])
+    leaf = left == -1
+    nodes = np.arange(left.size)
+    arrays['roots'].append(offset)
+    arrays['feature'].append(np.where(leaf, -1, tree['split_indices']))
+    arrays['threshold'].append(np.asarray(tree['split_conditions'], dtype=np.float32))
+    arrays['left'].append(np.where(leaf, nodes, left) + offset)
+    arrays['right'].append(np.where(leaf, nodes, right) + offset)
+    arrays['default_left'].append(np.asarray(tree['default_left'], dtype=bool))
+    arrays['value'].append(np.where(leaf, np.asarray(tree['split_conditions'], dtype=np.float32), 0).astype(np.float32))
+    depth = np.zeros(left.size, dtype=int)
+    for n in nodes:
+      if not leaf[n]:
+        depth[left[n]] = depth[right[n]] = depth[n] + 1
+    max_depth = max(max_depth, int(depth.max()))
+    offset += left.size
+
+  compiled = {'roots': np.asarray(arrays['roots'], dtype=np.int64)}
+  for k in ('feature', 'left', 'right'):
+    compiled[k] = np.concatenate(arrays[k]).astype(np.int64)
+  for k in ('threshold', 'value'):
+    compiled[k] = np.concatenate(arrays[k]).astype(np.float32)
+  compiled['default_left'] = np.concatenate(arrays['default_left'])
+  return compiled, float(np.log(base_score / (1 - base_score))), max_depth
+
+
+def compile_churn_model(model, input_columns=None):
+  # sklearn Pipeline (preprocessing steps + XGBoost classifier) -> CompiledChurnScorer
+  steps = [s for _, s in model.steps]
+  if input_columns is None:
+    first = steps[0]
+    input_columns = list(first.cols if type(first).__name__ == 'ColumnSelector' else first.feature_names_in_)
+  plans = [_identity(c, i) for i, c in enumerate(input_columns)]
+  for step in steps[:-1]:
+    plans = _compile_step(step, plans)
+
+  xgb = _xgb_of(steps[-1])
+  trees, base_margin, max_depth = _compile_trees(xgb)
+  if trees['feature'].max(initial=-1) >= len(plans):
+    raise ValueError(f'Trees use {trees["feature"].max() + 1} features, the preprocessing produces {len(plans)}')
+
+  arrays = {'src': np.asarray([p['src'] for p in plans], dtype=np.int64),
+            'kind': np.asarray([p['kind'] for p in plans], dtype=np.int8),
+            **{k: np.asarray([p[k] for p in plans], dtype=np.float64) for k in ('fill', 'scale', 'offset', 'match')},
+            **trees}
+  classes = [c.item() if hasattr(c, 'item') else c for c in getattr(steps[-1], 'classes_', xgb.classes_)]
+  return CompiledChurnScorer(arrays, {'input_columns': list(input_columns), 'classes': classes,
+                                      'base_margin': base_margin, 'max_depth': max_depth})
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Parity
+
+# COMMAND ----------
+
+def parity_report(reference_model, scorer, pdf, atol=1e-5):
+  # Compares predictions (and probabilities, when the reference has predict_proba) on the same rows
+  expected = np.asarray(reference_model.predict(pdf))
+  actual = scorer.predict(pdf)
+  report = {'rows': len(pdf), 'prediction_mismatches': int((expected != actual).sum())}
+  if hasattr(reference_model, 'predict_proba'):
+    gap = np.abs(np.asarray(reference_model.predict_proba(pdf))[:, 1] - scorer.predict_proba(pdf)[:, 1])
+    report.update(max_proba_gap=float(gap.max(initial=0)), proba_mismatches=int((gap > atol).sum()))
+  report['passed'] = report['prediction_mismatches'] == 0 and report.get('proba_mismatches', 0) == 0
+  return report
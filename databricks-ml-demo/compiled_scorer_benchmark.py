@@ -0,0 +1,106 @@
+# Local parity and speed check of the compiled NumPy scorer against the pyfunc model.
+#
+# Trains the churn model on local Spark (train_churn_model, same as pipeline_benchmark), compiles it with
+# compile_churn_model, then
+#   1. checks predictions and probabilities match the sklearn pipeline on every feature row,
+#   2. times predict at a few batch sizes for the pyfunc model and the compiled scorer,
+#   3. times a cold start (fresh interpreter: import, load, score one row) for both, and checks the
+#      compiled one imported neither sklearn nor xgboost,
+# and prints the results as JSON. Exits non-zero if parity fails.
+#
+#   python compiled_scorer_benchmark.py --batch-sizes 1 100 7043 --repeat 20
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import compiled_scorer
+import pipeline_stages as stages
+from pipeline_benchmark import telco_csv
+
+pyfunc_cold_start = '''
+import json, sys, pandas as pd, mlflow.pyfunc
+model = mlflow.pyfunc.load_model(sys.argv[1])
+model.predict(pd.DataFrame(json.load(open(sys.argv[2]))))
+'''
+
+compiled_cold_start = '''
+import json, sys, compiled_scorer
+scorer = compiled_scorer.CompiledChurnScorer.load(sys.argv[1])
+rows = json.load(open(sys.argv[2]))
+scorer.predict([[row[c] for c in scorer.input_columns] for row in rows])
+assert 'sklearn' not in sys.modules and 'xgboost' not in sys.modules, 'compiled scorer imported sklearn/xgboost'
+'''
+
+
+def median_seconds(fn, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    timings.append(time.perf_counter() - start)
+  return sorted(timings)[len(timings) // 2]
+
+
+def cold_start_seconds(code, args, repeat, env):
+  return median_seconds(lambda: subprocess.run([sys.executable, '-c', code, *args], cwd=here, env=env, check=True), repeat)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Compiled NumPy scorer vs pyfunc: parity, latency and cold start')
+  parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 7043])
+  parser.add_argument('--repeat', type=int, default=20)
+  parser.add_argument('--cold-repeat', type=int, default=3)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  import mlflow
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-compiled-')
+  tracking_uri = 'file:' + os.path.join(workdir, 'mlruns')
+  mlflow.set_tracking_uri(tracking_uri)
+
+  spark = stages.local_spark('churn-compiled-scorer')
+  bronze, _ = stages.ingest_bronze(spark, telco_csv, os.path.join(workdir, 'bronze'))
+  features = stages.compute_churn_features(bronze)
+  model_uri = f"runs:/{stages.train_churn_model(features, experiment_name='churn_compiled')}/model"
+  pdf = features.toPandas()
+
+  pyfunc_model = mlflow.pyfunc.load_model(model_uri)
+  sklearn_model = mlflow.sklearn.load_model(model_uri)
+  scorer = compiled_scorer.compile_churn_model(sklearn_model)
+  artifact = scorer.save(os.path.join(workdir, 'churn_scorer.npz'))
+  scorer = compiled_scorer.CompiledChurnScorer.load(artifact)
+
+  report = {'rows': len(pdf), 'artifact_bytes': os.path.getsize(artifact),
+            'parity': compiled_scorer.parity_report(sklearn_model, scorer, pdf[scorer.input_columns])}
+
+  report['latency_ms'] = {}
+  for n in args.batch_sizes:
+    batch = pdf.head(n)
+    report['latency_ms'][n] = {
+      'pyfunc': round(median_seconds(lambda: pyfunc_model.predict(batch), args.repeat) * 1000, 3),
+      'compiled': round(median_seconds(lambda: scorer.predict(batch), args.repeat) * 1000, 3),
+    }
+
+  sample_rows = os.path.join(workdir, 'sample_rows.json')
+  pdf.head(1).to_json(sample_rows, orient='records')
+  env = dict(os.environ, MLFLOW_TRACKING_URI=tracking_uri)
+  report['cold_start_seconds'] = {
+    'pyfunc': round(cold_start_seconds(pyfunc_cold_start, [model_uri, sample_rows], args.cold_repeat, env), 3),
+    'compiled': round(cold_start_seconds(compiled_cold_start, [artifact, sample_rows], args.cold_repeat, env), 3),
+  }
+
+  print(json.dumps(report, indent=2))
+  if not report['parity']['passed']:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
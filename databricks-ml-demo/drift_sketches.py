@@ -0,0 +1,259 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Drift sketches
+# MAGIC
+# MAGIC Drift monitoring for `churn_features` and `churn_preds` without rescanning history. Each batch written to a monitored table is summarized once, in a single aggregation, into small per-column sketches that are appended to `churn_drift_sketches`:
+# MAGIC
+# MAGIC - every column: count, nulls, sum and sum of squares (mean and variance), min and max
+# MAGIC - `tenure`, `monthlyCharges`, `totalCharges`: cumulative counts at fixed cut points, taken from the baseline's quantiles
+# MAGIC - the one-hot (0/1) columns, the label and the predictions: how many rows are 1
+# MAGIC
+# MAGIC All of these are sums, so sketches of several batches merge by adding them up. PSI and KS against the baseline are computed from the sketch rows alone. KS is evaluated at the cut points, so it is a slight underestimate of the exact statistic.
+# MAGIC
+# MAGIC Cumulative counts only add up, and only compare with the baseline, on the same cut points. When the baseline is replaced (`07` on every retrain) the batches recorded before keep the old ones: `drift_report` leaves them out of a numeric column and lists them in `stale_batches` (status `stale` when nothing else is left), and `merge_sketches` refuses to mix cut points. `07` sketches the current `churn_features` version again right after replacing the baseline, so the latest batch is comparable.
+
+# COMMAND ----------
+
+# MAGIC %run ./snapshots
+
+# COMMAND ----------
+
+import math
+from datetime import datetime, timezone
+
+from pyspark.sql import functions as F
+from pyspark.sql import types as T
+
+if 'table_version' not in globals():
+  from snapshots import table_version
+
+monitored_numeric = ['tenure', 'monthlyCharges', 'totalCharges']
+baseline_batch = 'baseline'
+
+# PSI rule of thumb: < 0.1 stable, 0.1-0.25 moderate shift, > 0.25 significant shift
+psi_thresholds = (0.1, 0.25)
+
+sketch_schema = T.StructType([
+  T.StructField('source', T.StringType()),
+  T.StructField('batch_id', T.StringType()),
+  T.StructField('source_version', T.LongType()),
+  T.StructField('created_at', T.StringType()),
+  T.StructField('column', T.StringType()),
+  T.StructField('kind', T.StringType()),
+  T.StructField('count', T.LongType()),
+  T.StructField('nulls', T.LongType()),
+  T.StructField('sum', T.DoubleType()),
+  T.StructField('sum_sq', T.DoubleType()),
+  T.StructField('min', T.DoubleType()),
+  T.StructField('max', T.DoubleType()),
+  T.StructField('edges', T.ArrayType(T.DoubleType())),
+  T.StructField('cum_counts', T.ArrayType(T.LongType())),
+  T.StructField('ones', T.LongType()),
+])
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Sketching a batch
+
+# COMMAND ----------
+
+def binary_columns(df, numeric_cols=monitored_numeric, exclude=('customerID',)):
+  # Every other numeric column is a one-hot flag, the label or a prediction
+  numeric_types = (T.IntegerType, T.LongType, T.ShortType, T.ByteType, T.DoubleType, T.FloatType, T.BooleanType)
+  return [f.name for f in df.schema.fields
+          if isinstance(f.dataType, numeric_types) and f.name not in numeric_cols and f.name not in exclude]
+
+
+def baseline_edges(df, numeric_cols=monitored_numeric, bins=20, relative_error=0.001):
+  # Cut points at the baseline's quantiles, so each bin holds ~1/bins of the baseline
+  probs = [i / bins for i in range(1, bins)]
+  quantiles = df.approxQuantile(list(numeric_cols), probs, relative_error)
+  return {c: sorted(set(q)) for c, q in zip(numeric_cols, quantiles)}
+
+
+def sketch_batch(df, edges, binary_cols):
+  # One aggregation over the batch for every column
+  exprs = []
+  for c in list(edges) + list(binary_cols):
+    x = F.col(f'`{c}`').cast('double')
+    exprs += [F.count(x).alias(f'{c}__count'),
+              F.sum(F.when(x.isNull(), 1).otherwise(0)).alias(f'{c}__nulls'),
+              F.sum(x).alias(f'{c}__sum'),
+              F.sum(x * x).alias(f'{c}__sum_sq'),
+              F.min(x).alias(f'{c}__min'),
+              F.max(x).alias(f'{c}__max')]
+  for c, cuts in edges.items():
+    x = F.col(f'`{c}`')
+    exprs += [F.sum(F.when(x <= e, 1).otherwise(0)).alias(f'{c}__le_{i}') for i, e in enumerate(cuts)]
+  for c in binary_cols:
+    exprs.append(F.sum(F.when(F.col(f'`{c}`') == 1, 1).otherwise(0)).alias(f'{c}__ones'))
+
+  row = df.agg(*exprs).first().asDict()
+  sketches = []
+  for c in list(edges) + list(binary_cols):
+    numeric = c in edges
+    sketches.append({'column': c,
+                     'kind': 'numeric' if numeric else 'binary',
+                     'count': row[f'{c}__count'],
+                     'nulls': row[f'{c}__nulls'] or 0,
+                     'sum': row[f'{c}__sum'],
+                     'sum_sq': row[f'{c}__sum_sq'],
+                     'min': row[f'{c}__min'],
+                     'max': row[f'{c}__max'],
+                     'edges': list(edges[c]) if numeric else None,
+                     'cum_counts': [row[f'{c}__le_{i}'] or 0 for i in range(len(edges[c]))] if numeric else None,
+                     'ones': None if numeric else row[f'{c}__ones'] or 0})
+  return sketches
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Persisting
+
+# COMMAND ----------
+
+def load_sketches(spark, sketches_table, source, batch_ids=None):
+  if table_version(spark, sketches_table) is None:
+    return []
+  rows = spark.table(sketches_table).where(F.col('source') == source)
+  if batch_ids is not None:
+    rows = rows.where(F.col('batch_id').isin(list(batch_ids)))
+  return [r.asDict() for r in rows.collect()]
+
+
+def record_sketches(spark, sketches_table, source, batch_id, df, source_version=None, numeric_cols=monitored_numeric,
+                    binary_cols=None, bins=20, replace=False):
+  # Appends the sketches of one batch; a batch that is already recorded is skipped unless `replace`
+  existing = load_sketches(spark, sketches_table, source, [batch_id])
+  if existing and not replace:
+    return {'source': source, 'batch_id': batch_id, 'action': 'exists', 'columns': len(existing)}
+
+  if batch_id == baseline_batch:
+    numeric_cols = [c for c in numeric_cols if c in df.columns]
+    edges = baseline_edges(df, numeric_cols, bins)
+    binary_cols = binary_cols if binary_cols is not None else binary_columns(df, numeric_cols)
+  else:
+    baseline = load_sketches(spark, sketches_table, source, [baseline_batch])
+    if not baseline:
+      raise ValueError(f'No baseline sketches for {source}; record batch_id={baseline_batch!r} first')
+    # Batches are always binned on the baseline's cut points, so they stay comparable
+    edges = {r['column']: r['edges'] for r in baseline if r['kind'] == 'numeric'}
+    binary_cols = [r['column'] for r in baseline if r['kind'] == 'binary']
+
+  created_at = datetime.now(timezone.utc).isoformat()
+  rows = [dict(s, source=source, batch_id=batch_id, source_version=source_version, created_at=created_at)
+          for s in sketch_batch(df, edges, binary_cols)]
+
+  if existing:
+    spark.sql(f"DELETE FROM {sketches_table} WHERE source = '{source}' AND batch_id = '{batch_id}'")
+  spark.createDataFrame(rows, sketch_schema).write.format('delta').mode('append').saveAsTable(sketches_table)
+  return {'source': source, 'batch_id': batch_id, 'action': 'replaced' if existing else 'recorded', 'columns': len(rows)}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Drift from sketches
+
+# COMMAND ----------
+
+def same_edges(a, b):
+  # Whether two sketches of a column were binned on the same cut points (always true for binary columns)
+  return a['kind'] != 'numeric' or list(a['edges'] or []) == list(b['edges'] or [])
+
+
+def merge_sketches(sketches):
+  # Sketches of the same column from several batches -> one sketch
+  merged = dict(sketches[0])
+  mixed = sorted({s['batch_id'] for s in sketches[1:] if not same_edges(merged, s)})
+  if mixed:
+    raise ValueError(f"Cannot merge sketches of {merged['column']} binned on different cut points: "
+                     f"{merged['batch_id']} vs {', '.join(mixed)}")
+  for s in sketches[1:]:
+    for k in ('count', 'nulls', 'sum', 'sum_sq'):
+      merged[k] = (merged[k] or 0) + (s[k] or 0)
+    merged['min'] = min(v for v in (merged['min'], s['min'], math.inf) if v is not None)
+    merged['max'] = max(v for v in (merged['max'], s['max'], -math.inf) if v is not None)
+    if merged['kind'] == 'numeric':
+      merged['cum_counts'] = [a + b for a, b in zip(merged['cum_counts'], s['cum_counts'])]
+    else:
+      merged['ones'] += s['ones']
+  return merged
+
+
+def _bin_shares(sketch):
+  n = sketch['count'] or 0
+  if not n:
+    return None
+  if sketch['kind'] == 'binary':
+    return [(n - sketch['ones']) / n, sketch['ones'] / n]
+  cum = list(sketch['cum_counts']) + [n]
+  return [(b - a) / n for a, b in zip([0] + cum[:-1], cum)]
+
+
+def population_stability_index(expected, actual, epsilon=1e-4):
+  return sum((a - e) * math.log(a / e) for e, a in ((max(e, epsilon), max(a, epsilon)) for e, a in zip(expected, actual)))
+
+
+def ks_statistic(expected, actual):
+  # Max gap between the two CDFs at the bin boundaries
+  gap, cdf_e, cdf_a = 0.0, 0.0, 0.0
+  for e, a in zip(expected, actual):
+    cdf_e, cdf_a = cdf_e + e, cdf_a + a
+    gap = max(gap, abs(cdf_e - cdf_a))
+  return gap
+
+
+def _moments(sketch):
+  n = sketch['count'] or 0
+  if not n:
+    return None, None
+  mean = sketch['sum'] / n
+  return mean, max(sketch['sum_sq'] / n - mean * mean, 0.0)
+
+
+def drift_report(spark, sketches_table, source, batch_ids=None):
+  # PSI/KS of the merged batches (default: the latest one) against the baseline, per column
+  sketches = load_sketches(spark, sketches_table, source)
+  baseline = {s['column']: s for s in sketches if s['batch_id'] == baseline_batch}
+  batches = [s for s in sketches if s['batch_id'] != baseline_batch]
+  if not baseline or not batches:
+    return []
+  if batch_ids is None:
+    batch_ids = [max(batches, key=lambda s: s['created_at'])['batch_id']]
+
+  report = []
+  for column, base in baseline.items():
+    current = [s for s in batches if s['column'] == column and s['batch_id'] in batch_ids]
+    # Batches sketched before the baseline was replaced are binned on its old cut points
+    stale = sorted(s['batch_id'] for s in current if not same_edges(base, s))
+    current = [s for s in current if same_edges(base, s)]
+    if not current:
+      if stale:
+        report.append({'source': source, 'batches': '', 'stale_batches': ','.join(stale), 'column': column,
+                       'kind': base['kind'], 'rows': None, 'null_rate': None, 'baseline_mean': None, 'mean': None,
+                       'baseline_std': None, 'std': None, 'psi': None, 'ks': None, 'status': 'stale'})
+      continue
+    used = sorted(s['batch_id'] for s in current)
+    current = merge_sketches(current)
+    expected, actual = _bin_shares(base), _bin_shares(current)
+    if expected is None or actual is None:
+      continue
+    psi = population_stability_index(expected, actual)
+    base_mean, base_var = _moments(base)
+    mean, var = _moments(current)
+    report.append({'source': source,
+                   'batches': ','.join(used),
+                   'stale_batches': ','.join(stale),
+                   'column': column,
+                   'kind': base['kind'],
+                   'rows': current['count'],
+                   'null_rate': current['nulls'] / max(current['count'] + current['nulls'], 1),
+                   'baseline_mean': base_mean,
+                   'mean': mean,
+                   'baseline_std': math.sqrt(base_var),
+                   'std': math.sqrt(var),
+                   'psi': psi,
+                   'ks': ks_statistic(expected, actual),
+                   'status': 'stable' if psi < psi_thresholds[0] else 'moderate' if psi < psi_thresholds[1] else 'significant'})
+  return sorted(report, key=lambda r: -r['psi'] if r['psi'] is not None else math.inf)
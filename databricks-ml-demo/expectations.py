@@ -0,0 +1,252 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Data-quality expectations
+# MAGIC
+# MAGIC Declarative checks for `bronze_customers` and `churn_features`, evaluated in one Spark aggregation per table rather than one count or filter query per rule.
+# MAGIC
+# MAGIC - A rule is a small dict built by `max_null_rate`, `in_domain`, `in_range`, `unique` or `row_count_change`. `bronze_expectations` and `feature_expectations` are the rule sets for the two tables.
+# MAGIC - `evaluate_expectations` compiles every rule into aggregate expressions (null counts, out-of-domain and out-of-range counts, min/max, distinct count) and runs them as a single `agg`, so a table is scanned once whatever the number of rules.
+# MAGIC - `check_table` stores one result row per rule in a Delta table, keyed by the table and its Delta version. A version already checked is not scanned again. `row_count_change` compares with the row count stored for the last earlier version.
+# MAGIC - `check_dataframe` runs the same rules on a DataFrame before it overwrites a table that other stages read, so a failing batch never becomes the live version. `record_results` then stores its results against the version the write created.
+# MAGIC - Rules have a severity. A failed `error` rule raises `ExpectationsFailed` when `gate=True`, so the downstream stage does not run; failed `warn` rules are only recorded.
+
+# COMMAND ----------
+
+# MAGIC %run ./snapshots
+
+# COMMAND ----------
+
+from datetime import datetime, timezone
+
+from pyspark.sql import functions as F
+from pyspark.sql import types as T
+
+if 'table_version' not in globals():
+  from snapshots import table_version
+
+results_schema = T.StructType([
+  T.StructField('table', T.StringType()),
+  T.StructField('table_version', T.LongType()),
+  T.StructField('checked_at', T.StringType()),
+  T.StructField('rule', T.StringType()),
+  T.StructField('column', T.StringType()),
+  T.StructField('severity', T.StringType()),
+  T.StructField('observed', T.DoubleType()),
+  T.StructField('threshold', T.StringType()),
+  T.StructField('passed', T.BooleanType()),
+  T.StructField('detail', T.StringType()),
+])
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Rules
+
+# COMMAND ----------
+
+def max_null_rate(column, rate=0.0, severity='error'):
+  return {'rule': 'max_null_rate', 'column': column, 'rate': rate, 'severity': severity}
+
+
+def in_domain(column, values, severity='error'):
+  # Nulls are left to max_null_rate
+  return {'rule': 'in_domain', 'column': column, 'values': list(values), 'severity': severity}
+
+
+def in_range(column, min_value=None, max_value=None, severity='error'):
+  return {'rule': 'in_range', 'column': column, 'min': min_value, 'max': max_value, 'severity': severity}
+
+
+def unique(column, severity='error'):
+  return {'rule': 'unique', 'column': column, 'severity': severity}
+
+
+def row_count_change(max_change=0.5, min_rows=1, severity='error'):
+  # Relative change from the last version checked, and a floor on the row count
+  return {'rule': 'row_count_change', 'column': None, 'max_change': max_change, 'min_rows': min_rows,
+          'severity': severity}
+
+_yes_no = ['Yes', 'No']
+_internet_addon = ['Yes', 'No', 'No internet service']
+
+bronze_expectations = [
+  max_null_rate('customerID'),
+  unique('customerID'),
+  in_domain('gender', ['Male', 'Female']),
+  in_domain('seniorCitizen', [0.0, 1.0]),
+  *[in_domain(c, _yes_no) for c in ('partner', 'dependents', 'phoneService', 'paperlessBilling', 'churnString')],
+  in_domain('multipleLines', ['Yes', 'No', 'No phone service']),
+  in_domain('internetService', ['DSL', 'Fiber optic', 'No']),
+  *[in_domain(c, _internet_addon) for c in ('onlineSecurity', 'onlineBackup', 'deviceProtection', 'techSupport',
+                                           'streamingTV', 'streamingMovies')],
+  in_domain('contract', ['Month-to-month', 'One year', 'Two year']),
+  in_domain('paymentMethod', ['Electronic check', 'Mailed check', 'Bank transfer (automatic)',
+                              'Credit card (automatic)']),
+  in_range('tenure', 0, 120),
+  in_range('monthlyCharges', 0, 1000),
+  in_range('totalCharges', 0, None),
+  # Brand-new customers have no TotalCharges yet; they should be rare
+  max_null_rate('totalCharges', 0.01, severity='warn'),
+  row_count_change(0.5),
+]
+
+
+def feature_expectations(columns):
+  # The one-hot columns depend on the categories seen, so the rule set is built from the table's columns
+  one_hot = [c for c in columns if '_' in c and c != 'customerID']
+  return [max_null_rate('customerID'),
+          unique('customerID'),
+          in_domain('churn', [0, 1]),
+          *[max_null_rate(c) for c in ('tenure', 'monthlyCharges', 'totalCharges') if c in columns],
+          in_range('tenure', 0, 120),
+          in_range('monthlyCharges', 0, 1000),
+          *[in_domain(c, [0, 1]) for c in one_hot],
+          row_count_change(0.5)]
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Evaluation
+
+# COMMAND ----------
+
+def _aggregates(rule, i):
+  # Aggregate expressions for one rule, aliased r<i>__<stat>
+  col = F.col(f"`{rule['column']}`") if rule['column'] else None
+  name = rule['rule']
+  if name == 'max_null_rate':
+    return [F.sum(col.isNull().cast('long')).alias(f'r{i}__nulls')]
+  if name == 'in_domain':
+    return [F.sum((col.isNotNull() & ~col.isin(*rule['values'])).cast('long')).alias(f'r{i}__outside')]
+  if name == 'in_range':
+    outside = F.lit(False)
+    if rule['min'] is not None:
+      outside = outside | (col < rule['min'])
+    if rule['max'] is not None:
+      outside = outside | (col > rule['max'])
+    return [F.sum(F.coalesce(outside, F.lit(False)).cast('long')).alias(f'r{i}__outside'),
+            F.min(col).cast('double').alias(f'r{i}__min'), F.max(col).cast('double').alias(f'r{i}__max')]
+  if name == 'unique':
+    return [F.count(col).alias(f'r{i}__values'), F.countDistinct(col).alias(f'r{i}__distinct')]
+  if name == 'row_count_change':
+    return []
+  raise ValueError(f'Unknown expectation {name!r}')
+
+
+def _result(rule, i, row, rows, previous_rows):
+  name = rule['rule']
+  if name == 'max_null_rate':
+    observed = (row[f'r{i}__nulls'] or 0) / rows if rows else 0.0
+    return observed, str(rule['rate']), observed <= rule['rate'], f"{row[f'r{i}__nulls'] or 0} nulls"
+  if name == 'in_domain':
+    outside = row[f'r{i}__outside'] or 0
+    return float(outside), str(rule['values']), outside == 0, f'{outside} values outside the domain'
+  if name == 'in_range':
+    outside = row[f'r{i}__outside'] or 0
+    return (float(outside), f"[{rule['min']}, {rule['max']}]", outside == 0,
+            f"{outside} values out of range, min {row[f'r{i}__min']}, max {row[f'r{i}__max']}")
+  if name == 'unique':
+    duplicates = (row[f'r{i}__values'] or 0) - (row[f'r{i}__distinct'] or 0)
+    return float(duplicates), '0', duplicates == 0, f'{duplicates} duplicate values'
+  # row_count_change
+  if rows < rule['min_rows']:
+    return float(rows), f"min_rows {rule['min_rows']}", False, f'{rows} rows'
+  if not previous_rows:
+    return None, str(rule['max_change']), True, f'{rows} rows, no earlier version checked'
+  change = abs(rows - previous_rows) / previous_rows
+  return change, str(rule['max_change']), change <= rule['max_change'], f'{previous_rows} -> {rows} rows'
+
+
+def evaluate_expectations(df, rules, previous_rows=None):
+  # One aggregation for all rules -> (row count, [result dicts])
+  missing = sorted({r['column'] for r in rules if r['column'] and r['column'] not in df.columns})
+  rules = [r for r in rules if not r['column'] or r['column'] in df.columns]
+  exprs = [F.count(F.lit(1)).alias('rows')] + [e for i, r in enumerate(rules) for e in _aggregates(r, i)]
+  row = df.agg(*exprs).first().asDict()
+  rows = row['rows']
+
+  results = [{'rule': 'column_present', 'column': c, 'severity': 'error', 'observed': None, 'threshold': None,
+              'passed': False, 'detail': 'column missing'} for c in missing]
+  for i, rule in enumerate(rules):
+    observed, threshold, passed, detail = _result(rule, i, row, rows, previous_rows)
+    results.append({'rule': rule['rule'], 'column': rule['column'], 'severity': rule['severity'],
+                    'observed': observed, 'threshold': threshold, 'passed': bool(passed), 'detail': detail})
+  return rows, results
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Per-version results and gating
+
+# COMMAND ----------
+
+class ExpectationsFailed(ValueError):
+
+  def __init__(self, table, version, failures):
+    super().__init__(f'{table} v{version}: {len(failures)} expectation(s) failed: '
+                     + '; '.join(f"{f['rule']}({f['column'] or ''}) {f['detail']}" for f in failures[:5]))
+    self.failures = failures
+
+
+def load_results(spark, results_table, table, version=None):
+  if table_version(spark, results_table) is None:
+    return []
+  rows = spark.table(results_table).where(F.col('table') == table)
+  if version is not None:
+    rows = rows.where(F.col('table_version') == version)
+  return [r.asDict() for r in rows.collect()]
+
+
+def _previous_row_count(spark, results_table, table, version):
+  if table_version(spark, results_table) is None:
+    return None
+  row = (spark.table(results_table)
+         .where((F.col('table') == table) & (F.col('rule') == 'row_count') & (F.col('table_version') < version))
+         .orderBy(F.col('table_version').desc()).select('observed').first())
+  return int(row['observed']) if row else None
+
+
+def record_results(spark, table, version, results_table, rows, results):
+  # Stores evaluated results against one version of `table`
+  checked_at = datetime.now(timezone.utc).isoformat()
+  # The row count itself is kept as a passing result, so the next version can compare with it
+  results = [dict(r, table=table, table_version=version, checked_at=checked_at) for r in results] + [
+    {'table': table, 'table_version': version, 'checked_at': checked_at, 'rule': 'row_count', 'column': None,
+     'severity': 'info', 'observed': float(rows), 'threshold': None, 'passed': True, 'detail': f'{rows} rows'}]
+  spark.createDataFrame(results, results_schema).write.format('delta').mode('append').saveAsTable(results_table)
+  return results
+
+
+def _gate(table, version, action, results, gate):
+  failures = [r for r in results if not r['passed'] and r['severity'] == 'error']
+  report = {'table': table, 'table_version': version, 'action': action,
+            'rules': sum(1 for r in results if r['rule'] != 'row_count'), 'failed': len(failures),
+            'warnings': sum(1 for r in results if not r['passed'] and r['severity'] == 'warn')}
+  if failures and gate:
+    raise ExpectationsFailed(table, version, failures)
+  return report
+
+
+def check_table(spark, table, results_table, rules=None, version=None, gate=True):
+  # Evaluates `rules` on one Delta version of `table` (latest by default) and records the results for that version
+  version = version if version is not None else table_version(spark, table)
+  df = spark.read.option('versionAsOf', version).table(table)
+  rules = rules if rules is not None else feature_expectations(df.columns)
+
+  results = load_results(spark, results_table, table, version)
+  action = 'exists'
+  if not results:
+    rows, results = evaluate_expectations(df, rules, _previous_row_count(spark, results_table, table, version))
+    results = record_results(spark, table, version, results_table, rows, results)
+    action = 'recorded'
+  return _gate(table, version, action, results, gate), results
+
+
+def check_dataframe(spark, df, table, results_table, rules=None, gate=True):
+  # Evaluates `rules` on `df` as the next version of `table`, before it is written -> (report, (rows, results))
+  # Nothing is recorded yet; pass the results to record_results once the write has made the version
+  current = table_version(spark, table)
+  next_version = current + 1 if current is not None else 0
+  rules = rules if rules is not None else feature_expectations(df.columns)
+  rows, results = evaluate_expectations(df, rules, _previous_row_count(spark, results_table, table, next_version))
+  return _gate(table, next_version, 'evaluated', results, gate), (rows, results)
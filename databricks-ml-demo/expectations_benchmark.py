@@ -0,0 +1,80 @@
+# Local check of the single-pass expectations engine (expectations.py).
+#
+# Ingests the Telco CSV into bronze on local Spark (optionally scaled up, as in pipeline_benchmark) and
+#   1. evaluates bronze_expectations on clean bronze and expects every error rule to pass,
+#   2. injects one defect per kind (duplicate customerID, null customerID, unknown category, negative tenure)
+#      and expects each to be caught by its rule,
+#   3. times the single aggregation against running every rule as its own query (one scan per rule),
+# and prints the results as JSON. Exits non-zero if a defect is missed or clean data fails.
+#
+#   python expectations_benchmark.py --rows 1000000
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import expectations
+import pipeline_stages as stages
+from pipeline_benchmark import scale_telco_csv, telco_csv
+
+
+def failed_rules(results):
+  return sorted({(r['rule'], r['column']) for r in results if not r['passed'] and r['severity'] == 'error'})
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Expectations: one aggregation pass vs one query per rule')
+  parser.add_argument('--rows', type=int, default=1000000)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  from pyspark.sql import functions as F
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-expectations-')
+  spark = stages.local_spark('churn-expectations')
+  csv_path = scale_telco_csv(telco_csv, os.path.join(workdir, f'telco_{args.rows}.csv'), args.rows)
+  bronze, _ = stages.ingest_bronze(spark, csv_path, os.path.join(workdir, 'bronze'))
+  rows = bronze.count()
+  rules = [r for r in expectations.bronze_expectations if r['rule'] != 'row_count_change']
+
+  started = time.perf_counter()
+  _, clean_results = expectations.evaluate_expectations(bronze, rules)
+  single_pass_seconds = time.perf_counter() - started
+
+  started = time.perf_counter()
+  for i, rule in enumerate(rules):
+    bronze.agg(F.count(F.lit(1)).alias('rows'), *expectations._aggregates(rule, i)).first()
+  per_rule_seconds = time.perf_counter() - started
+
+  sample = bronze.limit(1)
+  defects = {
+    ('unique', 'customerID'): bronze.unionByName(sample),
+    ('max_null_rate', 'customerID'): bronze.unionByName(sample.withColumn('customerID', F.lit(None).cast('string'))),
+    ('in_domain', 'contract'): bronze.unionByName(sample.withColumn('customerID', F.lit('x-contract'))
+                                                  .withColumn('contract', F.lit('Three year'))),
+    ('in_range', 'tenure'): bronze.unionByName(sample.withColumn('customerID', F.lit('x-tenure'))
+                                               .withColumn('tenure', F.lit(-1.0))),
+  }
+  caught = {}
+  for (rule, column), df in defects.items():
+    _, results = expectations.evaluate_expectations(df, rules)
+    caught[f'{rule}({column})'] = (rule, column) in failed_rules(results)
+
+  report = {'rows': rows, 'rules': len(rules),
+            'clean_failures': [f'{rule}({column})' for rule, column in failed_rules(clean_results)],
+            'defects_caught': caught,
+            'single_pass_seconds': round(single_pass_seconds, 3),
+            'one_query_per_rule_seconds': round(per_rule_seconds, 3),
+            'speedup': round(per_rule_seconds / single_pass_seconds, 2) if single_pass_seconds else None}
+  print(json.dumps(report, indent=2))
+  if report['clean_failures'] or not all(caught.values()):
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
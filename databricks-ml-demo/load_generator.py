@@ -0,0 +1,366 @@
+# Load generator for churn scoring endpoints (the serving endpoint behind `score_model` in 08, `mlflow models serve`,
+# or the stand-in server below).
+#
+# Sends `dataframe_split` payloads built from feature rows (a CSV or Parquet export of churn_features, or a model's
+# input_example) through a list of stages, each one either
+#   open loop:   requests start on a fixed schedule at the target rate, whatever the endpoint does. Latency is
+#                measured from the scheduled start, so queueing behind a slow endpoint is counted (no coordinated
+#                omission); service time, from the actual send, is reported next to it.
+#   closed loop: a fixed number of workers each send the next request as soon as the previous one returns.
+# Stages run in order, so a list of rising rates or concurrencies is the ramp-up. For every stage it reports
+# throughput, error rate by status and latency percentiles from a log-linear histogram (HdrHistogram-style,
+# fixed relative precision), and writes a JSON report that can be compared with a previous one.
+#
+#   python load_generator.py --stand-in --open 20 50 100 --stage-seconds 20
+#   python load_generator.py --url https://<workspace>/serving-endpoints/<name>/invocations --token $TOKEN \
+#     --rows churn_features.csv --closed 1 4 16 --output load.json --baseline previous.json
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+here = os.path.dirname(os.path.abspath(__file__))
+percentiles = [50, 90, 99, 99.9]
+
+# Anything within this of the baseline is noise
+min_regression_ms = 5.0
+
+
+class LatencyHistogram:
+  # Values in microseconds, kept with `significant_digits` of relative precision in log-linear buckets, like
+  # HdrHistogram: mergeable, constant memory, and percentiles without keeping every sample
+
+  def __init__(self, significant_digits=2):
+    self.sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+    self.counts = Counter()
+    self.total = 0
+    self.max = 0
+    self.sum = 0
+
+  def _key(self, value):
+    shift = max(value.bit_length() - self.sub_bucket_bits, 0)
+    return shift, value >> shift
+
+  def record(self, seconds):
+    value = max(int(seconds * 1e6), 1)
+    self.counts[self._key(value)] += 1
+    self.total += 1
+    self.sum += value
+    self.max = max(self.max, value)
+
+  def merge(self, other):
+    self.counts.update(other.counts)
+    self.total += other.total
+    self.sum += other.sum
+    self.max = max(self.max, other.max)
+
+  def percentile_ms(self, p):
+    if not self.total:
+      return None
+    target = math.ceil(self.total * p / 100)
+    seen = 0
+    for shift, sub in sorted(self.counts, key=lambda k: k[1] << k[0]):
+      seen += self.counts[(shift, sub)]
+      if seen >= target:
+        # Upper edge of the bucket, capped at the largest value seen
+        return min(((sub + 1) << shift) - 1, self.max) / 1000
+    return self.max / 1000
+
+  def summary(self):
+    s = {f'p{p:g}_ms': self.percentile_ms(p) for p in percentiles}
+    s.update(mean_ms=round(self.sum / self.total / 1000, 3) if self.total else None, max_ms=self.max / 1000)
+    return s
+
+# Payloads
+
+def _number(value):
+  try:
+    return int(value)
+  except ValueError:
+    try:
+      return float(value)
+    except ValueError:
+      return value
+
+
+def load_rows(path, drop=('churn', 'Churn')):
+  # (columns, rows) from a CSV or Parquet export of churn_features, or an MLflow input_example.json
+  if path.endswith('.json'):
+    with open(path) as f:
+      example = json.load(f)
+    example = example.get('dataframe_split', example)
+    columns, rows = example['columns'], example['data']
+  elif path.endswith('.parquet'):
+    import pandas as pd
+    pdf = pd.read_parquet(path)
+    columns, rows = list(pdf.columns), pdf.values.tolist()
+  else:
+    with open(path, newline='') as f:
+      reader = csv.reader(f)
+      columns = next(reader)
+      rows = [[_number(v) for v in row] for row in reader]
+  keep = [i for i, c in enumerate(columns) if c not in drop]
+  return [columns[i] for i in keep], [[row[i] for i in keep] for row in rows]
+
+
+def make_payloads(columns, rows, rows_per_request=1, count=1000, seed=42):
+  rng = random.Random(seed)
+  return [json.dumps({'dataframe_split': {'columns': columns, 'data': rng.choices(rows, k=rows_per_request)}}).encode()
+          for _ in range(count)]
+
+# Sending
+
+class Stage:
+
+  def __init__(self, mode, level, seconds):
+    self.mode, self.level, self.seconds = mode, level, seconds
+    self.latency = LatencyHistogram()
+    self.service_time = LatencyHistogram()
+    self.statuses = Counter()
+    self.started_requests = 0
+    self._lock = threading.Lock()
+
+  def record(self, status, latency, service_time):
+    with self._lock:
+      self.statuses[status] += 1
+      self.latency.record(latency)
+      self.service_time.record(service_time)
+
+  def report(self, elapsed):
+    completed = sum(self.statuses.values())
+    errors = sum(n for status, n in self.statuses.items() if status != 200)
+    return {'mode': self.mode,
+            'target': self.level,
+            'seconds': round(elapsed, 3),
+            'requests': completed,
+            'not_completed': self.started_requests - completed,
+            'throughput_rps': round(completed / elapsed, 2) if elapsed else None,
+            'error_rate': round(errors / completed, 4) if completed else None,
+            'statuses': {str(k): v for k, v in sorted(self.statuses.items(), key=str)},
+            'latency': self.latency.summary(),
+            'service_time': self.service_time.summary()}
+
+
+def send(url, payload, headers, timeout):
+  request = urllib.request.Request(url, data=payload, headers=headers, method='POST')
+  try:
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+      response.read()
+      return response.status
+  except urllib.error.HTTPError as e:
+    return e.code
+  except (urllib.error.URLError, OSError) as e:
+    return type(getattr(e, 'reason', e)).__name__
+
+
+def run_open_loop(stage, url, payloads, headers, timeout, max_in_flight):
+  # Starts are scheduled at a fixed rate; a request waiting for a free sender still counts from its scheduled time
+  interval = 1 / stage.level
+  pool = ThreadPoolExecutor(max_workers=max_in_flight)
+  started = time.perf_counter()
+  i = 0
+  while True:
+    scheduled = started + i * interval
+    if scheduled - started >= stage.seconds:
+      break
+    time.sleep(max(scheduled - time.perf_counter(), 0))
+    payload = payloads[i % len(payloads)]
+
+    def call(scheduled=scheduled, payload=payload):
+      sent = time.perf_counter()
+      status = send(url, payload, headers, timeout)
+      done = time.perf_counter()
+      stage.record(status, done - scheduled, done - sent)
+
+    pool.submit(call)
+    stage.started_requests += 1
+    i += 1
+  pool.shutdown(wait=True)
+  return time.perf_counter() - started
+
+
+def run_closed_loop(stage, url, payloads, headers, timeout):
+  started = time.perf_counter()
+  deadline = started + stage.seconds
+  counter = iter(range(sys.maxsize))
+  counter_lock = threading.Lock()
+
+  def worker():
+    while time.perf_counter() < deadline:
+      with counter_lock:
+        i = next(counter)
+        stage.started_requests += 1
+      sent = time.perf_counter()
+      status = send(url, payloads[i % len(payloads)], headers, timeout)
+      elapsed = time.perf_counter() - sent
+      stage.record(status, elapsed, elapsed)
+
+  threads = [threading.Thread(target=worker, daemon=True) for _ in range(int(stage.level))]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  return time.perf_counter() - started
+
+
+def run_stages(url, payloads, stages, headers=None, timeout=30, max_in_flight=256, warmup_seconds=0):
+  headers = {'Content-Type': 'application/json', **(headers or {})}
+  if warmup_seconds:
+    run_closed_loop(Stage('closed', 1, warmup_seconds), url, payloads, headers, timeout)
+  reports = []
+  for stage in stages:
+    if stage.mode == 'open':
+      elapsed = run_open_loop(stage, url, payloads, headers, timeout, max_in_flight)
+    else:
+      elapsed = run_closed_loop(stage, url, payloads, headers, timeout)
+    reports.append(stage.report(elapsed))
+    print('{mode} {target:g}: {throughput_rps} rps, p99 {p99} ms, errors {error_rate}'.format(
+      p99=reports[-1]['latency']['p99_ms'], **reports[-1]))
+  return reports
+
+# Local stand-in server
+
+def start_stand_in(latency_ms=20.0, row_ms=0.1, model_uri=None, port=0, capture=None):
+  # Answers POST /invocations like a serving endpoint: a fixed delay plus a per-row cost, or a real pyfunc model.
+  # With a RequestCapture (see request_capture), every request and its predictions are recorded for replay
+  model = None
+  if model_uri:
+    import mlflow.pyfunc
+    model = mlflow.pyfunc.load_model(model_uri)
+
+  class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+      started = time.perf_counter()
+      body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+      split = body['dataframe_split']
+      if model is not None:
+        import pandas as pd
+        predictions = [p.item() if hasattr(p, 'item') else p
+                       for p in model.predict(pd.DataFrame(split['data'], columns=split['columns']))]
+      else:
+        time.sleep((latency_ms + row_ms * len(split['data'])) / 1000)
+        predictions = [0] * len(split['data'])
+      if capture is not None:
+        capture.record(split['columns'], split['data'], predictions, (time.perf_counter() - started) * 1000,
+                       served_version=model_uri or 'stand-in')
+      response = json.dumps({'predictions': predictions}).encode()
+      self.send_response(200)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(response)))
+      self.end_headers()
+      self.wfile.write(response)
+
+    def log_message(self, *args):
+      pass
+
+  server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server, f'http://127.0.0.1:{server.server_address[1]}/invocations'
+
+# Reports
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=here, stderr=subprocess.DEVNULL, text=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare_reports(current, baseline, threshold=0.2):
+  # Same stage (mode and target) slower at p99, lower throughput or more errors than the baseline
+  base = {(s['mode'], s['target']): s for s in baseline['stages']}
+  regressions = []
+  for s in current['stages']:
+    b = base.get((s['mode'], s['target']))
+    if not b:
+      continue
+    old, new = b['latency']['p99_ms'], s['latency']['p99_ms']
+    if old and new and new - old > min_regression_ms and new > old * (1 + threshold):
+      regressions.append({'stage': f"{s['mode']} {s['target']:g}", 'metric': 'p99_ms', 'baseline': old, 'current': new})
+    old, new = b['throughput_rps'], s['throughput_rps']
+    if old and new is not None and new < old * (1 - threshold):
+      regressions.append({'stage': f"{s['mode']} {s['target']:g}", 'metric': 'throughput_rps', 'baseline': old,
+                          'current': new})
+    old, new = b['error_rate'] or 0, s['error_rate'] or 0
+    if new > old + 0.01:
+      regressions.append({'stage': f"{s['mode']} {s['target']:g}", 'metric': 'error_rate', 'baseline': old,
+                          'current': new})
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Open- and closed-loop load generator for churn scoring endpoints')
+  target = parser.add_mutually_exclusive_group(required=True)
+  target.add_argument('--url', help='invocations URL of the endpoint')
+  target.add_argument('--stand-in', action='store_true', help='start a local stand-in server and load it')
+  parser.add_argument('--token', default=os.environ.get('DATABRICKS_TOKEN'), help='bearer token (default: $DATABRICKS_TOKEN)')
+  parser.add_argument('--rows', default=os.path.join(here, 'Telco-Customer-Churn.csv'),
+                      help='CSV/Parquet export of churn_features, or an input_example.json')
+  parser.add_argument('--rows-per-request', type=int, default=1)
+  loop = parser.add_mutually_exclusive_group(required=True)
+  loop.add_argument('--open', type=float, nargs='+', metavar='RPS', help='open-loop stages, in requests per second')
+  loop.add_argument('--closed', type=int, nargs='+', metavar='WORKERS', help='closed-loop stages, in concurrent workers')
+  parser.add_argument('--stage-seconds', type=float, default=30)
+  parser.add_argument('--warmup-seconds', type=float, default=5)
+  parser.add_argument('--timeout', type=float, default=30)
+  parser.add_argument('--max-in-flight', type=int, default=256, help='open loop: most requests outstanding at once')
+  parser.add_argument('--stand-in-latency-ms', type=float, default=20)
+  parser.add_argument('--stand-in-model', default=None, help='model URI the stand-in scores with, instead of sleeping')
+  parser.add_argument('--capture-dir', default=None, help='record the stand-in\'s traffic here, for request_replay.py')
+  parser.add_argument('--output', default='load_report.json')
+  parser.add_argument('--baseline', default=None, help='report from a previous run to check for regressions')
+  parser.add_argument('--threshold', type=float, default=0.2)
+  args = parser.parse_args(argv)
+
+  url = args.url
+  capture = None
+  if args.stand_in:
+    if args.capture_dir:
+      import request_capture
+      capture = request_capture.RequestCapture(args.capture_dir)
+    _, url = start_stand_in(args.stand_in_latency_ms, model_uri=args.stand_in_model, capture=capture)
+  headers = {'Authorization': f'Bearer {args.token}'} if args.token and not args.stand_in else {}
+
+  columns, rows = load_rows(args.rows)
+  payloads = make_payloads(columns, rows, args.rows_per_request)
+  stages = ([Stage('open', rate, args.stage_seconds) for rate in args.open] if args.open
+            else [Stage('closed', workers, args.stage_seconds) for workers in args.closed])
+
+  report = {'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'url': 'stand-in' if args.stand_in else url,
+            'rows_per_request': args.rows_per_request,
+            'stages': run_stages(url, payloads, stages, headers, args.timeout, args.max_in_flight, args.warmup_seconds)}
+  if capture is not None:
+    capture.close()
+    report['capture'] = capture.stats()
+  with open(args.output, 'w') as f:
+    json.dump(report, f, indent=2)
+  print(f'Wrote {args.output}')
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      regressions = compare_reports(report, json.load(f), args.threshold)
+    for r in regressions:
+      print('REGRESSION {stage} {metric}: {baseline} -> {current}'.format(**r))
+    if regressions:
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,116 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Champion/challenger scoring
+# MAGIC
+# MAGIC Scores several registered versions of a model in one pass over the features. The model artifacts are downloaded once on the driver and shipped to the executors with `addFile`. A single `mapInPandas` then loads every model once per task and runs each Arrow batch through all of them. The feature scan and the write happen once; only the `predict` calls grow with the number of models.
+# MAGIC
+# MAGIC The output keeps the key, the label and one `prediction_<alias>` column per model, side by side. `comparison_stats` turns that into per-model positive rate, accuracy, precision and lift, and agreement with the champion, all in one aggregation.
+
+# COMMAND ----------
+
+import os
+import tempfile
+
+from pyspark.sql import functions as F
+from pyspark.sql import types as T
+
+# COMMAND ----------
+
+def resolve_model_versions(client, model_name, refs):
+  # 'Production' / 'Staging' -> latest version in that stage; '3' -> version 3. Returns {alias: models:/ uri}
+  uris = {}
+  for ref in refs:
+    ref = ref.strip()
+    if ref.isdigit():
+      version = ref
+      alias = f'v{ref}'
+    else:
+      latest = client.get_latest_versions(model_name, [ref])
+      if not latest:
+        raise ValueError(f'{model_name} has no version in stage {ref}')
+      version = latest[0].version
+      alias = ref.lower()
+    uris[alias] = f'models:/{model_name}/{version}'
+  return uris
+
+
+def prediction_col(alias):
+  return f'prediction_{alias}'
+
+
+def _ship_models(spark, model_uris):
+  # Download each model once on the driver and make it available to every executor
+  import mlflow
+
+  shipped = {}
+  for alias, uri in model_uris.items():
+    # Ship the (uniquely named) download directory; the model may sit in a subdirectory of it
+    root = tempfile.mkdtemp(prefix=f'churn-{alias}-')
+    local = mlflow.artifacts.download_artifacts(artifact_uri=uri, dst_path=root)
+    spark.sparkContext.addFile(root, recursive=True)
+    shipped[alias] = (os.path.basename(root), os.path.relpath(local, root))
+  return shipped
+
+# COMMAND ----------
+
+def score_models(spark, features, model_uris, key_cols=('customerID',), label_col='churn'):
+  keep_cols = [c for c in list(key_cols) + [label_col] if c in features.columns]
+  shipped = _ship_models(spark, model_uris)
+  schema = T.StructType([features.schema[c] for c in keep_cols]
+                        + [T.StructField(prediction_col(alias), T.DoubleType()) for alias in model_uris])
+
+  def predict_all(batches):
+    import mlflow
+    import numpy as np
+    from pyspark import SparkFiles
+
+    # Once per task, not per batch
+    models = {alias: mlflow.pyfunc.load_model(os.path.join(SparkFiles.get(root), path))
+              for alias, (root, path) in shipped.items()}
+    for pdf in batches:
+      out = pdf[keep_cols].copy()
+      for alias, model in models.items():
+        out[prediction_col(alias)] = np.asarray(model.predict(pdf)).astype('float64')
+      yield out
+
+  return features.mapInPandas(predict_all, schema)
+
+
+def comparison_stats(scored, aliases, champion=None, label_col='churn'):
+  # One aggregation for every model: positive rate, and accuracy/precision/lift when the label is present
+  champion = champion or aliases[0]
+  labelled = label_col in scored.columns
+  label = F.col(label_col).cast('double') if labelled else None
+  exprs = [F.count(F.lit(1)).alias('rows')]
+  if labelled:
+    exprs.append(F.sum(label).alias('label_positives'))
+  for alias in aliases:
+    pred = F.col(prediction_col(alias))
+    exprs += [F.sum(pred).alias(f'{alias}__positives'),
+              F.sum((pred == F.col(prediction_col(champion))).cast('int')).alias(f'{alias}__agree')]
+    if labelled:
+      exprs += [F.sum((pred == label).cast('int')).alias(f'{alias}__correct'),
+                F.sum(pred * label).alias(f'{alias}__true_positives')]
+  totals = scored.agg(*exprs).first().asDict()
+
+  rows = totals['rows'] or 0
+  stats = []
+  for alias in aliases:
+    positives = totals[f'{alias}__positives'] or 0
+    s = {'model': alias,
+         'rows': rows,
+         'positive_rate': positives / rows if rows else None,
+         'agreement_with_champion': (totals[f'{alias}__agree'] or 0) / rows if rows else None}
+    if labelled:
+      base_rate = (totals['label_positives'] or 0) / rows if rows else 0
+      precision = (totals[f'{alias}__true_positives'] or 0) / positives if positives else None
+      s.update(accuracy=(totals[f'{alias}__correct'] or 0) / rows if rows else None,
+               precision=precision,
+               lift=precision / base_rate if precision is not None and base_rate else None)
+    stats.append(s)
+
+  if labelled:
+    champion_accuracy = next(s['accuracy'] for s in stats if s['model'] == champion)
+    for s in stats:
+      s['accuracy_vs_champion'] = s['accuracy'] - champion_accuracy if s['accuracy'] is not None else None
+  return stats
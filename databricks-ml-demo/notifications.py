@@ -0,0 +1,162 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Notifications
+# MAGIC
+# MAGIC A background dispatcher for validation and registry notifications (the Slack post in `05`), so a slow or failing webhook never blocks or aborts the transition it reports on.
+# MAGIC
+# MAGIC - `Notifier.notify` only puts the event on a bounded queue and returns. When the queue is full the oldest event is dropped and counted, the caller never waits.
+# MAGIC - Events with the same key, e.g. `(model_name, version)`, that arrive within `batch_seconds` of each other are combined into one message.
+# MAGIC - Messages go out at most `rate_per_second` (a token bucket), and a failed send (an exception, 429 or 5xx) is retried up to `max_retries` times with exponential backoff, honouring `Retry-After`. Other 4xx responses are not retried.
+# MAGIC - A sink is any callable that takes the message body and returns an HTTP status, or `(status, retry_after_seconds)`. `http_sink` posts JSON to a URL, e.g. a Slack webhook; a local fake sink is enough to test it.
+# MAGIC - `close(timeout)` sends what is still queued, waiting at most `timeout` seconds, and never raises. `stats()` reports what was sent, combined, retried and dropped.
+
+# COMMAND ----------
+
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+
+# COMMAND ----------
+
+def slack_payload(key, events):
+  # One Slack message for all events of a key
+  title = "Registered model '{}' version {}".format(*key) if isinstance(key, tuple) and len(key) == 2 else str(key)
+  return {'text': '\n'.join([title + ':'] + ['- ' + e for e in events])}
+
+
+def http_sink(url, headers=None, timeout=5):
+  # POSTs the message as JSON -> (status, Retry-After seconds or None); connection errors raise
+  headers = {'Content-Type': 'application/json', **(headers or {})}
+
+  def send(body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers=headers, method='POST')
+    try:
+      with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+        return response.status, None
+    except urllib.error.HTTPError as e:
+      try:
+        return e.code, float(e.headers.get('Retry-After'))
+      except (TypeError, ValueError, AttributeError):
+        return e.code, None
+
+  return send
+
+# COMMAND ----------
+
+class Notifier:
+
+  def __init__(self, sink, render=slack_payload, batch_seconds=2.0, rate_per_second=1.0, max_retries=5,
+               backoff_seconds=1.0, max_queue=1000):
+    self.sink = sink
+    self.render = render
+    self.batch_seconds = batch_seconds
+    self.rate_per_second = rate_per_second
+    self.max_retries = max_retries
+    self.backoff_seconds = backoff_seconds
+    self._queue = queue.Queue(maxsize=max_queue)
+    self._pending = OrderedDict()  # key -> (first event time, [events])
+    self._tokens = 1.0
+    self._refilled_at = time.monotonic()
+    self._closing = threading.Event()
+    self._stats = {'events': 0, 'messages': 0, 'combined_events': 0, 'sent': 0, 'failed': 0, 'retries': 0,
+                   'dropped_events': 0, 'max_notify_ms': 0.0}
+    self._stats_lock = threading.Lock()
+    self._worker = threading.Thread(target=self._run, name='notifier', daemon=True)
+    self._worker.start()
+
+  def notify(self, key, event):
+    started = time.perf_counter()
+    while True:
+      try:
+        self._queue.put_nowait((key, event))
+        break
+      except queue.Full:
+        try:
+          self._queue.get_nowait()
+          self._count('dropped_events')
+        except queue.Empty:
+          pass
+    with self._stats_lock:
+      self._stats['events'] += 1
+      self._stats['max_notify_ms'] = max(self._stats['max_notify_ms'], (time.perf_counter() - started) * 1000)
+
+  def _count(self, name, n=1):
+    with self._stats_lock:
+      self._stats[name] += n
+
+  def _run(self):
+    while True:
+      # Take everything queued so far, so events of a key that are already waiting go out together
+      while True:
+        try:
+          self._add(*self._queue.get_nowait())
+        except queue.Empty:
+          break
+      closing = self._closing.is_set()
+      now = time.monotonic()
+      for key in [k for k, (first, _) in self._pending.items() if closing or now - first >= self.batch_seconds]:
+        _, events = self._pending.pop(key)
+        self._deliver(key, events)
+      if closing and self._queue.empty() and not self._pending:
+        return
+      wait = 0.1 if closing else self.batch_seconds
+      if self._pending:
+        wait = min(wait, min(first for first, _ in self._pending.values()) + self.batch_seconds - time.monotonic())
+      try:
+        self._add(*self._queue.get(timeout=max(wait, 0.01)))
+      except queue.Empty:
+        pass
+
+  def _add(self, key, event):
+    if key not in self._pending:
+      self._pending[key] = (time.monotonic(), [])
+    self._pending[key][1].append(event)
+
+  def _take_token(self):
+    while True:
+      now = time.monotonic()
+      self._tokens = min(1.0, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+      self._refilled_at = now
+      if self._tokens >= 1:
+        self._tokens -= 1
+        return
+      time.sleep((1 - self._tokens) / self.rate_per_second)
+
+  def _deliver(self, key, events):
+    body = self.render(key, events)
+    self._count('messages')
+    self._count('combined_events', len(events) - 1)
+    for attempt in range(self.max_retries + 1):
+      self._take_token()
+      try:
+        result = self.sink(body)
+        status, retry_after = result if isinstance(result, tuple) else (result, None)
+      except Exception:
+        status, retry_after = None, None
+      if status is not None and 200 <= status < 300:
+        self._count('sent')
+        return
+      if status is not None and status < 500 and status != 429:
+        break
+      if attempt < self.max_retries:
+        self._count('retries')
+        time.sleep(retry_after if retry_after is not None else self.backoff_seconds * 2 ** attempt)
+    self._count('failed')
+
+  def close(self, timeout=10):
+    # Returns True when everything queued was delivered or gave up within `timeout`
+    self._closing.set()
+    self._worker.join(timeout)
+    return not self._worker.is_alive()
+
+  def stats(self):
+    with self._stats_lock:
+      s = dict(self._stats)
+    s['queued'] = self._queue.qsize() + sum(len(events) for _, events in list(self._pending.values()))
+    s['max_notify_ms'] = round(s['max_notify_ms'], 3)
+    return s
@@ -0,0 +1,109 @@
+# Local check of the notification dispatcher (notifications.py) against a fake webhook.
+#
+# Starts a local HTTP sink that answers slowly and fails a share of requests (500s, and 429s with Retry-After), then
+# sends the check results of a number of model versions, as 05 does, two ways:
+#   1. one synchronous POST per event, the way 05 used to post to Slack, stopping at the first failure,
+#   2. Notifier.notify, which queues, combines events per model version, rate limits and retries in the background.
+# Prints the time each spent on the validation path, messages received by the sink and the dispatcher stats as JSON,
+# and exits non-zero if an event never reached the sink.
+#
+#   python notifications_benchmark.py --versions 5 --checks 6 --sink-latency-ms 300 --failure-rate 0.3
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import notifications
+
+
+def start_fake_sink(latency_ms, failure_rate, seed=42):
+  # Records every message it accepts; fails a share of requests with 500 or 429
+  received = []
+  lock = threading.Lock()
+  rng = random.Random(seed)
+
+  class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+      body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+      time.sleep(latency_ms / 1000)
+      with lock:
+        roll = rng.random()
+      if roll < failure_rate / 2:
+        self.send_response(500)
+        self.end_headers()
+        return
+      if roll < failure_rate:
+        self.send_response(429)
+        self.send_header('Retry-After', '0.2')
+        self.end_headers()
+        return
+      with lock:
+        received.append(body)
+      self.send_response(200)
+      self.end_headers()
+      self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+      pass
+
+  server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server, f'http://127.0.0.1:{server.server_address[1]}/webhook', received
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Notification dispatcher: time on the validation path and delivery')
+  parser.add_argument('--versions', type=int, default=5)
+  parser.add_argument('--checks', type=int, default=6)
+  parser.add_argument('--sink-latency-ms', type=float, default=300)
+  parser.add_argument('--failure-rate', type=float, default=0.3)
+  parser.add_argument('--rate-per-second', type=float, default=5)
+  args = parser.parse_args(argv)
+
+  events = [(('churn', str(v)), f'check_{c}: pass') for v in range(1, args.versions + 1) for c in range(args.checks)]
+
+  server, url, received = start_fake_sink(args.sink_latency_ms, args.failure_rate)
+  sink = notifications.http_sink(url)
+  started = time.perf_counter()
+  sync_failed_at = None
+  for i, (key, event) in enumerate(events):
+    status, _ = sink(notifications.slack_payload(key, [event]))
+    if status != 200:
+      sync_failed_at = i
+      break
+  sync_seconds = time.perf_counter() - started
+  server.shutdown()
+
+  server, url, received = start_fake_sink(args.sink_latency_ms, args.failure_rate)
+  notifier = notifications.Notifier(notifications.http_sink(url), batch_seconds=0.5,
+                                    rate_per_second=args.rate_per_second, backoff_seconds=0.1, max_retries=8)
+  started = time.perf_counter()
+  for key, event in events:
+    notifier.notify(key, event)
+  notify_seconds = time.perf_counter() - started
+  flushed = notifier.close(timeout=60)
+  delivered_seconds = time.perf_counter() - started
+  server.shutdown()
+
+  delivered = [line[2:] for body in received for line in body['text'].split('\n')[1:]]
+  lost = len(events) - len(delivered)
+  report = {'events': len(events),
+            'synchronous': {'seconds': round(sync_seconds, 3), 'posted_before_failure': sync_failed_at},
+            'notifier': dict(notifier.stats(), notify_seconds=round(notify_seconds, 4),
+                             delivered_seconds=round(delivered_seconds, 3), flushed=flushed,
+                             sink_messages=len(received), lost_events=lost)}
+  print(json.dumps(report, indent=2))
+  if lost:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,241 @@
+# Local end-to-end benchmark of the churn pipeline.
+#
+# Runs bronze ingest -> features -> training -> registration -> validation -> batch scoring
+# (the same code the notebooks run, see pipeline_stages.py) against local Spark, local Delta
+# paths and a file-based MLflow store, at one or more data sizes. For every stage it records
+# wall time, peak memory (this process plus the Spark JVM), rows/sec and bytes written, and
+# writes a JSON report that can be diffed between commits. With --sizing every stage runs under the
+# profile spark_sizing.py picks for its input size instead of Spark's defaults.
+#
+#   python pipeline_benchmark.py --rows 7043 100000 --output bench.json
+#   python pipeline_benchmark.py --rows 7043 100000 --output sized.json --sizing
+#   python pipeline_benchmark.py --rows 7043 100000 --output new.json --baseline bench.json --threshold 0.2
+#
+# Exits non-zero when a stage regressed against the baseline by more than the threshold.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import pipeline_stages as stages
+import spark_sizing
+
+telco_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Telco-Customer-Churn.csv')
+
+# Anything faster than this is noise on a laptop, whatever the relative change
+min_regression_seconds = 0.5
+min_regression_bytes = 64 * 1024 * 1024
+
+
+def scale_telco_csv(src_csv, dst_csv, rows):
+  # Repeat the source rows, suffixing customerID on every pass so keys stay unique
+  if os.path.exists(dst_csv):
+    return dst_csv
+  with open(src_csv) as f:
+    header, *lines = f.read().splitlines()
+  written, rep = 0, 0
+  with open(dst_csv, 'w') as out:
+    out.write(header + '\n')
+    while written < rows:
+      batch = lines[:rows - written]
+      for line in batch:
+        customer_id, rest = line.split(',', 1)
+        out.write(f'{customer_id}-{rep},{rest}\n' if rep else line + '\n')
+      written += len(batch)
+      rep += 1
+  return dst_csv
+
+
+def dir_size(path):
+  total = 0
+  for root, _, files in os.walk(path):
+    for name in files:
+      try:
+        total += os.path.getsize(os.path.join(root, name))
+      except OSError:
+        pass
+  return total
+
+
+class PeakMemorySampler(threading.Thread):
+  # Polls the RSS of this process and its children (the local Spark JVM) while a stage runs
+
+  def __init__(self, interval=0.05):
+    super().__init__(daemon=True)
+    self.interval = interval
+    self.peak = 0
+    self._done = threading.Event()
+
+  def run(self):
+    import psutil
+
+    proc = psutil.Process()
+    while not self._done.is_set():
+      rss = 0
+      for p in [proc] + proc.children(recursive=True):
+        try:
+          rss += p.memory_info().rss
+        except psutil.Error:
+          pass
+      self.peak = max(self.peak, rss)
+      self._done.wait(self.interval)
+
+  def stop(self):
+    self._done.set()
+    self.join()
+    return self.peak
+
+
+def run_stage(name, fn, rows_fn=None, paths=()):
+  before = sum(dir_size(p) for p in paths)
+  sampler = PeakMemorySampler()
+  sampler.start()
+  start = time.perf_counter()
+  try:
+    result = fn()
+  finally:
+    wall = time.perf_counter() - start
+    peak = sampler.stop()
+
+  # Counting happens outside the timed section so it does not inflate the stage
+  rows = rows_fn(result) if rows_fn else None
+  record = {
+    'stage': name,
+    'wall_seconds': round(wall, 3),
+    'peak_memory_bytes': peak,
+    'rows': rows,
+    'rows_per_second': round(rows / wall, 1) if rows and wall > 0 else None,
+    'bytes_written': max(sum(dir_size(p) for p in paths) - before, 0),
+  }
+  return result, record
+
+
+def run_pipeline(spark, csv_path, workdir, max_train_rows=1000000, sizing=False):
+  import mlflow
+  from mlflow.tracking import MlflowClient
+
+  bronze_path = os.path.join(workdir, 'bronze')
+  features_path = os.path.join(workdir, 'churn_features')
+  preds_path = os.path.join(workdir, 'churn_preds')
+  mlruns = os.path.join(workdir, 'mlruns')
+  mlflow.set_tracking_uri('file:' + mlruns)
+  mlflow.set_registry_uri('file:' + mlruns)
+  client = MlflowClient()
+  records = []
+
+  def stage(name, fn, rows_fn=None, paths=(), sources=()):
+    # Sizing happens before the timed section, as it would before a notebook stage
+    with spark_sizing.sized(spark, name, *sources) if sizing and sources else nullcontext() as profile:
+      result, record = run_stage(name, fn, rows_fn, paths)
+    if profile:
+      record['sizing'] = profile
+    records.append(record)
+    print('  {stage:<9} {wall_seconds:>9.2f}s  {peak_memory_bytes:>14,} B peak  {bytes_written:>14,} B written'.format(**record))
+    return result
+
+  def write_features():
+    stages.compute_churn_features(bronze).write.format('delta').mode('overwrite').save(features_path)
+    return spark.read.format('delta').load(features_path)
+
+  bronze, _ = stage('ingest', lambda: stages.ingest_bronze(spark, csv_path, bronze_path),
+                    lambda result: result[1]['accepted'], [bronze_path], [csv_path])
+  features = stage('features', write_features, lambda df: df.count(), [features_path], [bronze_path])
+  feature_rows = records[-1]['rows']
+
+  # Training pulls the features to the driver, so cap it like AutoML samples large tables
+  train_rows = min(feature_rows, max_train_rows)
+  run_id = stage('train', lambda: stages.train_churn_model(features.limit(train_rows), experiment_name='churn_benchmark'),
+                 lambda _: train_rows, [mlruns], [features_path])
+  model_details = stage('register', lambda: stages.register_churn_model(client, run_id, 'churn_benchmark', features_path),
+                        None, [mlruns])
+
+  model_uri = f'models:/churn_benchmark/{model_details.version}'
+  stage('validate', lambda: stages.validate_model(spark, model_uri, features), lambda _: feature_rows,
+        sources=[features_path])
+  stage('score', lambda: stages.batch_score(spark, model_uri, features, preds_path),
+        lambda _: feature_rows, [preds_path], [features_path])
+  return records
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stderr=subprocess.DEVNULL, text=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare_reports(current, baseline, threshold=0.2):
+  # A stage regresses when it is both `threshold` slower (or bigger) relatively and above the noise floor
+  base = {(run['rows'], s['stage']): s for run in baseline['runs'] for s in run['stages']}
+  regressions = []
+  for run in current['runs']:
+    for s in run['stages']:
+      b = base.get((run['rows'], s['stage']))
+      if not b:
+        continue
+      for metric, floor in [('wall_seconds', min_regression_seconds), ('peak_memory_bytes', min_regression_bytes)]:
+        old, new = b[metric], s[metric]
+        if old and new - old > floor and new > old * (1 + threshold):
+          regressions.append({'rows': run['rows'], 'stage': s['stage'], 'metric': metric,
+                              'baseline': old, 'current': new, 'change': round(new / old - 1, 3)})
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Local end-to-end benchmark of the churn pipeline')
+  parser.add_argument('--rows', type=int, nargs='+', default=[7043], help='data sizes to run, in bronze rows')
+  parser.add_argument('--csv', default=telco_csv, help='source CSV that is scaled up to each size')
+  parser.add_argument('--workdir', default=None, help='where Delta tables and mlruns are written (default: a temp dir)')
+  parser.add_argument('--output', default='pipeline_benchmark.json')
+  parser.add_argument('--baseline', default=None, help='report from a previous commit to check for regressions')
+  parser.add_argument('--threshold', type=float, default=0.2,
+                      help='allowed relative increase in wall time or peak memory per stage')
+  parser.add_argument('--sizing', action='store_true', help='size Spark per stage from its input (spark_sizing.py)')
+  args = parser.parse_args(argv)
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-benchmark-')
+  spark = stages.local_spark('churn-benchmark')
+  report = {
+    'commit': git_commit(),
+    'created_at': datetime.now(timezone.utc).isoformat(),
+    'python': platform.python_version(),
+    'spark': spark.version,
+    'cpus': os.cpu_count(),
+    'sizing': args.sizing,
+    'runs': [],
+  }
+
+  for rows in args.rows:
+    print(f'rows={rows:,}')
+    csv_path = scale_telco_csv(args.csv, os.path.join(workdir, f'telco_{rows}.csv'), rows)
+    run_dir = os.path.join(workdir, f'run_{rows}')
+    shutil.rmtree(run_dir, ignore_errors=True)
+    report['runs'].append({'rows': rows, 'stages': run_pipeline(spark, csv_path, run_dir, sizing=args.sizing)})
+
+  with open(args.output, 'w') as f:
+    json.dump(report, f, indent=2)
+  print(f'Wrote {args.output}')
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      regressions = compare_reports(report, json.load(f), args.threshold)
+    for r in regressions:
+      print('REGRESSION rows={rows:,} {stage} {metric}: {baseline} -> {current} ({change:+.1%})'.format(**r))
+    if regressions:
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,383 @@
+# Local DAG orchestrator for the churn pipeline, with stage-level caching and parallel stages.
+#
+# Declares the notebook stages (00b ingest, the bronze and feature expectations, 01 features, 02/07 training,
+# 04 registration, 05 validation, 06 batch scoring) with the tables and artifacts each one reads and writes, and
+# runs them on local Spark, local Delta paths and a file-based MLflow store (see pipeline_stages.py):
+#   - a stage is skipped when the versions of its inputs (Delta table version, file size and mtime, registered
+#     model version) and the hash of its code are the same as on its last successful run, and its outputs are
+#     still at the versions that run left them at. Its recorded result (run id, model version) is reused.
+#   - stages whose inputs are ready run concurrently on a thread pool, each in its own Spark FAIR scheduler pool:
+#     the feature expectations run next to training, and validation next to batch scoring.
+#   - a failing stage stops only its downstream stages, which are reported as blocked.
+# The state lives in <workdir>/orchestrator_state.json. Prints a per-stage timeline and writes it as a JSON
+# report, and optionally as a Chrome trace (chrome://tracing or Perfetto). Exits non-zero when a stage failed.
+#
+#   python pipeline_orchestrator.py --workdir /tmp/churn-dag --rows 100000 --output timeline.json
+#   python pipeline_orchestrator.py --workdir /tmp/churn-dag --force train --trace timeline.trace.json
+
+import argparse
+import glob
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import expectations
+import pipeline_stages as stages
+from pipeline_benchmark import git_commit, scale_telco_csv, telco_csv
+
+state_file = 'orchestrator_state.json'
+
+
+class Stage:
+
+  def __init__(self, name, fn, inputs=(), outputs=(), code=(), params=None):
+    # inputs/outputs are resource names: 'delta:<path>', 'file:<path>' or 'model:<registered name>'
+    self.name = name
+    self.fn = fn
+    self.inputs = list(inputs)
+    self.outputs = list(outputs)
+    self.code = [fn] + list(code)
+    self.params = params or {}
+
+  def code_hash(self):
+    # Source of the stage function and the pipeline functions it calls, plus its parameters
+    digest = hashlib.sha256()
+    for obj in self.code:
+      digest.update(inspect.getsource(obj).encode())
+    digest.update(json.dumps(self.params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+# Resource versions
+
+
+def delta_version(path):
+  # Latest commit in the Delta log, without starting a Spark job
+  commits = [os.path.basename(p)[:-len('.json')] for p in glob.glob(os.path.join(path, '_delta_log', '*.json'))]
+  versions = [int(c) for c in commits if c.isdigit()]
+  return max(versions) if versions else None
+
+
+def file_version(path):
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  return f'{st.st_size}:{st.st_mtime_ns}'
+
+
+def model_version(client, name):
+  from mlflow.exceptions import MlflowException
+
+  try:
+    versions = client.search_model_versions(f"name='{name}'")
+  except MlflowException:
+    return None
+  return max((int(v.version) for v in versions), default=None)
+
+
+def resource_version(client, resource):
+  kind, _, target = resource.partition(':')
+  if kind == 'delta':
+    return delta_version(target)
+  if kind == 'file':
+    return file_version(target)
+  if kind == 'model':
+    return model_version(client, target)
+  raise ValueError(f'Unknown resource {resource!r}')
+
+# Scheduling
+
+
+def dependencies(dag):
+  # A stage depends on every stage that writes one of its inputs
+  writers = {}
+  for stage in dag:
+    for resource in stage.outputs:
+      if resource in writers:
+        raise ValueError(f'{resource} is written by both {writers[resource]} and {stage.name}')
+      writers[resource] = stage.name
+  deps = {stage.name: {writers[r] for r in stage.inputs if r in writers} for stage in dag}
+
+  # Reject cycles up front rather than waiting forever
+  done, remaining = set(), dict(deps)
+  while remaining:
+    ready = [name for name, d in remaining.items() if d <= done]
+    if not ready:
+      raise ValueError(f'Stages {sorted(remaining)} form a cycle')
+    done.update(ready)
+    for name in ready:
+      del remaining[name]
+  return deps
+
+
+def load_state(workdir):
+  try:
+    with open(os.path.join(workdir, state_file)) as f:
+      return json.load(f)
+  except FileNotFoundError:
+    return {}
+
+
+def save_state(workdir, state):
+  path = os.path.join(workdir, state_file)
+  with open(path + '.tmp', 'w') as f:
+    json.dump(state, f, indent=2, default=str)
+  os.replace(path + '.tmp', path)
+
+
+def run_dag(dag, ctx, workdir, max_workers=4, force=()):
+  # Runs `dag` in dependency order, skipping up-to-date stages -> timeline records in start order
+  # `force` names stages to rerun regardless; their downstream stages rerun when their inputs change
+  deps = dependencies(dag)
+  by_name = {stage.name: stage for stage in dag}
+  state = load_state(workdir)
+  lock = threading.Lock()
+  t0 = time.perf_counter()
+  ctx.results = {}
+
+  def execute(stage):
+    if ctx.spark is not None:
+      # Concurrent stages share the local cores fairly instead of queueing behind each other
+      ctx.spark.sparkContext.setLocalProperty('spark.scheduler.pool', stage.name)
+    started = time.perf_counter() - t0
+    record = {'stage': stage.name, 'thread': threading.current_thread().name, 'start_seconds': round(started, 3)}
+    try:
+      inputs = {r: resource_version(ctx.client, r) for r in stage.inputs}
+      missing = [r for r, v in inputs.items() if v is None]
+      if missing:
+        raise ValueError(f'{stage.name}: missing inputs {missing}')
+      code_hash = stage.code_hash()
+      previous = state.get(stage.name)
+      outputs = {r: resource_version(ctx.client, r) for r in stage.outputs}
+      if stage.name in force:
+        reason = 'forced'
+      elif not previous:
+        reason = 'never ran'
+      elif previous['code_hash'] != code_hash:
+        reason = 'code changed'
+      elif previous['inputs'] != inputs:
+        reason = 'inputs changed: ' + ', '.join(r for r in inputs if previous['inputs'].get(r) != inputs[r])
+      elif previous['outputs'] != outputs:
+        reason = 'outputs changed since last run'
+      else:
+        reason = None
+
+      if reason is None:
+        result, status, reason = previous['result'], 'skipped', 'up to date'
+      else:
+        result = stage.fn(ctx) or {}
+        status = 'ran'
+        outputs = {r: resource_version(ctx.client, r) for r in stage.outputs}
+        with lock:
+          state[stage.name] = {'code_hash': code_hash, 'inputs': inputs, 'outputs': outputs, 'result': result,
+                               'finished_at': datetime.now(timezone.utc).isoformat()}
+          save_state(workdir, state)
+      with lock:
+        ctx.results[stage.name] = result
+      record.update(status=status, reason=reason, inputs=inputs, outputs=outputs, result=result)
+    except Exception as e:
+      record.update(status='failed', reason=f'{type(e).__name__}: {e}')
+    ended = time.perf_counter() - t0
+    record.update(end_seconds=round(ended, 3), seconds=round(ended - started, 3))
+    return record
+
+  timeline, finished, failed = [], set(), set()
+  with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage') as pool:
+    running = {}
+    pending = [stage.name for stage in dag]
+    while pending or running:
+      for name in list(pending):
+        if deps[name] & failed:
+          # Nothing downstream of a failure runs
+          pending.remove(name)
+          failed.add(name)
+          now = round(time.perf_counter() - t0, 3)
+          timeline.append({'stage': name, 'status': 'blocked', 'reason': 'upstream failed: '
+                           + ', '.join(sorted(deps[name] & failed)), 'start_seconds': now, 'end_seconds': now,
+                           'seconds': 0.0})
+        elif deps[name] <= finished:
+          pending.remove(name)
+          running[pool.submit(execute, by_name[name])] = name
+      if not running:
+        break
+      done, _ = wait(running, return_when=FIRST_COMPLETED)
+      for future in done:
+        name = running.pop(future)
+        record = future.result()
+        timeline.append(record)
+        (finished if record['status'] != 'failed' else failed).add(name)
+  return sorted(timeline, key=lambda r: (r['start_seconds'], r['stage']))
+
+
+def format_timeline(timeline, width=50):
+  total = max((r['end_seconds'] for r in timeline), default=0) or 1
+  lines = []
+  for r in timeline:
+    start = int(r['start_seconds'] / total * width)
+    bar = ' ' * start + '#' * max(int(r['seconds'] / total * width), 1 if r['status'] == 'ran' else 0)
+    lines.append(f"  {r['stage']:<15} {r['status']:<8} {r['start_seconds']:>8.2f}s {r['seconds']:>8.2f}s  "
+                 f"|{bar:<{width}}|  {r['reason']}")
+  return '\n'.join(lines)
+
+
+def chrome_trace(timeline):
+  # Trace Event Format, one lane per worker thread
+  lanes = {}
+  events = []
+  for r in timeline:
+    tid = lanes.setdefault(r.get('thread', 'scheduler'), len(lanes))
+    events.append({'name': r['stage'], 'cat': r['status'], 'ph': 'X', 'pid': 0, 'tid': tid,
+                   'ts': int(r['start_seconds'] * 1e6), 'dur': int(r['seconds'] * 1e6),
+                   'args': {'status': r['status'], 'reason': r['reason']}})
+  return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+# The churn pipeline
+
+
+def quality_check(ctx, table_path, rules_fn, results_path):
+  # Single-pass expectations on the latest version of a Delta path; the JSON results gate downstream stages
+  df = ctx.spark.read.format('delta').load(table_path)
+  previous_rows = None
+  if os.path.exists(results_path):
+    with open(results_path) as f:
+      previous_rows = json.load(f)['rows']
+  rows, results = expectations.evaluate_expectations(df, rules_fn(df.columns), previous_rows)
+  failures = [r for r in results if not r['passed'] and r['severity'] == 'error']
+  if failures:
+    raise expectations.ExpectationsFailed(table_path, delta_version(table_path), failures)
+  with open(results_path, 'w') as f:
+    json.dump({'table_version': delta_version(table_path), 'rows': rows, 'results': results}, f, indent=2)
+  return {'rows': rows, 'rules': len(results)}
+
+
+def churn_dag(csv_path, paths, model_name='churn_local', max_train_rows=1000000):
+  bronze, features, preds = 'delta:' + paths['bronze'], 'delta:' + paths['features'], 'delta:' + paths['preds']
+  bronze_quality, features_quality = 'file:' + paths['bronze_quality'], 'file:' + paths['features_quality']
+  train_run, validation, model = 'file:' + paths['train_run'], 'file:' + paths['validation'], 'model:' + model_name
+
+  def ingest(ctx):
+    _, report = stages.ingest_bronze(ctx.spark, csv_path, paths['bronze'])
+    return report
+
+  def check_bronze(ctx):
+    return quality_check(ctx, paths['bronze'], lambda columns: expectations.bronze_expectations,
+                         paths['bronze_quality'])
+
+  def featurize(ctx):
+    bronze_df = ctx.spark.read.format('delta').load(paths['bronze'])
+    stages.compute_churn_features(bronze_df).write.format('delta').mode('overwrite').save(paths['features'])
+    return {}
+
+  def check_features(ctx):
+    return quality_check(ctx, paths['features'], expectations.feature_expectations, paths['features_quality'])
+
+  def train(ctx):
+    # Training pulls the features to the driver, so cap it like AutoML samples large tables
+    features_df = ctx.spark.read.format('delta').load(paths['features']).limit(max_train_rows)
+    run_id = stages.train_churn_model(features_df, experiment_name='churn_orchestrator')
+    with open(paths['train_run'], 'w') as f:
+      json.dump({'run_id': run_id}, f)
+    return {'run_id': run_id}
+
+  def register(ctx):
+    model_details = stages.register_churn_model(ctx.client, ctx.results['train']['run_id'], model_name,
+                                                 paths['features'])
+    return {'version': int(model_details.version)}
+
+  def validate(ctx):
+    features_df = ctx.spark.read.format('delta').load(paths['features'])
+    slices = stages.validate_model(ctx.spark, f"models:/{model_name}/{ctx.results['register']['version']}",
+                                   features_df)
+    with open(paths['validation'], 'w') as f:
+      f.write(slices.to_json(orient='records', indent=2))
+    return {'slices': len(slices)}
+
+  def score(ctx):
+    features_df = ctx.spark.read.format('delta').load(paths['features'])
+    stages.batch_score(ctx.spark, f"models:/{model_name}/{ctx.results['register']['version']}", features_df,
+                       paths['preds'])
+    return {}
+
+  return [
+    Stage('ingest', ingest, ['file:' + csv_path], [bronze], [stages.ingest_bronze, stages.ingest_telco_csv]),
+    Stage('check_bronze', check_bronze, [bronze], [bronze_quality], [quality_check, expectations.evaluate_expectations],
+          {'rules': expectations.bronze_expectations}),
+    Stage('features', featurize, [bronze, bronze_quality], [features], [stages.compute_churn_features]),
+    Stage('check_features', check_features, [features], [features_quality],
+          [quality_check, expectations.evaluate_expectations, expectations.feature_expectations]),
+    Stage('train', train, [features], [train_run], [stages.train_churn_model, stages.fit_churn_pipeline],
+          {'params': stages.churn_xgb_params, 'max_train_rows': max_train_rows}),
+    # Only features that passed their expectations get a registered model
+    Stage('register', register, [train_run, features_quality], [model], [stages.register_churn_model]),
+    Stage('validate', validate, [model, features], [validation], [stages.validate_model]),
+    Stage('score', score, [model, features], [preds], [stages.batch_score]),
+  ]
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Run the churn pipeline as a cached, parallel DAG on local Spark')
+  parser.add_argument('--workdir', required=True, help='Delta tables, mlruns and the orchestrator state')
+  parser.add_argument('--csv', default=telco_csv)
+  parser.add_argument('--rows', type=int, default=None, help='scale the source CSV to this many rows first')
+  parser.add_argument('--model-name', default='churn_local')
+  parser.add_argument('--max-workers', type=int, default=4)
+  parser.add_argument('--force', nargs='*', default=None, help='stages to rerun even if up to date (no names: all)')
+  parser.add_argument('--output', default=None, help='write the timeline report here as JSON')
+  parser.add_argument('--trace', default=None, help='write the timeline here as a Chrome trace')
+  args = parser.parse_args(argv)
+
+  import mlflow
+  from mlflow.tracking import MlflowClient
+
+  os.makedirs(args.workdir, exist_ok=True)
+  csv_path = args.csv
+  if args.rows:
+    csv_path = scale_telco_csv(args.csv, os.path.join(args.workdir, f'telco_{args.rows}.csv'), args.rows)
+  paths = {name: os.path.join(args.workdir, name) for name in ('bronze', 'features', 'preds')}
+  paths.update(bronze_quality=os.path.join(args.workdir, 'bronze_quality.json'),
+               features_quality=os.path.join(args.workdir, 'features_quality.json'),
+               train_run=os.path.join(args.workdir, 'train_run.json'),
+               validation=os.path.join(args.workdir, 'validation.json'))
+  mlruns = os.path.join(args.workdir, 'mlruns')
+  mlflow.set_tracking_uri('file:' + mlruns)
+  mlflow.set_registry_uri('file:' + mlruns)
+
+  dag = churn_dag(os.path.abspath(csv_path), paths, args.model_name)
+  force = {stage.name for stage in dag} if args.force == [] else set(args.force or ())
+  unknown = force - {stage.name for stage in dag}
+  if unknown:
+    parser.error(f'unknown stages {sorted(unknown)}')
+
+  spark = stages.local_spark('churn-orchestrator', {'spark.scheduler.mode': 'FAIR'})
+  ctx = SimpleNamespace(spark=spark, client=MlflowClient())
+  timeline = run_dag(dag, ctx, args.workdir, args.max_workers, force)
+  print(format_timeline(timeline))
+
+  report = {'commit': git_commit(), 'created_at': datetime.now(timezone.utc).isoformat(), 'workdir': args.workdir,
+            'total_seconds': max((r['end_seconds'] for r in timeline), default=0),
+            'ran': sum(r['status'] == 'ran' for r in timeline),
+            'skipped': sum(r['status'] == 'skipped' for r in timeline),
+            'failed': sum(r['status'] in ('failed', 'blocked') for r in timeline),
+            'stages': timeline}
+  print(json.dumps({k: v for k, v in report.items() if k != 'stages'}, indent=2))
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, default=str)
+  if args.trace:
+    with open(args.trace, 'w') as f:
+      json.dump(chrome_trace(timeline), f)
+  if report['failed']:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,234 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Pipeline stages
+# MAGIC
+# MAGIC The core logic of the pipeline notebooks (`00b` ingest, `01` features, `02`/`07` training, `04` registration, `05` validation, `06` batch scoring), pulled out so the notebooks and the local benchmark harness (`pipeline_benchmark.py`) run the same code.
+# MAGIC
+# MAGIC Nothing in here touches `dbutils` or notebook globals: `spark`, paths and table names are passed in explicitly. Use it with `%run ./pipeline_stages` from a notebook, or `import pipeline_stages` from a local script.
+
+# COMMAND ----------
+
+# MAGIC %run ./schema_contract
+
+# COMMAND ----------
+
+# MAGIC %run ./async_logging
+
+# COMMAND ----------
+
+from pyspark.sql import functions as F
+
+if 'ingest_telco_csv' not in globals():
+  from schema_contract import ingest_telco_csv
+if 'batched_logging' not in globals():
+  from async_logging import batched_logging
+
+# Same tags 04/07 set on the training run
+demographic_vars = 'seniorCitizen,gender_Female'
+
+# Hyperparameters of the best AutoML trial (see 02_automl_baseline)
+churn_xgb_params = {
+  "colsample_bytree": 0.485736573557039,
+  "learning_rate": 1.2331278229690985,
+  "max_depth": 3,
+  "min_child_weight": 7,
+  "n_estimators": 63,
+  "n_jobs": -1,
+  "subsample": 0.7264455949051705,
+  "verbosity": 0,
+  "random_state": 32847526,
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Local Spark
+# MAGIC
+# MAGIC Only for running outside Databricks: a `local[*]` session with Delta Lake enabled.
+
+# COMMAND ----------
+
+def local_spark(app_name='churn-local', conf=None):
+  from delta import configure_spark_with_delta_pip
+  from pyspark.sql import SparkSession
+
+  builder = (SparkSession.builder
+             .master('local[*]')
+             .appName(app_name)
+             .config('spark.sql.extensions', 'io.delta.sql.DeltaSparkSessionExtension')
+             .config('spark.sql.catalog.spark_catalog', 'org.apache.spark.sql.delta.catalog.DeltaCatalog')
+             .config('spark.ui.enabled', 'false'))
+  for k, v in (conf or {}).items():
+    builder = builder.config(k, v)
+  return configure_spark_with_delta_pip(builder).getOrCreate()
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Bronze ingest (`00b`)
+# MAGIC
+# MAGIC Returns the bronze DataFrame and the ingest report from `schema_contract` (accepted and rejected row counts).
+
+# COMMAND ----------
+
+def ingest_bronze(spark, csv_path, bronze_path, quarantine_path=None):
+  # Read CSV against the schema contract, write to Delta; rejects go to the quarantine table
+  quarantine_path = quarantine_path or bronze_path.rstrip('/') + '_quarantine'
+  ingest_report = ingest_telco_csv(spark, csv_path, bronze_path, quarantine_path)
+  return spark.read.format('delta').load(bronze_path), ingest_report
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Featurization (`01`)
+# MAGIC
+# MAGIC This is a fairly clean dataset so we'll just do some one-hot encoding, and clean up the column names afterward.
+
+# COMMAND ----------
+
+def compute_churn_features(data):
+  import pyspark.pandas as ps
+
+  # Convert to pandas
+  data = data.to_pandas_on_spark()
+
+  # OHE
+  data = ps.get_dummies(data,
+                        columns=['gender', 'partner', 'dependents',
+                                 'phoneService', 'multipleLines', 'internetService',
+                                 'onlineSecurity', 'onlineBackup', 'deviceProtection',
+                                 'techSupport', 'streamingTV', 'streamingMovies',
+                                 'contract', 'paperlessBilling', 'paymentMethod'],dtype = 'int64')
+
+  # Convert label to int and rename column
+  data['churnString'] = data['churnString'].map({'Yes': 1, 'No': 0})
+  data = data.astype({'churnString': 'int32'})
+  data = data.rename(columns = {'churnString': 'churn'})
+
+  # Clean up column names
+  data.columns = data.columns.str.replace(' ', '', regex=True)
+  data.columns = data.columns.str.replace('(', '-', regex=True)
+  data.columns = data.columns.str.replace(')', '', regex=True)
+
+  # Drop missing values
+  data = data.dropna()
+  data = data.to_spark()
+
+  return data
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Training (`02`/`07`)
+# MAGIC
+# MAGIC A local stand-in for the AutoML XGBoost trial: mean imputation and standardization of every feature column, then `XGBClassifier` with early stopping on a validation split. Columns not seen in training (`customerID`, `churn`) are dropped at predict time, so the model can be applied straight to the feature table like the AutoML one.
+
+# COMMAND ----------
+
+def fit_churn_pipeline(X, y, params):
+  # Fits the preprocessing and the classifier on X/y; returns the pipeline, the training rows and validation metrics
+  from sklearn.compose import ColumnTransformer
+  from sklearn.impute import SimpleImputer
+  from sklearn.metrics import accuracy_score, f1_score
+  from sklearn.model_selection import train_test_split
+  from sklearn.pipeline import Pipeline
+  from sklearn.preprocessing import StandardScaler
+  from xgboost import XGBClassifier
+
+  X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, stratify=y, random_state=params['random_state'])
+
+  preprocessor = ColumnTransformer([
+    ("numerical", Pipeline(steps=[
+      ("impute_mean", SimpleImputer()),
+      ("standardizer", StandardScaler()),
+    ]), list(X.columns)),
+  ], remainder="drop")
+  X_train_processed = preprocessor.fit_transform(X_train)
+  X_val_processed = preprocessor.transform(X_val)
+
+  classifier = XGBClassifier(early_stopping_rounds=5, **params)
+  classifier.fit(X_train_processed, y_train, eval_set=[(X_val_processed, y_val)], verbose=False)
+  model = Pipeline([("preprocessor", preprocessor), ("classifier", classifier)])
+
+  val_preds = model.predict(X_val)
+  return model, X_train, {"val_f1_score": f1_score(y_val, val_preds),
+                          "val_accuracy_score": accuracy_score(y_val, val_preds),
+                          "best_iteration": classifier.best_iteration}
+
+
+def train_churn_model(features, params=None, experiment_name=None, target_col='churn', id_col='customerID'):
+  import mlflow
+  from mlflow.models import infer_signature
+
+  params = {**churn_xgb_params, **(params or {})}
+  pdf = features.toPandas()
+  model, X_train, metrics = fit_churn_pipeline(pdf.drop(columns=[target_col, id_col]), pdf[target_col], params)
+
+  if experiment_name:
+    mlflow.set_experiment(experiment_name)
+  # Params, metrics and the model files go out in the background and are flushed before the run ends
+  with mlflow.start_run() as mlflow_run, batched_logging(mlflow_run.info.run_id):
+    mlflow.log_params(params)
+    mlflow.log_metrics(metrics)
+    mlflow.sklearn.log_model(model, "model",
+                             signature=infer_signature(X_train, model.predict(X_train)),
+                             input_example=X_train.head(5))
+  return mlflow_run.info.run_id
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Registration (`04`/`07`)
+# MAGIC
+# MAGIC Tags the run the same way the notebooks do so `05` can find the feature table and demographic columns. Outside Databricks there is no approval flow, so the version is moved to `stage` directly.
+
+# COMMAND ----------
+
+def register_churn_model(client, run_id, model_name, db_table, stage='Staging'):
+  import mlflow
+
+  client.set_tag(run_id, key='db_table', value=db_table)
+  client.set_tag(run_id, key='demographic_vars', value=demographic_vars)
+
+  model_details = mlflow.register_model(f"runs:/{run_id}/model", model_name)
+  if stage:
+    client.transition_model_version_stage(name=model_name, version=model_details.version,
+                                          stage=stage, archive_existing_versions=True)
+  return model_details
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Validation (`05`)
+# MAGIC
+# MAGIC Scores the features and returns accuracy per demographic slice. The aggregation runs in Spark; only the slice table comes back to the driver.
+
+# COMMAND ----------
+
+def validate_model(spark, model_uri, features, demographics=None):
+  import mlflow
+
+  demographics = demographics or demographic_vars.split(',')
+  loaded_model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri)
+  scored = features.withColumn('predictions', loaded_model(*features.columns))
+  accurate = (F.col('churn') == F.col('predictions')).cast('int')
+  return (scored.groupBy(*demographics)
+                .agg(F.sum(accurate).alias('acc'),
+                     F.count(F.lit(1)).alias('obs'),
+                     F.avg(accurate).alias('pct_acc'))
+                .toPandas())
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Batch inference (`06`)
+
+# COMMAND ----------
+
+def batch_score(spark, model_uri, features, preds_path):
+  import mlflow
+
+  model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri)
+  predictions = features.withColumn('predictions', model(*features.columns))
+  predictions.write.format("delta").mode("append").save(preds_path)
+  return predictions
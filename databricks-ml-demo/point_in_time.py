@@ -0,0 +1,142 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Point-in-time features
+# MAGIC
+# MAGIC `churn_features` is overwritten in place, so on its own it only knows the latest feature values. `churn_features_history` keeps every version of every customer's feature row (type 2 slowly changing dimension):
+# MAGIC
+# MAGIC - `effective_from` / `effective_to`: when the row became current and when it was replaced. `effective_to` is null while the row is still current, and the interval is half-open, `[effective_from, effective_to)`.
+# MAGIC - `row_hash`: a hash of the feature values. A new version of a customer is only written when it changed.
+# MAGIC - `features_version`: the `churn_features` Delta version the row was first seen in.
+# MAGIC
+# MAGIC `backfill_feature_history` replays the Delta history of `churn_features` (by time travel, oldest first) into the history table. It starts after the last version already recorded, so `01` calls it after every write. Versions whose files have been vacuumed can no longer be replayed and are reported as `unavailable`.
+# MAGIC
+# MAGIC `point_in_time_training_set` joins a labels DataFrame (`customerID`, a label timestamp, the label) to the feature row that was current at each label's timestamp. The join is an equi-join on `customerID`, so both sides are hash-partitioned by key, plus an interval condition on the timestamp; there is no cross join. On Databricks the `range_join` hint bins the intervals so the interval check stays cheap when a key has many versions.
+
+# COMMAND ----------
+
+# MAGIC %run ./snapshots
+
+# COMMAND ----------
+
+from pyspark.sql import functions as F
+
+if 'table_version' not in globals():
+  from snapshots import table_version
+
+history_cols = ['effective_from', 'effective_to', 'row_hash', 'features_version']
+
+# Operations that don't change the table's rows
+_no_data_ops = ('OPTIMIZE', 'VACUUM START', 'VACUUM END', 'SET TBLPROPERTIES', 'UNSET TBLPROPERTIES', 'ADD CONSTRAINT',
+                'CHANGE COLUMN', 'FSCK')
+
+# Time travel errors once a version's log entries or data files have been cleaned up
+_unavailable_markers = ('VersionNotFoundException', 'Cannot time travel', 'FileNotFoundException')
+
+# Stands in for the null effective_to of current rows in interval conditions
+_open_ended = '9999-12-31 00:00:00'
+
+
+def _effective_to():
+  return F.coalesce(F.col('effective_to'), F.lit(_open_ended).cast('timestamp'))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Recording history
+
+# COMMAND ----------
+
+def last_recorded_version(spark, history_table):
+  if table_version(spark, history_table) is None:
+    return None
+  return spark.table(history_table).agg(F.max('features_version')).first()[0]
+
+
+def record_feature_history(spark, history_table, features, effective_at, features_version=None, key_col='customerID'):
+  # Closes the current row of every key that changed or disappeared, then opens a row for every changed or new key
+  from delta.tables import DeltaTable
+
+  cols = [c for c in features.columns if c not in history_cols]
+  # 64-bit hash of the feature values; a collision would only hide a change in one customer's row
+  incoming = (features.select(*[F.col(f'`{c}`') for c in cols])
+                      .withColumn('row_hash', F.xxhash64(*[F.col(f'`{c}`') for c in cols if c != key_col])))
+  effective_at = F.lit(effective_at).cast('timestamp')
+
+  def opened(rows):
+    return (rows.withColumn('effective_from', effective_at)
+                .withColumn('effective_to', F.lit(None).cast('timestamp'))
+                .withColumn('features_version', F.lit(features_version).cast('long')))
+
+  if table_version(spark, history_table) is None:
+    opened(incoming).write.format('delta').saveAsTable(history_table)
+    return {'features_version': features_version, 'action': 'created', 'opened': spark.table(history_table).count(),
+            'closed': 0}
+
+  current = spark.table(history_table).where(F.col('effective_to').isNull()).select(key_col, 'row_hash')
+  closing = current.join(incoming.select(key_col, 'row_hash'), [key_col, 'row_hash'], 'left_anti').select(key_col)
+  history = DeltaTable.forName(spark, history_table)
+  (history.alias('h')
+          .merge(closing.alias('c'), f'h.`{key_col}` = c.`{key_col}` AND h.effective_to IS NULL')
+          .whenMatchedUpdate(set={'effective_to': effective_at})
+          .execute())
+  closed = int(history.history(1).first()['operationMetrics'].get('numTargetRowsUpdated', 0))
+
+  # Evaluated after the merge: changed keys are no longer open, unchanged ones still are
+  still_open = spark.table(history_table).where(F.col('effective_to').isNull()).select(key_col)
+  opened(incoming.join(still_open, key_col, 'left_anti')).write.format('delta').mode('append').saveAsTable(history_table)
+  appended = int(history.history(1).first()['operationMetrics'].get('numOutputRows', 0))
+  return {'features_version': features_version, 'action': 'recorded', 'opened': appended, 'closed': closed}
+
+
+def backfill_feature_history(spark, feature_table, history_table, key_col='customerID'):
+  # Replays every version of `feature_table` after the last one recorded, oldest first
+  recorded = last_recorded_version(spark, history_table)
+  versions = (spark.sql(f'DESCRIBE HISTORY {feature_table}')
+                   .where(~F.col('operation').isin(*_no_data_ops))
+                   .where(F.col('version') > (-1 if recorded is None else recorded))
+                   .select('version', 'timestamp')
+                   .orderBy('version')
+                   .collect())
+  reports = []
+  for v in versions:
+    try:
+      snapshot = spark.sql(f'SELECT * FROM {feature_table} VERSION AS OF {v["version"]}')
+      reports.append(record_feature_history(spark, history_table, snapshot, v['timestamp'], v['version'], key_col))
+    except Exception as e:
+      if not any(marker in str(e) for marker in _unavailable_markers):
+        raise
+      reports.append({'features_version': v['version'], 'action': 'unavailable', 'opened': 0, 'closed': 0})
+  return reports
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### As-of join
+
+# COMMAND ----------
+
+def features_as_of(spark, history_table, as_of):
+  # Every customer's feature row as it was at `as_of`
+  as_of = F.lit(as_of).cast('timestamp')
+  return (spark.table(history_table)
+               .where((F.col('effective_from') <= as_of) & (as_of < _effective_to()))
+               .drop(*history_cols))
+
+
+def point_in_time_training_set(spark, labels, history_table, key_col='customerID', ts_col='label_ts', how='inner',
+                               range_join_bin_seconds=86400):
+  # Each label row with the features that were current at its timestamp; the label's own columns win on name clashes
+  history = spark.table(history_table)
+  feature_cols = [c for c in history.columns if c not in history_cols and c != key_col and c not in labels.columns]
+  versions = history.select(F.col(key_col).alias('__key'),
+                            F.col('effective_from').alias('__from'),
+                            _effective_to().alias('__to'),
+                            *[F.col(f'`{c}`') for c in feature_cols])
+  if range_join_bin_seconds:
+    versions = versions.hint('range_join', range_join_bin_seconds)
+
+  ts = F.col(ts_col).cast('timestamp')
+  condition = (F.col(key_col) == F.col('__key')) & (F.col('__from') <= ts) & (ts < F.col('__to'))
+  return (labels.join(versions, condition, how)
+                .withColumnRenamed('__from', 'features_effective_from')
+                .drop('__key', '__to'))
@@ -0,0 +1,102 @@
+# Local check and timing of the point-in-time feature history and as-of join.
+#
+# Builds the churn features on local Spark, then records --versions versions of them in a history table
+# (record_feature_history), changing monthlyCharges for --change-share of the customers each time. It then draws
+# --labels label events at random times over the whole history and
+#   1. times point_in_time_training_set,
+#   2. checks every label after the first version matched exactly one feature row, and that labels falling
+#      between two versions got the row features_as_of returns for that interval,
+# and prints the results as JSON. Exits non-zero if a check fails.
+#
+#   python point_in_time_benchmark.py --versions 10 --labels 1000000
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import pipeline_stages as stages
+import point_in_time
+from pipeline_benchmark import telco_csv
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Point-in-time feature history: as-of join time and correctness')
+  parser.add_argument('--versions', type=int, default=10)
+  parser.add_argument('--change-share', type=float, default=0.1)
+  parser.add_argument('--labels', type=int, default=1000000)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  from pyspark.sql import Window
+  from pyspark.sql import functions as F
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-pit-')
+  spark = stages.local_spark('churn-point-in-time', {'spark.sql.warehouse.dir': os.path.join(workdir, 'warehouse')})
+  bronze, _ = stages.ingest_bronze(spark, telco_csv, os.path.join(workdir, 'bronze'))
+  features = stages.compute_churn_features(bronze).cache()
+  history_table = 'default.churn_features_history'
+
+  start = datetime(2022, 1, 1)
+  started = time.perf_counter()
+  version_reports = []
+  for v in range(args.versions):
+    changed = F.pmod(F.xxhash64('customerID', F.lit(v)), F.lit(1000)) < int(args.change_share * 1000)
+    snapshot = features.withColumn('monthlyCharges', F.when(changed & F.lit(v > 0), F.col('monthlyCharges') + v)
+                                                       .otherwise(F.col('monthlyCharges')))
+    features = snapshot.localCheckpoint()
+    version_reports.append(point_in_time.record_feature_history(spark, history_table, features,
+                                                                start + timedelta(days=30 * v), v))
+  record_seconds = time.perf_counter() - started
+
+  customers = features.select('customerID').withColumn('n', F.row_number().over(Window.orderBy('customerID')) - 1)
+  n_customers = customers.count()
+  span_seconds = 30 * 86400 * args.versions
+  labels = (spark.range(args.labels)
+                 .withColumn('n', F.pmod(F.xxhash64('id'), F.lit(n_customers)))
+                 .withColumn('label_ts', (F.lit(start).cast('long') - 86400
+                                          + F.pmod(F.xxhash64('id', F.lit('ts')), F.lit(span_seconds))).cast('timestamp'))
+                 .withColumn('churn', (F.rand(seed=7) < 0.25).cast('int'))
+                 .join(F.broadcast(customers), 'n')
+                 .drop('n')
+                 .cache())
+  labels.count()
+
+  started = time.perf_counter()
+  training = point_in_time.point_in_time_training_set(spark, labels, history_table, how='left').cache()
+  training_rows = training.count()
+  join_seconds = time.perf_counter() - started
+
+  before_history = training.where(F.col('label_ts') < F.lit(start)).count()
+  unmatched = training.where(F.col('features_effective_from').isNull() & (F.col('label_ts') >= F.lit(start))).count()
+  # Every label between two versions must get the features features_as_of returns anywhere in that interval
+  interval_start = start + timedelta(days=30 * (args.versions // 2))
+  interval_end = interval_start + timedelta(days=30)
+  expected = (point_in_time.features_as_of(spark, history_table, interval_start + timedelta(days=1))
+                           .select('customerID', 'monthlyCharges'))
+  mismatched = (training.where((F.col('label_ts') >= F.lit(interval_start)) & (F.col('label_ts') < F.lit(interval_end)))
+                        .join(expected.withColumnRenamed('monthlyCharges', 'expected'), 'customerID')
+                        .where(F.col('monthlyCharges') != F.col('expected'))
+                        .count())
+  history_rows = spark.table(history_table).count()
+
+  report = {'customers': n_customers, 'versions': args.versions, 'history_rows': history_rows,
+            'record_seconds': round(record_seconds, 3), 'labels': args.labels, 'training_rows': training_rows,
+            'join_seconds': round(join_seconds, 3),
+            'labels_per_second': round(args.labels / join_seconds) if join_seconds else None,
+            'labels_before_history': before_history,
+            'checks': {'one_row_per_label': training_rows == args.labels, 'unmatched': unmatched,
+                       'mismatched_as_of': mismatched},
+            'history': version_reports}
+  print(json.dumps(report, indent=2, default=str))
+  if training_rows != args.labels or unmatched or mismatched:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
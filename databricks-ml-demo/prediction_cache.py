@@ -0,0 +1,207 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Prediction cache
+# MAGIC
+# MAGIC A client-side cache in front of endpoint scoring (`score_model` in `08`). Entries are keyed by the served model version and a SHA-256 of the canonicalized feature row. Canonical means columns sorted by name, numbers as floats (so `1` and `1.0` match), and NaN/None as null.
+# MAGIC
+# MAGIC - Tier 1 is a bounded in-memory LRU. Tier 2, optional, is a SQLite file on local disk, also bounded, that survives restarts. A disk hit is promoted to memory.
+# MAGIC - The served version is checked at most every `version_check_seconds`. When it changes, every entry of the old version is dropped from both tiers.
+# MAGIC - `CachedScorer.score` looks up every row and sends only the misses, deduplicated, in one batch.
+# MAGIC - `stats()` reports hits per tier, misses, hit rate and an estimate of the latency saved. The endpoint calls fit a cost of `round_trip + per_row * rows`; what every request would have cost uncached under that fit, minus the time `score` actually took (cache lookups included), is the saving. A request answered entirely from cache saves a round trip, one that still calls the endpoint only the per-row cost of its hits. `08` puts them on its trace span.
+
+# COMMAND ----------
+
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_disk_schema = '''
+CREATE TABLE IF NOT EXISTS predictions (
+  model_version TEXT, row_hash TEXT, prediction TEXT, created_at REAL, PRIMARY KEY (model_version, row_hash));
+CREATE INDEX IF NOT EXISTS predictions_by_age ON predictions (created_at);
+'''
+
+# COMMAND ----------
+
+def _canonical_value(v):
+  if hasattr(v, 'item'):
+    v = v.item()
+  if v is None or (isinstance(v, float) and math.isnan(v)):
+    return None
+  if isinstance(v, (bool, int, float)):
+    return float(v) + 0.0  # -0.0 -> 0.0
+  return str(v)
+
+
+def row_hash(row):
+  # row: {column: value}
+  canonical = {k: _canonical_value(v) for k, v in row.items()}
+  return hashlib.sha256(json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+# COMMAND ----------
+
+class PredictionCache:
+
+  def __init__(self, max_entries=100000, disk_path=None, max_disk_entries=1000000):
+    self.max_entries = max_entries
+    self.max_disk_entries = max_disk_entries
+    self.model_version = None
+    self._memory = OrderedDict()
+    self._lock = threading.Lock()
+    self._disk = None
+    if disk_path:
+      self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+      self._disk.executescript(_disk_schema)
+
+  def set_model_version(self, model_version):
+    # Returns True when the version changed and older entries were dropped
+    model_version = str(model_version)
+    with self._lock:
+      if model_version == self.model_version:
+        return False
+      self.model_version = model_version
+      self._memory.clear()
+      if self._disk:
+        with self._disk:
+          self._disk.execute('DELETE FROM predictions WHERE model_version != ?', (model_version,))
+      return True
+
+  def get_many(self, hashes):
+    # -> ({hash: prediction}, memory hits, disk hits)
+    found, memory_hits = {}, 0
+    with self._lock:
+      for h in hashes:
+        if h in self._memory:
+          self._memory.move_to_end(h)
+          found[h] = self._memory[h]
+          memory_hits += 1
+    missing = [h for h in hashes if h not in found]
+    disk_found = self._disk_get(missing) if self._disk and missing else {}
+    if disk_found:
+      self._memory_put(disk_found)
+      found.update(disk_found)
+    return found, memory_hits, sum(1 for h in missing if h in disk_found)
+
+  def put_many(self, predictions):
+    self._memory_put(predictions)
+    if self._disk and predictions:
+      now = time.time()
+      with self._lock, self._disk:
+        self._disk.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)',
+                               [(self.model_version, h, json.dumps(p), now) for h, p in predictions.items()])
+        excess = self._disk.execute('SELECT count(*) FROM predictions').fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+          self._disk.execute('DELETE FROM predictions WHERE rowid IN '
+                             '(SELECT rowid FROM predictions ORDER BY created_at LIMIT ?)', (excess,))
+
+  def _memory_put(self, predictions):
+    with self._lock:
+      for h, p in predictions.items():
+        self._memory[h] = p
+        self._memory.move_to_end(h)
+      while len(self._memory) > self.max_entries:
+        self._memory.popitem(last=False)
+
+  def _disk_get(self, hashes, chunk_size=500):
+    found = {}
+    with self._lock:
+      for i in range(0, len(hashes), chunk_size):
+        chunk = hashes[i:i + chunk_size]
+        rows = self._disk.execute(f'''SELECT row_hash, prediction FROM predictions
+                                      WHERE model_version = ? AND row_hash IN ({','.join('?' * len(chunk))})''',
+                                  [self.model_version, *chunk])
+        found.update((h, json.loads(p)) for h, p in rows)
+    return found
+
+  def __len__(self):
+    return len(self._memory)
+
+  def close(self):
+    if self._disk:
+      self._disk.close()
+
+# COMMAND ----------
+
+class CachedScorer:
+  # score_fn(DataFrame) -> list of predictions, one per row; version_fn() -> the version currently served
+
+  def __init__(self, score_fn, version_fn, cache=None, version_check_seconds=60):
+    self.score_fn = score_fn
+    self.version_fn = version_fn
+    self.cache = cache if cache is not None else PredictionCache()
+    self.version_check_seconds = version_check_seconds
+    self._version_checked_at = None
+    self._stats = {'requests': 0, 'rows': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'scored_rows': 0,
+                   'endpoint_calls': 0, 'endpoint_seconds': 0.0, 'score_seconds': 0.0, 'invalidations': 0}
+    # Sums over endpoint calls of rows^2 and rows * seconds, for the round trip / per-row fit
+    self._rows_sq, self._rows_seconds = 0.0, 0.0
+
+  def refresh_version(self, force=False):
+    now = time.time()
+    if force or self._version_checked_at is None or now - self._version_checked_at >= self.version_check_seconds:
+      if self.cache.set_model_version(self.version_fn()):
+        self._stats['invalidations'] += 1
+      self._version_checked_at = now
+    return self.cache.model_version
+
+  def score(self, dataset):
+    # pandas DataFrame in, predictions out in row order; only rows not in the cache are sent, once each
+    request_started = time.perf_counter()
+    self.refresh_version()
+    hashes = [row_hash(row) for row in dataset.to_dict(orient='records')]
+    found, memory_hits, disk_hits = self.cache.get_many(hashes)
+
+    missing, positions = [], {}
+    for i, h in enumerate(hashes):
+      if h not in found and h not in positions:
+        positions[h] = i
+        missing.append(h)
+    if missing:
+      to_score = dataset.iloc[[positions[h] for h in missing]]
+      started = time.perf_counter()
+      predictions = self.score_fn(to_score)
+      seconds = time.perf_counter() - started
+      scored = dict(zip(missing, predictions))
+      self.cache.put_many(scored)
+      found.update(scored)
+      self._stats['endpoint_calls'] += 1
+      self._stats['endpoint_seconds'] += seconds
+      self._stats['scored_rows'] += len(missing)
+      self._rows_sq += len(missing) ** 2
+      self._rows_seconds += len(missing) * seconds
+
+    self._stats['score_seconds'] += time.perf_counter() - request_started
+    self._stats['requests'] += 1
+    self._stats['rows'] += len(hashes)
+    self._stats['memory_hits'] += memory_hits
+    self._stats['disk_hits'] += disk_hits
+    self._stats['misses'] += len(hashes) - memory_hits - disk_hits
+    return [found[h] for h in hashes]
+
+  def endpoint_cost(self):
+    # Least-squares fit of endpoint seconds = round_trip + per_row * rows -> (round_trip, per_row), or None
+    calls, rows, seconds = self._stats['endpoint_calls'], self._stats['scored_rows'], self._stats['endpoint_seconds']
+    if not calls:
+      return None
+    variance = calls * self._rows_sq - rows ** 2
+    # With one batch size only, the two cannot be told apart; crediting no per-row cost keeps the estimate low
+    per_row = max((calls * self._rows_seconds - rows * seconds) / variance, 0.0) if variance > 1e-9 else 0.0
+    round_trip = (seconds - per_row * rows) / calls
+    if round_trip < 0:
+      round_trip, per_row = 0.0, seconds / rows
+    return round_trip, per_row
+
+  def stats(self):
+    s = dict(self._stats, model_version=self.cache.model_version, cached_entries=len(self.cache))
+    s['hit_rate'] = (s['memory_hits'] + s['disk_hits']) / s['rows'] if s['rows'] else None
+    cost = self.endpoint_cost()
+    # Every request uncached under the fitted cost, minus what scoring through the cache actually took
+    s['saved_seconds'] = round(s['requests'] * cost[0] + s['rows'] * cost[1] - s['score_seconds'], 4) if cost else 0.0
+    s['round_trip_ms'], s['per_row_ms'] = (round(cost[0] * 1000, 3), round(cost[1] * 1000, 4)) if cost else (None, None)
+    s['endpoint_seconds'] = round(s['endpoint_seconds'], 4)
+    s['score_seconds'] = round(s['score_seconds'], 4)
+    return s
@@ -0,0 +1,82 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Reason codes
+# MAGIC
+# MAGIC Per-customer explanations for batch scoring: the `top_k` input features that pushed each customer's churn score up the most, with their SHAP values.
+# MAGIC
+# MAGIC - Contributions are exact tree SHAP from XGBoost itself (`pred_contribs`), on features preprocessed by the compiled transform (see `compiled_scorer`). Each model feature maps back to the input column it came from, so a one-hot encoded column gets a single reason. The contributions plus the bias add up to the model's margin.
+# MAGIC - `with_reason_codes` builds the explainer once on the driver and broadcasts it. Each executor's Python worker deserializes it once and reuses it for every task, and every Arrow batch is explained in one vectorized call.
+# MAGIC - The output is flat columns next to the predictions: `reason_1` … `reason_k` (column names, dictionary-encoded by Parquet) and `reason_1_shap` … (float). Reasons are ordered by SHAP value, highest first.
+# MAGIC
+# MAGIC Models the compiler cannot fold raise `ValueError`; `06` then writes predictions without reasons.
+
+# COMMAND ----------
+
+# MAGIC %run ./compiled_scorer
+
+# COMMAND ----------
+
+import numpy as np
+
+from pyspark.sql import types as T
+
+if 'compile_churn_model' not in globals():
+  from compiled_scorer import _xgb_of, compile_churn_model
+
+# COMMAND ----------
+
+class ReasonCodeExplainer:
+
+  def __init__(self, model, input_columns=None, nthread=1):
+    # model: the sklearn Pipeline logged by AutoML or train_churn_model. One thread, as Spark runs a task per core
+    self.scorer = compile_churn_model(model, input_columns)
+    self.input_columns = self.scorer.input_columns
+    xgb = _xgb_of([s for _, s in model.steps][-1])
+    self.booster = xgb.get_booster().copy()
+    self.booster.set_param({'nthread': nthread})
+    best_iteration = getattr(xgb, 'best_iteration', None)
+    self.iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+    # Model feature -> input column it was derived from
+    self.grouping = np.zeros((self.scorer.src.size, len(self.input_columns)), dtype=np.float32)
+    self.grouping[np.arange(self.scorer.src.size), self.scorer.src] = 1
+
+  def contributions(self, X):
+    # -> (rows x input columns SHAP values, bias per row), on the margin (log-odds) scale
+    import xgboost
+
+    matrix = xgboost.DMatrix(self.scorer.transform(X), feature_names=self.booster.feature_names)
+    contribs = self.booster.predict(matrix, pred_contribs=True, iteration_range=self.iteration_range)
+    return contribs[:, :-1] @ self.grouping, contribs[:, -1]
+
+  def top_reasons(self, X, top_k=3):
+    # -> (rows x top_k column names, rows x top_k SHAP values), highest first
+    values, _ = self.contributions(X)
+    order = np.argsort(-values, axis=1, kind='stable')[:, :top_k]
+    return np.asarray(self.input_columns, dtype=object)[order], np.take_along_axis(values, order, axis=1)
+
+# COMMAND ----------
+
+def reason_code_cols(top_k):
+  return [c for i in range(1, top_k + 1) for c in (f'reason_{i}', f'reason_{i}_shap')]
+
+
+def with_reason_codes(spark, df, model_uri, top_k=3):
+  # df with the model's input columns -> same rows with reason_i / reason_i_shap columns appended
+  import mlflow
+
+  explainer = ReasonCodeExplainer(mlflow.sklearn.load_model(model_uri))
+  top_k = min(top_k, len(explainer.input_columns))
+  shared = spark.sparkContext.broadcast(explainer)
+  schema = T.StructType(df.schema.fields + [T.StructField(c, T.FloatType() if c.endswith('_shap') else T.StringType())
+                                            for c in reason_code_cols(top_k)])
+
+  def explain(batches):
+    explainer = shared.value
+    for pdf in batches:
+      names, values = explainer.top_reasons(pdf, top_k)
+      for i in range(top_k):
+        pdf[f'reason_{i + 1}'] = names[:, i]
+        pdf[f'reason_{i + 1}_shap'] = values[:, i].astype('float32')
+      yield pdf
+
+  return df.mapInPandas(explain, schema)
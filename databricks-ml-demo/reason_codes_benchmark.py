@@ -0,0 +1,84 @@
+# Local cost and correctness check of the batch reason codes (reason_codes.py).
+#
+# Trains the churn model on local Spark (train_churn_model, as in compiled_scorer_benchmark), scales the feature
+# table up (as in pipeline_benchmark), then
+#   1. checks on the original rows that the SHAP values plus the bias add up to the model's margin, and that
+#      every reason is one of the model's input columns,
+#   2. times batch scoring with the pyfunc Spark UDF alone and with with_reason_codes on top, both into a noop sink,
+#   3. times the explainer on a single pandas batch, without Spark,
+# and prints the extra seconds per million rows as JSON. Exits non-zero if the contributions do not add up.
+#
+#   python reason_codes_benchmark.py --rows 1000000 --top-k 3
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import pipeline_stages as stages
+import reason_codes
+from pipeline_benchmark import scale_telco_csv, telco_csv
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Reason codes: additivity and extra cost per million rows')
+  parser.add_argument('--rows', type=int, default=1000000)
+  parser.add_argument('--top-k', type=int, default=3)
+  parser.add_argument('--atol', type=float, default=1e-3)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  import mlflow
+  import numpy as np
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-reasons-')
+  mlflow.set_tracking_uri('file:' + os.path.join(workdir, 'mlruns'))
+
+  spark = stages.local_spark('churn-reason-codes')
+  bronze, _ = stages.ingest_bronze(spark, telco_csv, os.path.join(workdir, 'bronze'))
+  model_uri = f"runs:/{stages.train_churn_model(stages.compute_churn_features(bronze), experiment_name='churn_reasons')}/model"
+
+  explainer = reason_codes.ReasonCodeExplainer(mlflow.sklearn.load_model(model_uri))
+  pdf = stages.compute_churn_features(bronze).toPandas()
+  values, bias = explainer.contributions(pdf)
+  margin_gap = float(np.abs(values.sum(axis=1) + bias - explainer.scorer.margin(pdf)).max())
+  names, _ = explainer.top_reasons(pdf, args.top_k)
+  unknown = sorted(set(names.ravel()) - set(explainer.input_columns))
+
+  started = time.perf_counter()
+  explainer.top_reasons(pdf, args.top_k)
+  pandas_seconds = time.perf_counter() - started
+
+  csv_path = scale_telco_csv(telco_csv, os.path.join(workdir, f'telco_{args.rows}.csv'), args.rows)
+  big_bronze, _ = stages.ingest_bronze(spark, csv_path, os.path.join(workdir, 'bronze_scaled'))
+  features = stages.compute_churn_features(big_bronze).cache()
+  rows = features.count()
+  model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri)
+  scored = features.withColumn('predictions', model(*features.columns))
+
+  started = time.perf_counter()
+  scored.write.format('noop').mode('overwrite').save()
+  predict_seconds = time.perf_counter() - started
+
+  started = time.perf_counter()
+  reason_codes.with_reason_codes(spark, scored, model_uri, args.top_k).write.format('noop').mode('overwrite').save()
+  explained_seconds = time.perf_counter() - started
+
+  per_million = 1e6 / rows
+  report = {'rows': rows, 'top_k': args.top_k, 'input_columns': len(explainer.input_columns),
+            'max_margin_gap': margin_gap, 'unknown_reasons': unknown,
+            'predict_seconds': round(predict_seconds, 3),
+            'predict_with_reasons_seconds': round(explained_seconds, 3),
+            'extra_seconds_per_million_rows': round((explained_seconds - predict_seconds) * per_million, 3),
+            'pandas_explain_seconds_per_million_rows': round(pandas_seconds * 1e6 / len(pdf), 3)}
+  print(json.dumps(report, indent=2))
+  if margin_gap > args.atol or unknown:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
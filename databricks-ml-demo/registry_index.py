@@ -0,0 +1,235 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Registry index
+# MAGIC
+# MAGIC A local SQLite copy of the model registry's metadata (registered models, versions, stages, run ids and tags), so stage/version resolution, tag queries and name-prefix searches are answered on the driver without a round trip to the registry server.
+# MAGIC
+# MAGIC - `sync()` is incremental: it pages through the registered models once and refetches the versions of only those models whose `last_updated_timestamp` moved (new versions and stage transitions bump it). Version tags don't bump it, so every `full_sync_seconds` all versions are refetched.
+# MAGIC - Queries sync first when the index is older than `max_age_seconds`, which bounds how stale an answer can be. `max_age_seconds=None` never syncs implicitly. Lookups of one model (`resolve`, `latest_version`, `get_version`) only refresh that model (`sync_model`: one `get_registered_model` and one `search_model_versions`), so a cold index on a fresh job cluster costs about what the lookup it replaces did. Prefix and tag searches need the whole registry.
+# MAGIC - One file per registry URI, on driver-local disk. Pass `durable_path` (e.g. under `/dbfs`) to copy the index from there when the driver has none and back after every sync, so job clusters start warm.
+# MAGIC - Works against any `MlflowClient`, including a local `file:` store (see `registry_index_benchmark.py`).
+
+# COMMAND ----------
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+_index_schema = '''
+CREATE TABLE IF NOT EXISTS models (
+  name TEXT PRIMARY KEY, description TEXT, last_updated_timestamp INTEGER);
+CREATE TABLE IF NOT EXISTS model_tags (
+  name TEXT, key TEXT, value TEXT, PRIMARY KEY (name, key));
+CREATE TABLE IF NOT EXISTS versions (
+  name TEXT, version INTEGER, current_stage TEXT, run_id TEXT, source TEXT, status TEXT,
+  creation_timestamp INTEGER, last_updated_timestamp INTEGER, PRIMARY KEY (name, version));
+CREATE INDEX IF NOT EXISTS versions_by_stage ON versions (name, current_stage, version);
+CREATE TABLE IF NOT EXISTS version_tags (
+  name TEXT, version INTEGER, key TEXT, value TEXT, PRIMARY KEY (name, version, key));
+CREATE INDEX IF NOT EXISTS version_tags_by_key ON version_tags (key, value);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+'''
+
+
+def default_index_path(registry_uri):
+  # Driver-local disk: SQLite needs real file locking, which DBFS FUSE does not give
+  digest = hashlib.sha1(str(registry_uri).encode()).hexdigest()[:12]
+  return os.path.join(tempfile.gettempdir(), f'churn_registry_index_{digest}.sqlite')
+
+
+def _name_filter(name):
+  # The filter grammar has no escapes, so quote with whichever quote the name doesn't contain
+  if "'" not in name:
+    return f"name='{name}'"
+  if '"' not in name:
+    return f'name="{name}"'
+  raise ValueError(f'Model name {name!r} contains both quote characters and cannot be filtered on')
+
+# COMMAND ----------
+
+class RegistryIndex:
+
+  def __init__(self, client=None, path=None, max_age_seconds=300, full_sync_seconds=3600, page_size=1000,
+               durable_path=None):
+    if client is None:
+      from mlflow.tracking import MlflowClient
+      client = MlflowClient()
+    self.client = client
+    self.path = path or default_index_path(client._registry_uri)
+    self.max_age_seconds = max_age_seconds
+    self.full_sync_seconds = full_sync_seconds
+    self.page_size = page_size
+    self.durable_path = durable_path
+    if durable_path and os.path.exists(durable_path) and not os.path.exists(self.path):
+      shutil.copyfile(durable_path, self.path)
+    self._db = sqlite3.connect(self.path, check_same_thread=False)
+    self._db.row_factory = sqlite3.Row
+    self._db.executescript(_index_schema)
+
+  def _state(self, key, default=None):
+    row = self._db.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+    return row['value'] if row else default
+
+  def age_seconds(self):
+    synced_at = self._state('synced_at')
+    return None if synced_at is None else time.time() - float(synced_at)
+
+  def _stale(self, synced_at):
+    return self.max_age_seconds is not None and (
+      synced_at is None or time.time() - float(synced_at) > self.max_age_seconds)
+
+  def ensure_fresh(self, name=None):
+    # With a model name, only that model has to be fresh
+    if not self._stale(self._state('synced_at')):
+      return
+    if name is None:
+      self.sync()
+    elif self._stale(self._state(f'model_synced_at:{name}')):
+      self.sync_model(name)
+
+  def _persist(self):
+    # SQLite's backup gives a consistent copy; it is written next to the target and renamed into place
+    if not self.durable_path:
+      return
+    os.makedirs(os.path.dirname(self.durable_path) or '.', exist_ok=True)
+    local_copy = self.path + '.backup'
+    with sqlite3.connect(local_copy) as backup:
+      self._db.backup(backup)
+    backup.close()
+    shutil.copyfile(local_copy, self.durable_path + '.tmp')
+    os.replace(self.durable_path + '.tmp', self.durable_path)
+    os.remove(local_copy)
+
+  # Sync
+
+  def _paged(self, search, **kwargs):
+    page_token, seen = None, set()
+    while True:
+      try:
+        page = search(max_results=self.page_size, page_token=page_token, **kwargs)
+        next_token = getattr(page, 'token', None)
+      except TypeError:
+        # Older MLflow: search_model_versions is not paged, and returns what earlier pages may already have given
+        page, next_token = search(**kwargs), None
+      for item in page:
+        key = (item.name, getattr(item, 'version', None))
+        if key not in seen:
+          seen.add(key)
+          yield item
+      if not next_token:
+        return
+      page_token = next_token
+
+  def sync(self, full=False):
+    started = time.time()
+    last_full = float(self._state('full_synced_at', 0))
+    full = full or started - last_full > self.full_sync_seconds
+
+    known = {r['name']: r['last_updated_timestamp'] for r in self._db.execute('SELECT name, last_updated_timestamp FROM models')}
+    listed = {m.name: m for m in self._paged(self.client.search_registered_models)}
+    changed = [m for name, m in listed.items() if full or known.get(name) != m.last_updated_timestamp]
+    removed = [name for name in known if name not in listed]
+
+    versions = {m.name: list(self._paged(self.client.search_model_versions, filter_string=_name_filter(m.name)))
+                for m in changed}
+
+    with self._db:
+      self._replace_models(changed, versions, removed)
+      self._db.execute("INSERT OR REPLACE INTO sync_state VALUES ('synced_at', ?)", (str(started),))
+      if full:
+        self._db.execute("INSERT OR REPLACE INTO sync_state VALUES ('full_synced_at', ?)", (str(started),))
+    self._persist()
+
+    return {'models': len(listed), 'refreshed': len(changed), 'removed': len(removed), 'full': full,
+            'seconds': round(time.time() - started, 3)}
+
+  def sync_model(self, name):
+    # Refreshes one registered model and its versions, leaving the rest of the index alone
+    from mlflow.exceptions import MlflowException
+
+    started = time.time()
+    try:
+      model = self.client.get_registered_model(name)
+    except MlflowException:
+      model = None
+    versions = {}
+    if model:
+      versions[name] = list(self._paged(self.client.search_model_versions, filter_string=_name_filter(name)))
+    with self._db:
+      self._replace_models([model] if model else [], versions, [] if model else [name])
+      self._db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (f'model_synced_at:{name}', str(started)))
+    self._persist()
+    return {'model': name, 'versions': len(versions.get(name, [])), 'seconds': round(time.time() - started, 3)}
+
+  def _replace_models(self, models, versions, removed):
+    for name in removed + [m.name for m in models]:
+      for table in ('models', 'model_tags', 'versions', 'version_tags'):
+        self._db.execute(f'DELETE FROM {table} WHERE name = ?', (name,))
+    for m in models:
+      self._db.execute('INSERT INTO models VALUES (?, ?, ?)', (m.name, m.description, m.last_updated_timestamp))
+      self._db.executemany('INSERT INTO model_tags VALUES (?, ?, ?)', [(m.name, k, v) for k, v in (m.tags or {}).items()])
+      for v in versions[m.name]:
+        self._db.execute('INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (v.name, int(v.version), v.current_stage, v.run_id, v.source, v.status,
+                          v.creation_timestamp, v.last_updated_timestamp))
+        self._db.executemany('INSERT INTO version_tags VALUES (?, ?, ?, ?)',
+                             [(v.name, int(v.version), k, val) for k, val in (v.tags or {}).items()])
+
+  # Queries
+
+  def _version_dict(self, row):
+    if row is None:
+      return None
+    version = dict(row)
+    version['tags'] = {r['key']: r['value'] for r in self._db.execute(
+      'SELECT key, value FROM version_tags WHERE name = ? AND version = ?', (row['name'], row['version']))}
+    return version
+
+  def latest_version(self, name, stage):
+    self.ensure_fresh(name)
+    row = self._db.execute('''SELECT * FROM versions WHERE name = ? AND lower(current_stage) = lower(?)
+                              ORDER BY version DESC LIMIT 1''', (name, stage)).fetchone()
+    return self._version_dict(row)
+
+  def get_version(self, name, version):
+    self.ensure_fresh(name)
+    row = self._db.execute('SELECT * FROM versions WHERE name = ? AND version = ?', (name, int(version))).fetchone()
+    return self._version_dict(row)
+
+  def resolve(self, name, stage_or_version):
+    # 'Staging' or '7' -> the version's metadata; raises if the registry has no such version
+    ref = str(stage_or_version)
+    version = self.get_version(name, ref) if ref.isdigit() else self.latest_version(name, ref)
+    if version is None:
+      age = self.age_seconds()
+      synced = 'never synced' if age is None else f'synced {age:.0f}s ago'
+      raise ValueError(f'No version {ref} of {name} in the registry index ({synced})')
+    return version
+
+  def model_uri(self, name, stage_or_version):
+    # Pinned to a version number, so loading the model does not resolve the stage on the server again
+    return f"models:/{name}/{self.resolve(name, stage_or_version)['version']}"
+
+  def search_models(self, prefix=''):
+    self.ensure_fresh()
+    pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return [r['name'] for r in self._db.execute(
+      "SELECT name FROM models WHERE name LIKE ? ESCAPE '\\' ORDER BY name", (pattern,))]
+
+  def versions_with_tag(self, key, value=None, name=None):
+    self.ensure_fresh(name)
+    query = 'SELECT v.* FROM versions v JOIN version_tags t USING (name, version) WHERE t.key = ?'
+    params = [key]
+    if value is not None:
+      query += ' AND t.value = ?'
+      params.append(str(value))
+    if name is not None:
+      query += ' AND v.name = ?'
+      params.append(name)
+    return [self._version_dict(r) for r in self._db.execute(query + ' ORDER BY v.name, v.version', params)]
+
+  def close(self):
+    self._db.close()
@@ -0,0 +1,101 @@
+# Local check of the registry index against a file-based MLflow registry.
+#
+# Registers --models models with --versions versions each (every other one moved to Staging, the
+# last one to Production, a few tagged), then compares the answers and timings of
+#   1. the registry client (get_latest_versions, search_registered_models + client-side prefix filter), and
+#   2. RegistryIndex, after one sync,
+# and re-syncs after a stage transition to show only the changed model is refetched. A cold index (as on a fresh job
+# cluster) then resolves one model: only that model is fetched, and the copy kept at a durable path lets the next
+# cold start skip even that.
+#
+#   python registry_index_benchmark.py --models 50 --versions 5 --lookups 200
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from registry_index import RegistryIndex
+
+
+def build_registry(client, models, versions):
+  names = []
+  for i in range(models):
+    name = f"{'churn' if i % 2 else 'ranking'}_model_{i:03d}"
+    client.create_registered_model(name)
+    for v in range(1, versions + 1):
+      client.create_model_version(name, source=f'file:/tmp/{name}/{v}')
+      if v % 2 == 0:
+        client.transition_model_version_stage(name, v, 'Staging')
+      if v % 3 == 0:
+        client.set_model_version_tag(name, v, 'demo_test', 'pass')
+    client.transition_model_version_stage(name, versions, 'Production')
+    names.append(name)
+  return names
+
+
+def timed(fn, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    result = fn()
+  return result, round((time.perf_counter() - start) / repeat * 1000, 3)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Registry client vs local registry index on a file store')
+  parser.add_argument('--models', type=int, default=50)
+  parser.add_argument('--versions', type=int, default=5)
+  parser.add_argument('--lookups', type=int, default=200)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  from mlflow.tracking import MlflowClient
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-registry-index-')
+  store = 'file:' + os.path.join(workdir, 'mlruns')
+  client = MlflowClient(tracking_uri=store, registry_uri=store)
+  names = build_registry(client, args.models, args.versions)
+
+  index = RegistryIndex(client, path=os.path.join(workdir, 'index.sqlite'), max_age_seconds=None)
+  report = {'models': args.models, 'versions': args.versions, 'initial_sync': index.sync()}
+
+  rng = random.Random(0)
+  lookups = [(rng.choice(names), rng.choice(['Staging', 'Production'])) for _ in range(args.lookups)]
+  expected, report['client_latest_ms'] = timed(
+    lambda: [client.get_latest_versions(n, [s])[0].version for n, s in lookups], 1)
+  actual, report['index_latest_ms'] = timed(
+    lambda: [index.latest_version(n, s)['version'] for n, s in lookups], 1)
+  assert [int(v) for v in expected] == actual, 'latest version mismatch'
+
+  expected, report['client_prefix_search_ms'] = timed(
+    lambda: sorted(m.name for m in client.search_registered_models() if m.name.startswith('churn_')), 5)
+  actual, report['index_prefix_search_ms'] = timed(lambda: index.search_models('churn_'), 5)
+  assert expected == actual, 'prefix search mismatch'
+
+  tagged = index.versions_with_tag('demo_test', 'pass')
+  assert len(tagged) == args.models * (args.versions // 3), 'tag query mismatch'
+
+  # One transition -> one model refetched
+  client.transition_model_version_stage(names[0], 1, 'Production', archive_existing_versions=True)
+  report['incremental_sync'] = index.sync()
+  assert index.latest_version(names[0], 'Production')['version'] == 1, 'stale after incremental sync'
+
+  # Cold start with a durable copy: one model is synced, then the copy is reused by the next cold index
+  durable = os.path.join(workdir, 'durable', 'index.sqlite')
+  cold = RegistryIndex(client, path=os.path.join(workdir, 'cold_1.sqlite'), durable_path=durable)
+  started = time.perf_counter()
+  assert cold.model_uri(names[1], 'Staging') == f"models:/{names[1]}/{index.latest_version(names[1], 'Staging')['version']}"
+  report['cold_resolve_ms'] = round((time.perf_counter() - started) * 1000, 2)
+  assert cold._db.execute('SELECT count(*) FROM models').fetchone()[0] == 1, 'cold lookup synced everything'
+  warm = RegistryIndex(client, path=os.path.join(workdir, 'cold_2.sqlite'), durable_path=durable)
+  assert warm._state(f'model_synced_at:{names[1]}') is not None, 'durable copy not reused'
+
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()
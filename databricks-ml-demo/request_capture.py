@@ -0,0 +1,188 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Request capture and replay
+# MAGIC
+# MAGIC Records the traffic a scoring client (`score_model` in `08`) or a local server (the stand-in in `load_generator.py`) handles, so a candidate model version can be run against real requests before it is promoted (`05`, or `request_replay.py` locally).
+# MAGIC
+# MAGIC - `RequestCapture.record` only appends the request's columns, rows, predictions, status and latency to a bounded in-memory ring buffer. When the buffer is full the oldest request is dropped and counted, so capture never slows scoring down or grows without bound.
+# MAGIC - A background thread flushes the buffer every `flush_seconds`, or sooner once `flush_requests` are waiting. Each flush writes one zstd-compressed Parquet file, one row per scored row: the features, the served prediction and the request metadata (`capture_cols`). Files are written under a temporary name and renamed, so readers never see half a file. Write errors are counted, not raised.
+# MAGIC - `replay` runs the captured rows through a candidate model in batches of `batch_size`, one vectorized `predict` per batch. It reports the candidate's latency per batch and per row next to the served latency, agreement with the served predictions overall and per served version, and a table of the rows that changed.
+
+# COMMAND ----------
+
+import glob
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+capture_cols = ['request_id', 'captured_at', 'served_version', 'status', 'latency_ms', 'prediction']
+
+# COMMAND ----------
+
+class RequestCapture:
+
+  def __init__(self, directory, capacity=10000, flush_requests=1000, flush_seconds=30.0, sample_rate=1.0):
+    self.directory = directory
+    self.flush_requests = flush_requests
+    self.flush_seconds = flush_seconds
+    self.sample_rate = sample_rate
+    self._buffer = deque(maxlen=capacity)
+    self._lock = threading.Condition()
+    self._closing = False
+    self._sequence = 0
+    self._stats = {'requests': 0, 'sampled_out': 0, 'dropped': 0, 'files': 0, 'rows_written': 0, 'write_errors': 0}
+    os.makedirs(directory, exist_ok=True)
+    self._flusher = threading.Thread(target=self._run, name='request-capture', daemon=True)
+    self._flusher.start()
+
+  def record(self, columns, rows, predictions, latency_ms=None, status=200, served_version=None):
+    # columns/rows as in a dataframe_split payload; one prediction per row (or None when the request failed)
+    with self._lock:
+      self._stats['requests'] += 1
+      if self.sample_rate < 1 and random.random() >= self.sample_rate:
+        self._stats['sampled_out'] += 1
+        return
+      if len(self._buffer) == self._buffer.maxlen:
+        self._stats['dropped'] += 1
+      self._buffer.append((uuid.uuid4().hex, time.time(), served_version, status, latency_ms, list(columns), rows,
+                           predictions))
+      if len(self._buffer) >= self.flush_requests:
+        self._lock.notify()
+
+  def _run(self):
+    while True:
+      with self._lock:
+        if not self._closing and len(self._buffer) < self.flush_requests:
+          self._lock.wait(self.flush_seconds)
+        closing = self._closing
+        entries = list(self._buffer)
+        self._buffer.clear()
+      if entries:
+        self._write(entries)
+      if closing:
+        return
+
+  def _frame(self, entries):
+    import pandas as pd
+
+    frames = []
+    for request_id, captured_at, served_version, status, latency_ms, columns, rows, predictions in entries:
+      frame = pd.DataFrame(rows, columns=columns)
+      n = len(frame)
+      frame['prediction'] = list(predictions) if predictions is not None and len(predictions) == n else [None] * n
+      for col, value in zip(capture_cols[:-1], (request_id, captured_at, served_version, status, latency_ms)):
+        frame[col] = value
+      frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+  def _write(self, entries):
+    try:
+      frame = self._frame(entries)
+      with self._lock:
+        self._sequence += 1
+        sequence = self._sequence
+      name = f'capture-{time.strftime("%Y%m%dT%H%M%S", time.gmtime())}-{os.getpid()}-{sequence:06d}.parquet'
+      tmp = os.path.join(self.directory, '.' + name)
+      frame.to_parquet(tmp, compression='zstd', index=False)
+      os.replace(tmp, os.path.join(self.directory, name))
+      with self._lock:
+        self._stats['files'] += 1
+        self._stats['rows_written'] += len(frame)
+    except Exception:
+      with self._lock:
+        self._stats['write_errors'] += 1
+
+  def flush(self):
+    with self._lock:
+      entries = list(self._buffer)
+      self._buffer.clear()
+    if entries:
+      self._write(entries)
+
+  def close(self, timeout=30):
+    with self._lock:
+      self._closing = True
+      self._lock.notify()
+    self._flusher.join(timeout)
+    self.flush()
+
+  def stats(self):
+    with self._lock:
+      return dict(self._stats, buffered=len(self._buffer))
+
+# COMMAND ----------
+
+def load_capture(directory, since=None):
+  # Every captured row, oldest first; `since` is an epoch time
+  import pandas as pd
+
+  files = sorted(glob.glob(os.path.join(directory, 'capture-*.parquet')))
+  if not files:
+    return pd.DataFrame(columns=capture_cols)
+  captured = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+  if since is not None:
+    captured = captured[captured['captured_at'] >= since]
+  return captured.sort_values('captured_at', kind='stable').reset_index(drop=True)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Replay
+
+# COMMAND ----------
+
+def _percentiles_ms(seconds):
+  import numpy as np
+
+  if not len(seconds):
+    return {}
+  values = np.asarray(seconds, dtype=float) * 1000
+  return {f'p{p:g}_ms': round(float(np.percentile(values, p)), 3) for p in (50, 90, 99)}
+
+
+def _agree(served, candidate, atol):
+  import numpy as np
+  import pandas as pd
+
+  served_num, candidate_num = pd.to_numeric(served, errors='coerce'), pd.to_numeric(candidate, errors='coerce')
+  numeric = served_num.notna() & candidate_num.notna()
+  return np.where(numeric, (served_num - candidate_num).abs() <= atol,
+                  served.astype(str).to_numpy() == candidate.astype(str).to_numpy())
+
+
+def replay(captured, model, batch_size=10000, atol=1e-6):
+  # Captured rows -> candidate predictions in vectorized batches -> (report, rows whose prediction changed)
+  import pandas as pd
+
+  captured = captured[(captured['status'] == 200) & captured['prediction'].notna()].reset_index(drop=True)
+  feature_cols = [c for c in captured.columns if c not in capture_cols]
+  predictions, batch_seconds = [], []
+  for start in range(0, len(captured), batch_size):
+    batch = captured.iloc[start:start + batch_size][feature_cols]
+    started = time.perf_counter()
+    predictions.append(pd.Series(list(model.predict(batch)), index=batch.index))
+    batch_seconds.append(time.perf_counter() - started)
+
+  candidate = pd.concat(predictions) if predictions else pd.Series([], dtype=object)
+  agree = pd.Series(_agree(captured['prediction'], candidate, atol), index=captured.index)
+  changed = captured.loc[~agree, ['request_id', 'captured_at', 'served_version', 'prediction']].assign(
+    candidate_prediction=candidate[~agree])
+
+  by_version = agree.groupby(captured['served_version'].fillna('unknown')).mean()
+  # Most frequent served -> candidate changes, e.g. 0 -> 1
+  changes = (changed.groupby([changed['prediction'].astype(str), changed['candidate_prediction'].astype(str)]).size()
+             .sort_values(ascending=False).head(20))
+  report = {'rows': len(captured),
+            'requests': int(captured['request_id'].nunique()),
+            'batches': len(batch_seconds),
+            'candidate_latency': dict(_percentiles_ms(batch_seconds), us_per_row=(
+              round(sum(batch_seconds) / len(captured) * 1e6, 3) if len(captured) else None)),
+            'served_latency': _percentiles_ms(captured.drop_duplicates('request_id')['latency_ms'].dropna() / 1000),
+            'agreement': round(float(agree.mean()), 6) if len(captured) else None,
+            'agreement_by_served_version': {str(v): round(float(a), 6) for v, a in by_version.items()},
+            'changed_rows': len(changed),
+            'changes': [{'served': s, 'candidate': c, 'rows': int(n)} for (s, c), n in changes.items()]}
+  return report, changed
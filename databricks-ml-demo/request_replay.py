@@ -0,0 +1,46 @@
+# Replays captured scoring traffic (request_capture.py) through a candidate model version.
+#
+# Reads the Parquet files a RequestCapture wrote (from 08's score_model, or `load_generator.py --stand-in
+# --capture-dir`), runs every successfully served row through the candidate in vectorized batches, and prints
+# its latency, agreement with the served predictions (overall and per served version) and the most frequent
+# changes as JSON. Optionally writes the changed rows to Parquet, and exits non-zero below --min-agreement.
+#
+#   python request_replay.py --capture-dir /tmp/churn_capture --model-uri models:/churn/4 --changed changed.parquet
+
+import argparse
+import json
+import os
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import request_capture
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Replay captured scoring traffic through a candidate model')
+  parser.add_argument('--capture-dir', required=True)
+  parser.add_argument('--model-uri', required=True, help='candidate model, e.g. models:/<name>/<version> or runs:/<id>/model')
+  parser.add_argument('--since-hours', type=float, default=None, help='only traffic captured in the last N hours')
+  parser.add_argument('--batch-size', type=int, default=10000)
+  parser.add_argument('--changed', default=None, help='write the rows whose prediction changed to this Parquet file')
+  parser.add_argument('--min-agreement', type=float, default=None)
+  args = parser.parse_args(argv)
+
+  import mlflow.pyfunc
+
+  since = time.time() - args.since_hours * 3600 if args.since_hours else None
+  captured = request_capture.load_capture(args.capture_dir, since)
+  model = mlflow.pyfunc.load_model(args.model_uri)
+  report, changed = request_capture.replay(captured, model, args.batch_size)
+  report['model_uri'] = args.model_uri
+  if args.changed:
+    changed.to_parquet(args.changed, compression='zstd', index=False)
+  print(json.dumps(report, indent=2))
+  if args.min_agreement is not None and report['agreement'] is not None and report['agreement'] < args.min_agreement:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,177 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Stratified samples
+# MAGIC
+# MAGIC Small copies of the pipeline tables for development and CI runs, registered next to the full ones as `<table>_sample` (e.g. `churn_features_sample`).
+# MAGIC
+# MAGIC - Rows are stratified on the label and the demographic columns (`churn`, `seniorCitizen`, `gender_Female` for the features), so every slice that `05` checks is in the sample. Each stratum keeps `fraction` of its rows, and at least `min_per_stratum` of them.
+# MAGIC - Selection is a hash of `customerID` and a seed, so the same source version always gives the same sample.
+# MAGIC - The sample records the Delta version it was built from. A refresh is skipped when the source has not moved; otherwise it is MERGEd, so only rows that entered, left or changed are rewritten.
+# MAGIC - Population and sample sizes per stratum are kept as table properties, so metrics computed on the sample can be reweighted and given error bounds (`stratified_accuracy`).
+
+# COMMAND ----------
+
+# MAGIC %run ./snapshots
+
+# COMMAND ----------
+
+import json
+import math
+
+from pyspark.sql import functions as F
+
+if 'table_version' not in globals():
+  from snapshots import table_version
+
+sample_suffix = '_sample'
+data_modes = ['full', 'sample']
+
+# Resolution of the per-row hash used to pick rows
+_hash_buckets = 1000000
+
+# COMMAND ----------
+
+def sample_table_name(table):
+  return table + sample_suffix
+
+
+def resolve_table(table, mode='full'):
+  # Table a notebook should read for the `data_mode` widget
+  if mode not in data_modes:
+    raise ValueError(f'data_mode must be one of {data_modes}, got {mode}')
+  return sample_table_name(table) if mode == 'sample' else table
+
+
+def stratum_fraction(population, fraction, min_per_stratum):
+  return min(1.0, max(fraction, min_per_stratum / population)) if population else 1.0
+
+
+def _stratum_condition(values):
+  return F.expr(' AND '.join(f'`{c}` <=> {_sql_literal(v)}' for c, v in values.items()))
+
+
+def _sql_literal(value):
+  if value is None:
+    return 'NULL'
+  if isinstance(value, str):
+    return "'" + value.replace("'", "\\'") + "'"
+  return str(value).lower() if isinstance(value, bool) else str(value)
+
+# COMMAND ----------
+
+def sample_properties(spark, sample_table):
+  # Sampling metadata stored on the sample table, or None when it does not exist
+  if table_version(spark, sample_table) is None:
+    return None
+  props = {r['key']: r['value'] for r in spark.sql(f'SHOW TBLPROPERTIES {sample_table}').collect()}
+  if 'churn.sample.source_version' not in props:
+    return None
+  return {'source_table': props['churn.sample.source_table'],
+          'source_version': int(props['churn.sample.source_version']),
+          'params': json.loads(props['churn.sample.params']),
+          'strata': json.loads(props['churn.sample.strata'])}
+
+
+def refresh_sample(spark, source_table, strata_cols, fraction=0.05, min_per_stratum=500, key_col='customerID',
+                   seed=42, force=False):
+  sample_table = sample_table_name(source_table)
+  version = table_version(spark, source_table)
+  if version is None:
+    raise ValueError(f'{source_table} does not exist')
+
+  params = {'strata_cols': list(strata_cols), 'fraction': fraction, 'min_per_stratum': min_per_stratum,
+            'key_col': key_col, 'seed': seed}
+  current = sample_properties(spark, sample_table)
+  if not force and current and current['source_version'] == version and current['params'] == params:
+    return {'sample_table': sample_table, 'source_version': version, 'action': 'unchanged',
+            'strata': current['strata']}
+
+  # Pin the source version so the sample and its metadata describe the same data
+  source = spark.sql(f'SELECT * FROM {source_table} VERSION AS OF {version}')
+
+  strata = []
+  for row in source.groupBy(*strata_cols).count().collect():
+    values = {c: row[c] for c in strata_cols}
+    strata.append({'values': values, 'population': row['count'],
+                   'fraction': stratum_fraction(row['count'], fraction, min_per_stratum)})
+
+  keep_below = F.lit(0.0)
+  for s in strata:
+    keep_below = F.when(_stratum_condition(s['values']), F.lit(s['fraction'])).otherwise(keep_below)
+  u = F.pmod(F.xxhash64(F.col(key_col), F.lit(seed)), F.lit(_hash_buckets)) / _hash_buckets
+  sample = source.where(u < keep_below)
+
+  if current is None or force:
+    sample.write.format('delta').mode('overwrite').option('overwriteSchema', 'true').saveAsTable(sample_table)
+    action = 'created' if current is None else 'rebuilt'
+  else:
+    from delta.tables import DeltaTable
+
+    changed = ' OR '.join(f'NOT (t.`{c}` <=> s.`{c}`)' for c in sample.columns if c != key_col)
+    (DeltaTable.forName(spark, sample_table).alias('t')
+       .merge(sample.alias('s'), f't.`{key_col}` = s.`{key_col}`')
+       .whenMatchedUpdateAll(condition=changed or None)
+       .whenNotMatchedInsertAll()
+       .whenNotMatchedBySourceDelete()
+       .execute())
+    action = 'merged'
+
+  sampled = {tuple(r[c] for c in strata_cols): r['count']
+             for r in spark.table(sample_table).groupBy(*strata_cols).count().collect()}
+  for s in strata:
+    s['sampled'] = sampled.get(tuple(s['values'][c] for c in strata_cols), 0)
+
+  spark.sql(f"""ALTER TABLE {sample_table} SET TBLPROPERTIES (
+    'churn.sample.source_table' = '{source_table}',
+    'churn.sample.source_version' = '{version}',
+    'churn.sample.params' = {_sql_literal(json.dumps(params))},
+    'churn.sample.strata' = {_sql_literal(json.dumps(strata, default=str))})""")
+  return {'sample_table': sample_table, 'source_version': version, 'action': action, 'strata': strata}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Error bounds
+# MAGIC
+# MAGIC `stratified_accuracy` computes per-slice accuracy (the `05` demographic check) from per-stratum counts: a small pandas frame with the stratification columns, `acc` (correct predictions) and `obs` (rows), aggregated in Spark. On a sample, each stratum is weighted by its population share within the slice, and the standard error is the stratified one with finite population correction:
+# MAGIC
+# MAGIC `se² = Σ_h W_h² · (1 − n_h/N_h) · p_h(1 − p_h) / (n_h − 1)`
+# MAGIC
+# MAGIC `pct_acc_low`/`pct_acc_high` are the `z` (default 95%) normal bounds. On the full table (`strata=None`) the bounds collapse onto `pct_acc` and the counts only need the slice columns. Slices must be built from stratification columns, so that each stratum falls in exactly one slice.
+
+# COMMAND ----------
+
+def stratified_accuracy(counts, group_cols, strata=None, z=1.96):
+  import pandas as pd
+
+  group_cols = list(group_cols)
+  if not strata:
+    by_group = counts.groupby(group_cols).agg(acc=('acc', 'sum'), obs=('obs', 'sum'))
+    by_group['pct_acc'] = by_group.acc / by_group.obs
+    by_group['population'] = by_group.obs
+    by_group['std_err'] = 0.0
+  else:
+    strata_cols = list(strata[0]['values'])
+    missing = set(group_cols) - set(strata_cols)
+    if missing:
+      raise ValueError(f'Slice columns {sorted(missing)} are not stratification columns {strata_cols}')
+    populations = pd.DataFrame([dict(s['values'], population=s['population']) for s in strata])
+    for c in strata_cols:
+      populations[c] = populations[c].astype(counts[c].dtype)
+
+    by_stratum = counts.merge(populations, on=strata_cols, how='left')
+    by_stratum['p'] = by_stratum.acc / by_stratum.obs
+    by_stratum['var'] = ((1 - by_stratum.obs / by_stratum.population) * by_stratum.p * (1 - by_stratum.p)
+                         / (by_stratum.obs - 1).clip(lower=1))
+    by_stratum['weighted_p'] = by_stratum.p * by_stratum.population
+    by_stratum['weighted_var'] = by_stratum['var'] * by_stratum.population ** 2
+
+    by_group = by_stratum.groupby(group_cols).agg(acc=('acc', 'sum'), obs=('obs', 'sum'), population=('population', 'sum'),
+                                                  weighted_p=('weighted_p', 'sum'), weighted_var=('weighted_var', 'sum'))
+    by_group['pct_acc'] = by_group.weighted_p / by_group.population
+    by_group['std_err'] = by_group.weighted_var.clip(lower=0).map(math.sqrt) / by_group.population
+    by_group = by_group.drop(columns=['weighted_p', 'weighted_var'])
+
+  by_group['pct_acc_low'] = (by_group.pct_acc - z * by_group.std_err).clip(lower=0)
+  by_group['pct_acc_high'] = (by_group.pct_acc + z * by_group.std_err).clip(upper=1)
+  return by_group[['acc', 'obs', 'population', 'pct_acc', 'std_err', 'pct_acc_low', 'pct_acc_high']]
@@ -0,0 +1,122 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Telco schema contract
+# MAGIC
+# MAGIC The one place that says what the IBM telco churn CSV looks like and what the bronze table is called column by column. Every reader of the CSV (`00a`, `00b`, the local benchmark) goes through here, so nobody runs `inferSchema` (an extra full pass over the file) or keeps its own `StructType`.
+# MAGIC
+# MAGIC - `telco_contract` maps each CSV header to its bronze column and type. The header is checked on read (`enforceSchema=false`), so a renamed or reordered source column fails loudly instead of shifting data.
+# MAGIC - Rows that do not parse (e.g. the blank `TotalCharges` of brand-new customers), have no `customerID` or have a label other than Yes/No are not dropped: they go to a quarantine Delta table with the reason, raw line, source file and run id.
+# MAGIC - Bump `telco_schema_version` whenever the contract changes; it is stamped on every bronze commit (`userMetadata`) and every quarantined row.
+
+# COMMAND ----------
+
+import uuid
+
+from pyspark import StorageLevel
+from pyspark.sql import functions as F
+from pyspark.sql.types import StructType,StructField,DoubleType, StringType
+
+telco_schema_version = 1
+
+# (CSV header, bronze column, type)
+telco_contract = [
+  ('customerID', 'customerID', StringType()),
+  ('gender', 'gender', StringType()),
+  ('SeniorCitizen', 'seniorCitizen', DoubleType()),
+  ('Partner', 'partner', StringType()),
+  ('Dependents', 'dependents', StringType()),
+  ('tenure', 'tenure', DoubleType()),
+  ('PhoneService', 'phoneService', StringType()),
+  ('MultipleLines', 'multipleLines', StringType()),
+  ('InternetService', 'internetService', StringType()),
+  ('OnlineSecurity', 'onlineSecurity', StringType()),
+  ('OnlineBackup', 'onlineBackup', StringType()),
+  ('DeviceProtection', 'deviceProtection', StringType()),
+  ('TechSupport', 'techSupport', StringType()),
+  ('StreamingTV', 'streamingTV', StringType()),
+  ('StreamingMovies', 'streamingMovies', StringType()),
+  ('Contract', 'contract', StringType()),
+  ('PaperlessBilling', 'paperlessBilling', StringType()),
+  ('PaymentMethod', 'paymentMethod', StringType()),
+  ('MonthlyCharges', 'monthlyCharges', DoubleType()),
+  ('TotalCharges', 'totalCharges', DoubleType()),
+  ('Churn', 'churnString', StringType()),
+]
+
+corrupt_record_col = '_corrupt_record'
+
+# What the CSV reader sees, plus Spark's slot for lines that fail to parse
+source_schema = StructType([StructField(src, dtype) for src, _, dtype in telco_contract] +
+                           [StructField(corrupt_record_col, StringType())])
+
+# What lands in bronze_customers
+telco_schema = StructType([StructField(dst, dtype) for _, dst, dtype in telco_contract])
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Read
+
+# COMMAND ----------
+
+def parse_telco_csv(spark, path):
+  # Single pass with explicit types; every row comes back, rejects tagged with `_reject_reason`
+  raw = (spark.read.format('csv')
+         .schema(source_schema)
+         .option('header', 'true')
+         .option('enforceSchema', 'false')
+         .option('mode', 'PERMISSIVE')
+         .option('columnNameOfCorruptRecord', corrupt_record_col)
+         .load(path))
+
+  reject_reason = (F.when(F.col(corrupt_record_col).isNotNull(), 'malformed')
+                    .when(F.col('customerID').isNull(), 'missing_customer_id')
+                    .when(~F.coalesce(F.col('Churn').isin('Yes', 'No'), F.lit(False)), 'invalid_label'))
+
+  return raw.select(*[F.col(src).alias(dst) for src, dst, _ in telco_contract],
+                    reject_reason.alias('_reject_reason'),
+                    F.coalesce(F.col(corrupt_record_col),
+                               F.concat_ws(',', *[F.col(src).cast('string') for src, _, _ in telco_contract])).alias('_raw_record'),
+                    F.input_file_name().alias('_source_file'))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Ingest with quarantine
+# MAGIC
+# MAGIC The parsed rows are persisted so the source is scanned once: the reject count fills the cache, and the bronze and quarantine writes read from it. `path` can be a single file, a directory, a glob or a list of files; `num_files` caps the number of bronze files written (see `bulk_ingest`).
+
+# COMMAND ----------
+
+def ingest_telco_csv(spark, path, bronze_path, quarantine_path, mode='overwrite', run_id=None, num_files=None):
+  run_id = run_id or uuid.uuid4().hex
+  parsed = parse_telco_csv(spark, path).persist(StorageLevel.MEMORY_AND_DISK)
+  try:
+    counts = {r['_reject_reason']: r['count'] for r in parsed.groupBy('_reject_reason').count().collect()}
+    rejects_by_reason = {k: v for k, v in counts.items() if k is not None}
+
+    accepted = parsed.filter(F.col('_reject_reason').isNull()).select(*telco_schema.fieldNames())
+    if num_files:
+      accepted = accepted.coalesce(num_files)
+    (accepted.write.format('delta').mode(mode)
+           .option('userMetadata', f'telco_schema_v{telco_schema_version} run_id={run_id}')
+           .save(bronze_path))
+
+    if rejects_by_reason:
+      (parsed.filter(F.col('_reject_reason').isNotNull())
+             .select(F.col('_reject_reason').alias('reason'),
+                     F.col('customerID'),
+                     F.col('_raw_record').alias('raw_record'),
+                     F.col('_source_file').alias('source_file'),
+                     F.lit(telco_schema_version).alias('schema_version'),
+                     F.lit(run_id).alias('run_id'),
+                     F.current_timestamp().alias('quarantined_at'))
+             .write.format('delta').mode('append').save(quarantine_path))
+  finally:
+    parsed.unpersist()
+
+  return {'run_id': run_id,
+          'schema_version': telco_schema_version,
+          'accepted': counts.get(None, 0),
+          'rejected': sum(rejects_by_reason.values()),
+          'rejects_by_reason': rejects_by_reason}
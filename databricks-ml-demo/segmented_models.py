@@ -0,0 +1,164 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Segmented models
+# MAGIC
+# MAGIC One churn model per customer segment (contract type, internet service tier, or both), trained in parallel instead of one AutoML run per segment:
+# MAGIC
+# MAGIC - The segment key is derived from the one-hot columns of `churn_features`. `groupBy(segment).applyInPandas` then fits `fit_churn_pipeline` (the same pipeline as `train_churn_model`) on every segment at once, one segment per task. Segments with fewer than `min_rows` rows, or only one class, are skipped.
+# MAGIC - The fitted pipelines come back to the driver as pickled bytes and are logged there, one nested run per segment under a single parent run. Executors never talk to the tracking server. The parent run holds `segments.json`, the segment → model URI map that the scorer reads.
+# MAGIC - `score_segments` broadcasts every segment's model and routes each row to its own segment's model in one `mapInPandas` pass, with no shuffle. Rows of a segment without a model go to `fallback_uri` when one is given; otherwise their prediction is null.
+
+# COMMAND ----------
+
+# MAGIC %run ./pipeline_stages
+
+# COMMAND ----------
+
+import json
+import pickle
+import tempfile
+import time
+
+from pyspark.sql import functions as F
+from pyspark.sql import types as T
+
+if 'fit_churn_pipeline' not in globals():
+  from pipeline_stages import churn_xgb_params, fit_churn_pipeline
+
+segmentations = {
+  'contract': ['contract_Month-to-month', 'contract_Oneyear', 'contract_Twoyear'],
+  'internet_service': ['internetService_DSL', 'internetService_Fiberoptic', 'internetService_No'],
+}
+segment_col = 'segment'
+fallback_segment = 'fallback'
+
+segment_result_schema = T.StructType([
+  T.StructField('segment', T.StringType()),
+  T.StructField('status', T.StringType()),
+  T.StructField('rows', T.LongType()),
+  T.StructField('positives', T.LongType()),
+  T.StructField('seconds', T.DoubleType()),
+  T.StructField('val_accuracy_score', T.DoubleType()),
+  T.StructField('val_f1_score', T.DoubleType()),
+  T.StructField('best_iteration', T.LongType()),
+  T.StructField('model', T.BinaryType()),
+])
+
+# COMMAND ----------
+
+def segment_key(segment_by):
+  # 'contract=Month-to-month|internet_service=Fiberoptic', from the one-hot columns of each segmentation
+  parts = []
+  for name in segment_by:
+    value = F.coalesce(*[F.when(F.col(f'`{c}`') == 1, F.lit(c.split('_', 1)[1])) for c in segmentations[name]],
+                       F.lit('other'))
+    parts.append(F.concat(F.lit(f'{name}='), value))
+  return F.concat_ws('|', *parts)
+
+
+def with_segment(features, segment_by):
+  return features.withColumn(segment_col, segment_key(segment_by))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Training
+
+# COMMAND ----------
+
+def train_segment_models(spark, features, segment_by, params=None, experiment_name=None, min_rows=200,
+                         target_col='churn', id_col='customerID'):
+  # Returns (parent run id, one summary dict per segment)
+  import mlflow
+
+  params = {**churn_xgb_params, **(params or {})}
+
+  def train(pdf):
+    import pandas as pd
+
+    started = time.time()
+    y = pdf[target_col]
+    result = {'segment': pdf[segment_col].iloc[0], 'rows': len(pdf), 'positives': int(y.sum()), 'status': 'skipped',
+              'val_accuracy_score': None, 'val_f1_score': None, 'best_iteration': None, 'model': None}
+    # Stratified validation split needs both classes
+    if len(pdf) >= min_rows and y.nunique() == 2 and y.value_counts().min() >= 2:
+      model, _, metrics = fit_churn_pipeline(pdf.drop(columns=[segment_col, target_col, id_col]), y, params)
+      result.update(metrics, status='trained', model=pickle.dumps(model))
+    result['seconds'] = time.time() - started
+    return pd.DataFrame([result])
+
+  results = with_segment(features, segment_by).groupBy(segment_col).applyInPandas(train, segment_result_schema).collect()
+
+  if experiment_name:
+    mlflow.set_experiment(experiment_name)
+  summary = []
+  with mlflow.start_run(run_name=f"segments_{'_'.join(segment_by)}") as parent:
+    mlflow.log_params(dict(params, segment_by=','.join(segment_by), min_rows=min_rows))
+    for row in sorted((r.asDict() for r in results), key=lambda r: r['segment']):
+      model_bytes = row.pop('model')
+      if row['status'] == 'trained':
+        with mlflow.start_run(run_name=row['segment'], nested=True) as child:
+          mlflow.set_tag('segment', row['segment'])
+          mlflow.log_params(params)
+          mlflow.log_metrics({k: row[k] for k in ('rows', 'val_accuracy_score', 'val_f1_score', 'best_iteration')})
+          mlflow.sklearn.log_model(pickle.loads(model_bytes), 'model')
+          row['model_uri'] = f'runs:/{child.info.run_id}/model'
+      summary.append(row)
+
+    trained = [s for s in summary if s['status'] == 'trained']
+    trained_rows = sum(s['rows'] for s in trained)
+    mlflow.log_metrics({'segments_trained': len(trained),
+                        'segments_skipped': len(summary) - len(trained),
+                        'weighted_val_accuracy': sum(s['rows'] * s['val_accuracy_score'] for s in trained) / trained_rows
+                                                 if trained_rows else 0.0})
+    mlflow.log_dict({s['segment']: s['model_uri'] for s in trained}, 'segments.json')
+  return parent.info.run_id, summary
+
+
+def segment_model_uris(parent_run_id):
+  import mlflow
+
+  path = mlflow.artifacts.download_artifacts(artifact_uri=f'runs:/{parent_run_id}/segments.json',
+                                             dst_path=tempfile.mkdtemp(prefix='churn-segments-'))
+  with open(path) as f:
+    return json.load(f)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Scoring
+
+# COMMAND ----------
+
+def score_segments(spark, features, segment_by, model_uris, fallback_uri=None, key_cols=('customerID',),
+                   label_col='churn'):
+  import mlflow
+
+  models = {segment: mlflow.sklearn.load_model(uri) for segment, uri in model_uris.items()}
+  if fallback_uri:
+    models[fallback_segment] = mlflow.sklearn.load_model(fallback_uri)
+  shared = spark.sparkContext.broadcast(models)
+
+  segmented = with_segment(features, segment_by)
+  keep_cols = [c for c in list(key_cols) + [label_col] if c in features.columns]
+  schema = T.StructType([segmented.schema[c] for c in keep_cols + [segment_col]]
+                        + [T.StructField('predictions', T.DoubleType()), T.StructField('model_segment', T.StringType())])
+
+  def route(batches):
+    import numpy as np
+
+    models = shared.value
+    for pdf in batches:
+      out = pdf[keep_cols + [segment_col]].copy()
+      out['predictions'] = np.nan
+      out['model_segment'] = None
+      X = pdf.drop(columns=[segment_col])
+      for segment, index in pdf.groupby(segment_col).groups.items():
+        model_segment = segment if segment in models else fallback_segment if fallback_segment in models else None
+        if model_segment is None:
+          continue
+        out.loc[index, 'predictions'] = np.asarray(models[model_segment].predict(X.loc[index])).astype('float64')
+        out.loc[index, 'model_segment'] = model_segment
+      yield out
+
+  return segmented.mapInPandas(route, schema)
@@ -0,0 +1,79 @@
+# Local comparison of per-segment training with applyInPandas against one training run per segment.
+#
+# Builds the churn features on local Spark (optionally scaled up, as in pipeline_benchmark), then
+#   1. trains one model per segment sequentially on the driver, as N separate runs of train_churn_model would,
+#   2. trains the same models in one applyInPandas job (train_segment_models), logged under one parent run,
+#   3. scores every row with score_segments and checks each row was routed to its own segment's model,
+# and prints wall-clock times and per-segment metrics as JSON. Exits non-zero if routing is wrong.
+#
+#   python segmented_models_benchmark.py --rows 100000 --segment-by contract internet_service
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import pipeline_stages as stages
+import segmented_models
+from pipeline_benchmark import scale_telco_csv, telco_csv
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Segmented training: applyInPandas vs one run per segment')
+  parser.add_argument('--rows', type=int, default=7043)
+  parser.add_argument('--segment-by', nargs='+', default=['contract'], choices=list(segmented_models.segmentations))
+  parser.add_argument('--min-rows', type=int, default=200)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  import mlflow
+  from pyspark.sql import functions as F
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-segments-')
+  mlflow.set_tracking_uri('file:' + os.path.join(workdir, 'mlruns'))
+
+  spark = stages.local_spark('churn-segmented-models')
+  csv_path = scale_telco_csv(telco_csv, os.path.join(workdir, f'telco_{args.rows}.csv'), args.rows)
+  bronze, _ = stages.ingest_bronze(spark, csv_path, os.path.join(workdir, 'bronze'))
+  features = stages.compute_churn_features(bronze).cache()
+  features.count()
+
+  started = time.perf_counter()
+  segmented = segmented_models.with_segment(features, args.segment_by)
+  segments = [r[0] for r in segmented.select(segmented_models.segment_col).distinct().collect()]
+  for segment in segments:
+    rows = segmented.where(F.col(segmented_models.segment_col) == segment).drop(segmented_models.segment_col)
+    if rows.count() >= args.min_rows:
+      stages.train_churn_model(rows, experiment_name='churn_segments_sequential')
+  sequential_seconds = time.perf_counter() - started
+
+  started = time.perf_counter()
+  parent_run_id, summary = segmented_models.train_segment_models(spark, features, args.segment_by,
+                                                                 experiment_name='churn_segments',
+                                                                 min_rows=args.min_rows)
+  parallel_seconds = time.perf_counter() - started
+
+  started = time.perf_counter()
+  scored = segmented_models.score_segments(spark, features, args.segment_by,
+                                           segmented_models.segment_model_uris(parent_run_id)).cache()
+  scored_rows = scored.count()
+  score_seconds = time.perf_counter() - started
+  trained = {s['segment'] for s in summary if s['status'] == 'trained'}
+  misrouted = scored.where(F.col('segment').isin(*trained) & (F.col('model_segment') != F.col('segment'))).count()
+
+  report = {'rows': scored_rows, 'segments': len(segments), 'trained': len(trained),
+            'sequential_seconds': round(sequential_seconds, 3), 'apply_in_pandas_seconds': round(parallel_seconds, 3),
+            'speedup': round(sequential_seconds / parallel_seconds, 2) if parallel_seconds else None,
+            'score_seconds': round(score_seconds, 3), 'misrouted_rows': misrouted, 'parent_run_id': parent_run_id,
+            'segment_summary': summary}
+  print(json.dumps(report, indent=2, default=str))
+  if misrouted:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
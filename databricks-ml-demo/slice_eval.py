@@ -0,0 +1,95 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Slice evaluation
+# MAGIC
+# MAGIC Model quality per slice of the customer base, computed in Spark. The features are scored once and cached. A single `GROUPING SETS` aggregation then returns support, accuracy, precision and recall for the whole table and for every combination of the slice columns, up to `max_order` columns at a time. Only that aggregated table comes back to the driver.
+# MAGIC
+# MAGIC Slices with fewer than `min_support` rows are dropped, since their metrics are mostly noise. The `worst_k` slices with the lowest accuracy are flagged, along with each slice's gap to the overall accuracy.
+
+# COMMAND ----------
+
+import itertools
+import uuid
+
+from pyspark.sql import functions as F
+
+# One-hot churn_features columns worth slicing on besides the demographics
+default_slice_cols = ['partner_Yes', 'dependents_Yes', 'contract_Month-to-month', 'internetService_Fiberoptic',
+                      'paymentMethod_Electroniccheck']
+
+# COMMAND ----------
+
+def score_once(features, model_udf, pred_col='predictions'):
+  # Cached, so the display, the slice metrics and the demographic check share one scoring pass
+  return features.withColumn(pred_col, model_udf(*features.columns)).cache()
+
+
+def slice_grouping_sets(slice_cols, max_order=None, include=()):
+  # Every combination of up to `max_order` slice columns, the empty set (overall) and any extra sets in `include`
+  slice_cols = list(slice_cols)
+  max_order = len(slice_cols) if max_order is None else min(max_order, len(slice_cols))
+  sets = [combo for k in range(max_order + 1) for combo in itertools.combinations(slice_cols, k)]
+  for extra in include:
+    extra = tuple(c for c in slice_cols if c in extra)
+    if extra not in sets:
+      sets.append(extra)
+  return sets
+
+
+def _quoted(c):
+  return '`' + c.replace('`', '``') + '`'
+
+# COMMAND ----------
+
+def slice_metrics(spark, scored, slice_cols, label_col='churn', pred_col='predictions', min_support=30, max_order=2,
+                  include=(), worst_k=5):
+  slice_cols = [c for c in slice_cols if c in scored.columns]
+  sets = slice_grouping_sets(slice_cols, max_order, include)
+
+  view = f'slice_eval_{uuid.uuid4().hex}'
+  scored.createOrReplaceTempView(view)
+  label = f'CAST({_quoted(label_col)} AS DOUBLE)'
+  pred = f'CAST({_quoted(pred_col)} AS DOUBLE)'
+  # grouping(c) = 1 when c is rolled up in that row, which tells it apart from a null value of c
+  select = [_quoted(c) for c in slice_cols] + [f'grouping({_quoted(c)}) AS __rolled_{i}' for i, c in enumerate(slice_cols)]
+  select += ['count(1) AS support',
+             f'sum(CASE WHEN {label} = 1 AND {pred} = 1 THEN 1 ELSE 0 END) AS tp',
+             f'sum(CASE WHEN {label} = 0 AND {pred} = 1 THEN 1 ELSE 0 END) AS fp',
+             f'sum(CASE WHEN {label} = 1 AND {pred} = 0 THEN 1 ELSE 0 END) AS fn',
+             f'sum(CASE WHEN {label} = {pred} THEN 1 ELSE 0 END) AS correct']
+  grouping_sets = ', '.join('(' + ', '.join(_quoted(c) for c in s) + ')' for s in sets)
+  query = f'''SELECT {', '.join(select)} FROM {view}
+               GROUP BY GROUPING SETS ({grouping_sets})
+               HAVING count(1) >= {int(min_support)}'''
+  try:
+    counts = spark.sql(query)
+    counts = (counts.withColumn('accuracy', F.col('correct') / F.col('support'))
+                    .withColumn('precision', F.when(F.col('tp') + F.col('fp') > 0, F.col('tp') / (F.col('tp') + F.col('fp'))))
+                    .withColumn('recall', F.when(F.col('tp') + F.col('fn') > 0, F.col('tp') / (F.col('tp') + F.col('fn'))))
+                    .toPandas())
+  finally:
+    spark.catalog.dropTempView(view)
+  return _describe_slices(counts, slice_cols, worst_k)
+
+
+def _describe_slices(counts, slice_cols, worst_k):
+  rolled = [f'__rolled_{i}' for i in range(len(slice_cols))]
+  counts['slice'] = [', '.join(f'{c}={row[c]}' for c, r in zip(slice_cols, rolled) if not row[r]) or 'overall'
+                     for _, row in counts.iterrows()]
+  counts['order'] = len(slice_cols) - counts[rolled].sum(axis=1) if rolled else 0
+  overall = counts.loc[counts.order == 0, 'accuracy']
+  counts['accuracy_gap'] = counts.accuracy - (overall.iloc[0] if len(overall) else float('nan'))
+
+  worst = counts[counts.order > 0].nsmallest(worst_k, 'accuracy').index
+  counts['worst'] = counts.index.isin(worst)
+  columns = ['slice', 'order', 'support', 'accuracy', 'accuracy_gap', 'precision', 'recall', 'worst', 'tp', 'fp', 'fn']
+  return counts.sort_values(['order', 'accuracy']).reset_index(drop=True)[columns + slice_cols]
+
+# COMMAND ----------
+
+def stratum_counts(scored, cols, label_col='churn', pred_col='predictions'):
+  # Correct predictions (acc) and rows (obs) per combination of `cols`, the input of sampling.stratified_accuracy
+  correct = (F.col(label_col).cast('double') == F.col(pred_col).cast('double')).cast('int')
+  return (scored.groupBy(*[F.col(_quoted(c)) for c in cols])
+                .agg(F.sum(correct).alias('acc'), F.count(F.lit(1)).alias('obs'))
+                .toPandas())
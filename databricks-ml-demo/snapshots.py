@@ -0,0 +1,86 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Table snapshots
+# MAGIC
+# MAGIC A named snapshot is just the current Delta version of each pipeline table (`bronze_customers`, `churn_features`, `churn_features_history`, `churn_preds`), saved as a small JSON manifest. Restoring runs `RESTORE TABLE ... TO VERSION AS OF`, which only rewrites the Delta log, so getting back to a known state takes seconds instead of a full ingest → features → predictions rebuild.
+# MAGIC
+# MAGIC - A table that did not exist when the snapshot was taken is emptied on restore (`DELETE FROM`, also log-only).
+# MAGIC - After a restore, `VACUUM` of the restored tables runs on a background thread so orphaned files are cleaned up without holding the reset.
+# MAGIC - Time travel needs the old data files. A snapshot is good for as long as VACUUM keeps them (`delta.deletedFileRetentionDuration`, 7 days by default). Once they are gone, restore fails and `00_reset` falls back to a full reset.
+
+# COMMAND ----------
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+snapshot_tables = ['bronze_customers', 'churn_features', 'churn_features_history', 'churn_preds']
+
+_cleanup_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot-cleanup')
+
+# COMMAND ----------
+
+def table_version(spark, table):
+  # Latest Delta version of a table, or None when it does not exist
+  db, name = table.split('.', 1)
+  if not spark.catalog.tableExists(name, db):
+    return None
+  return spark.sql(f'DESCRIBE HISTORY {table} LIMIT 1').first()['version']
+
+
+def snapshot_manifest_path(snapshots_dir, name):
+  return os.path.join(snapshots_dir, f'{name}.json')
+
+
+def load_snapshot(snapshots_dir, name):
+  try:
+    with open(snapshot_manifest_path(snapshots_dir, name)) as f:
+      return json.load(f)
+  except FileNotFoundError:
+    return None
+
+
+def create_snapshot(spark, name, database_name, snapshots_dir, tables=snapshot_tables):
+  manifest = {'name': name,
+              'database': database_name,
+              'created_at': datetime.now(timezone.utc).isoformat(),
+              'versions': {t: table_version(spark, f'{database_name}.{t}') for t in tables}}
+  os.makedirs(snapshots_dir, exist_ok=True)
+  with open(snapshot_manifest_path(snapshots_dir, name), 'w') as f:
+    json.dump(manifest, f, indent=2)
+  return manifest
+
+# COMMAND ----------
+
+def vacuum_in_background(spark, table, retention_hours=168):
+  from delta.tables import DeltaTable
+
+  return _cleanup_pool.submit(lambda: DeltaTable.forName(spark, table).vacuum(retention_hours))
+
+
+def restore_snapshot(spark, name, snapshots_dir, vacuum_retention_hours=168, cleanup=True):
+  manifest = load_snapshot(snapshots_dir, name)
+  if manifest is None:
+    raise ValueError(f'No snapshot named {name} in {snapshots_dir}')
+
+  report = {'snapshot': name, 'tables': {}, 'cleanup': []}
+  for t, version in manifest['versions'].items():
+    table = f"{manifest['database']}.{t}"
+    current = table_version(spark, table)
+    if version is None:
+      if current is not None:
+        spark.sql(f'DELETE FROM {table}')
+        report['tables'][t] = 'emptied'
+      continue
+    if current is None:
+      raise ValueError(f'{table} no longer exists, snapshot {name} cannot be restored')
+    if current == version:
+      report['tables'][t] = 'unchanged'
+      continue
+
+    spark.sql(f'RESTORE TABLE {table} TO VERSION AS OF {version}')
+    report['tables'][t] = f'restored to version {version}'
+    if cleanup:
+      report['cleanup'].append(vacuum_in_background(spark, table, vacuum_retention_hours))
+  return report
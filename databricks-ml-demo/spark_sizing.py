@@ -0,0 +1,150 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Spark sizing profiles
+# MAGIC
+# MAGIC Every stage used to run with Spark's defaults: on the 7,043-row dataset `ps.get_dummies`, the slice `groupBy` in `05` and the Delta writes fan out to 200 shuffle partitions of almost nothing, while at 100M rows the same 200 partitions are so big they spill.
+# MAGIC
+# MAGIC - `estimate_input` sizes a stage's inputs from metadata only: `DESCRIBE DETAIL` for the bytes and file count of a Delta table or path, and a `count()` that Delta answers from the log's file statistics. A plain file path such as the landing CSV is sized from the file system.
+# MAGIC - `sizing_profile` turns the estimate into settings: shuffle partitions of about `target_partition_mb` in memory (at least one per core while there is enough data), Arrow batches of about `arrow_batch_mb` for `toPandas` and pandas UDFs, a broadcast threshold that grows with the input, and `maxRecordsPerFile` so written files come out near `target_file_mb`.
+# MAGIC - `apply_sizing(spark, stage, *sources)` sets them on the session before a stage, prints them and returns them flat, for a tracing span. `sized(...)` does the same for one block and restores the previous settings afterwards.
+# MAGIC
+# MAGIC ```
+# MAGIC %run ./spark_sizing
+# MAGIC with span('size_spark', stage='features') as s:
+# MAGIC   s.set(**apply_sizing(spark, 'features', f'{database_name}.bronze_customers'))
+# MAGIC ```
+
+# COMMAND ----------
+
+import math
+from contextlib import contextmanager
+
+# Decompressed, deserialized rows take roughly this many times their Delta/Parquet size in memory
+memory_expansion = 3.0
+# Landing CSVs come out at roughly this fraction of their size as Parquet (as in bulk_ingest)
+csv_to_parquet_ratio = 0.3
+
+target_partition_mb = 128
+min_partition_mb = 4
+max_shuffle_partitions = 20000
+arrow_batch_mb = 16
+min_arrow_records, max_arrow_records = 1000, 200000
+target_file_mb = 128
+min_broadcast_mb, max_broadcast_mb = 10, 256
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Input estimates
+
+# COMMAND ----------
+
+def _is_path(source):
+  return '/' in source or source.startswith(('dbfs:', 's3:', 'abfss:', 'gs:'))
+
+
+def _is_delta_path(spark, path):
+  jvm = spark.sparkContext._jvm
+  log = jvm.org.apache.hadoop.fs.Path(path.rstrip('/') + '/_delta_log')
+  return log.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration()).exists(log)
+
+
+def _file_bytes(spark, path):
+  jvm = spark.sparkContext._jvm
+  hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+  fs = hadoop_path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+  return sum(fs.getContentSummary(status.getPath()).getLength() for status in fs.globStatus(hadoop_path) or [])
+
+
+def estimate_input(spark, *sources):
+  # Metadata-only size of a stage's inputs -> {'bytes', 'rows', 'files'}; bytes as Parquet, rows None when unknown
+  estimate = {'bytes': 0, 'rows': 0, 'files': 0}
+  for source in sources:
+    if _is_path(source) and not _is_delta_path(spark, source):
+      csv_bytes = _file_bytes(spark, source)
+      estimate['bytes'] += int(csv_bytes * csv_to_parquet_ratio)
+      estimate['rows'] = None
+      continue
+    target = f'delta.`{source}`' if _is_path(source) else source
+    detail = spark.sql(f'DESCRIBE DETAIL {target}').first()
+    estimate['bytes'] += detail['sizeInBytes'] or 0
+    estimate['files'] += detail['numFiles'] or 0
+    if estimate['rows'] is not None:
+      # Answered from the per-file record counts in the Delta log, no data is scanned
+      df = spark.read.format('delta').load(source) if _is_path(source) else spark.table(source)
+      estimate['rows'] += df.count()
+  return estimate
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Profiles
+
+# COMMAND ----------
+
+def sizing_profile(input_bytes, rows=None, cores=8):
+  # Spark settings for a stage reading `input_bytes` (as Parquet) of `rows` rows on `cores` cores
+  mb = 1024 * 1024
+  memory_bytes = input_bytes * memory_expansion
+  partitions = max(math.ceil(memory_bytes / (target_partition_mb * mb)),
+                   min(cores, math.ceil(memory_bytes / (min_partition_mb * mb))), 1)
+  if partitions > cores:
+    # Whole waves, so the last one does not run on a few cores
+    partitions = math.ceil(partitions / cores) * cores
+  partitions = min(partitions, max_shuffle_partitions)
+
+  conf = {
+    'spark.sql.shuffle.partitions': partitions,
+    'spark.sql.adaptive.advisoryPartitionSizeInBytes': target_partition_mb * mb,
+    'spark.sql.autoBroadcastJoinThreshold': min(max(input_bytes // 100, min_broadcast_mb * mb), max_broadcast_mb * mb),
+    'spark.sql.execution.arrow.pyspark.enabled': 'true',
+  }
+  if rows:
+    row_bytes = max(input_bytes / rows, 1)
+    records = int(arrow_batch_mb * mb / (row_bytes * memory_expansion))
+    conf['spark.sql.execution.arrow.maxRecordsPerBatch'] = min(max(records, min_arrow_records), max_arrow_records)
+    conf['spark.sql.files.maxRecordsPerFile'] = max(int(target_file_mb * mb / row_bytes), 1)
+  return {k: str(v) for k, v in conf.items()}
+
+
+def _cores(spark):
+  return spark.sparkContext.defaultParallelism
+
+
+def _attributes(stage, estimate, conf):
+  # Flat, short names for span attributes and reports
+  return {'stage': stage, 'input_bytes': estimate['bytes'], 'input_rows': estimate['rows'],
+          'input_files': estimate['files'],
+          **{k.rsplit('.', 1)[-1]: int(v) if v.isdigit() else v for k, v in conf.items()}}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Applying a profile
+
+# COMMAND ----------
+
+def apply_sizing(spark, stage, *sources):
+  # Sizes `sources`, sets the matching profile on the session and returns what was chosen
+  estimate = estimate_input(spark, *sources)
+  conf = sizing_profile(estimate['bytes'], estimate['rows'], _cores(spark))
+  for k, v in conf.items():
+    spark.conf.set(k, v)
+  attributes = _attributes(stage, estimate, conf)
+  print(f"Sizing {stage}: {estimate['bytes']:,} bytes, {estimate['rows'] if estimate['rows'] is not None else '?'} rows -> "
+        + ', '.join(f'{k}={v}' for k, v in attributes.items() if k not in ('stage', 'input_bytes', 'input_rows', 'input_files')))
+  return attributes
+
+
+@contextmanager
+def sized(spark, stage, *sources):
+  # apply_sizing for one block; the session's previous settings come back afterwards
+  previous = {k: spark.conf.get(k, None) for k in sizing_profile(1, 1)}
+  try:
+    yield apply_sizing(spark, stage, *sources)
+  finally:
+    for k, v in previous.items():
+      if v is None:
+        spark.conf.unset(k)
+      else:
+        spark.conf.set(k, v)
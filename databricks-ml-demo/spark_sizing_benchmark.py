@@ -0,0 +1,70 @@
+# Pipeline stage times with Spark's default settings vs the per-stage profiles from spark_sizing.py.
+#
+# Runs the local pipeline (pipeline_benchmark.run_pipeline: ingest -> features -> train -> register -> validate ->
+# score) at each data size twice on the same local Spark session, once with the defaults and once with every stage
+# sized from its input, after one discarded warm-up run so JVM and model-loading start-up costs hit neither side.
+# Prints wall time per stage and mode, the speedup and the settings each stage got as JSON. Exits non-zero when the
+# sized pipeline is slower than the defaults at any size by more than --threshold (and the noise floor).
+#
+#   python spark_sizing_benchmark.py --rows 7043 100000 1000000 --output sizing.json
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import pipeline_stages as stages
+from pipeline_benchmark import git_commit, min_regression_seconds, run_pipeline, scale_telco_csv, telco_csv
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Pipeline stage times: default Spark settings vs sizing profiles')
+  parser.add_argument('--rows', type=int, nargs='+', default=[7043, 100000, 1000000])
+  parser.add_argument('--workdir', default=None)
+  parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown of the sized pipeline')
+  parser.add_argument('--output', default=None, help='also write the report to this JSON file')
+  args = parser.parse_args(argv)
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-sizing-')
+  spark = stages.local_spark('churn-sizing')
+  report = {'commit': git_commit(), 'spark': spark.version, 'cores': spark.sparkContext.defaultParallelism, 'sizes': []}
+
+  def pipeline(rows, mode):
+    csv_path = scale_telco_csv(telco_csv, os.path.join(workdir, f'telco_{rows}.csv'), rows)
+    run_dir = os.path.join(workdir, f'{mode}_{rows}')
+    shutil.rmtree(run_dir, ignore_errors=True)
+    print(f'rows={rows:,} {mode}')
+    return run_pipeline(spark, csv_path, run_dir, sizing=mode == 'sized')
+
+  pipeline(min(args.rows), 'warmup')
+  slower = []
+  for rows in args.rows:
+    default, sized = pipeline(rows, 'default'), pipeline(rows, 'sized')
+    stage_report = []
+    for d, s in zip(default, sized):
+      stage_report.append({'stage': d['stage'], 'default_seconds': d['wall_seconds'], 'sized_seconds': s['wall_seconds'],
+                           'speedup': round(d['wall_seconds'] / s['wall_seconds'], 2) if s['wall_seconds'] else None,
+                           'sizing': s.get('sizing')})
+    default_total = round(sum(d['wall_seconds'] for d in default), 3)
+    sized_total = round(sum(s['wall_seconds'] for s in sized), 3)
+    report['sizes'].append({'rows': rows, 'default_seconds': default_total, 'sized_seconds': sized_total,
+                            'speedup': round(default_total / sized_total, 2) if sized_total else None,
+                            'stages': stage_report})
+    if sized_total - default_total > min_regression_seconds and sized_total > default_total * (1 + args.threshold):
+      slower.append(rows)
+
+  report['slower_at_rows'] = slower
+  print(json.dumps(report, indent=2))
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  if slower:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,210 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Tracing
+# MAGIC
+# MAGIC Lightweight timing spans for the pipeline notebooks. Wrap a hot path in `with span('name', key=value):` (or decorate a function with `@traced()`), and nested spans record their parent, wall time and attributes such as row counts, model version or HTTP status.
+# MAGIC
+# MAGIC At the end of a notebook, `tracer.export_jsonl(dir)` appends the spans to `<dir>/<trace name>.jsonl` and `tracer.log_to_mlflow()` logs one metric per span (`trace.<path>.seconds`) and its attributes as tags.
+# MAGIC
+# MAGIC Set `CHURN_TRACING=0` (or `tracer.enabled = False`) to switch it off: `span` then hands back a shared no-op object and `@traced` calls straight through, so the disabled cost is one attribute check.
+# MAGIC
+# MAGIC ```
+# MAGIC %run ./tracing
+# MAGIC tracer.start('06_staging_batch_inference')
+# MAGIC with span('load_model', model_uri=model_uri):
+# MAGIC   model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri)
+# MAGIC ```
+
+# COMMAND ----------
+
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+
+class Span:
+  __slots__ = ('tracer', 'name', 'path', 'span_id', 'parent_id', 'attributes', 'status', 'start_time', 'duration', '_t0')
+
+  def __init__(self, tracer, name, attributes):
+    self.tracer = tracer
+    self.name = name
+    self.span_id = uuid.uuid4().hex[:16]
+    self.parent_id = None
+    self.path = name
+    self.attributes = {}
+    self.status = 'ok'
+    self.start_time = None
+    self.duration = None
+    self.set(**attributes)
+
+  def set(self, **attributes):
+    # Callables are only evaluated when tracing is on, e.g. set(rows=lambda: df.count())
+    for k, v in attributes.items():
+      self.attributes[k] = v() if callable(v) else v
+    return self
+
+  def set_from(self, fn):
+    # Same, for a callable returning several attributes, e.g. set_from(lambda: delta_write_metrics(spark, path))
+    return self.set(**fn())
+
+  def __enter__(self):
+    stack = self.tracer._stack()
+    if stack:
+      self.parent_id = stack[-1].span_id
+      self.path = stack[-1].path + '/' + self.name
+    stack.append(self)
+    self.start_time = time.time()
+    self._t0 = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.duration = time.perf_counter() - self._t0
+    if exc_type is not None:
+      self.status = 'error'
+      self.attributes.setdefault('error', exc_type.__name__)
+    self.tracer._stack().pop()
+    self.tracer._finish(self)
+    return False
+
+  def to_dict(self):
+    return {'trace_id': self.tracer.trace_id, 'trace': self.tracer.name, 'span_id': self.span_id,
+            'parent_id': self.parent_id, 'name': self.name, 'path': self.path, 'start_time': self.start_time,
+            'duration_seconds': self.duration, 'status': self.status, 'attributes': self.attributes}
+
+
+class _NoopSpan:
+  __slots__ = ()
+
+  def set(self, **attributes):
+    return self
+
+  def set_from(self, fn):
+    return self
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    return False
+
+
+_noop_span = _NoopSpan()
+
+
+class Tracer:
+
+  def __init__(self, name='churn', enabled=True):
+    self.enabled = enabled
+    self.start(name)
+
+  def start(self, name):
+    # Begin a new trace, dropping any spans that were not exported
+    self.name = name
+    self.trace_id = uuid.uuid4().hex
+    self.finished = []
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    return self
+
+  def _stack(self):
+    stack = getattr(self._local, 'stack', None)
+    if stack is None:
+      stack = self._local.stack = []
+    return stack
+
+  def _finish(self, span):
+    with self._lock:
+      self.finished.append(span)
+
+  def span(self, name, **attributes):
+    if not self.enabled:
+      return _noop_span
+    return Span(self, name, attributes)
+
+  def traced(self, name=None, **attributes):
+    def decorator(fn):
+      span_name = name or fn.__name__
+
+      @functools.wraps(fn)
+      def wrapper(*args, **kwargs):
+        if not self.enabled:
+          return fn(*args, **kwargs)
+        with Span(self, span_name, attributes):
+          return fn(*args, **kwargs)
+      return wrapper
+    return decorator
+
+  def summary(self):
+    # Total seconds and call count per span path, in the order the paths first finished
+    totals = {}
+    for s in self.finished:
+      count, seconds = totals.get(s.path, (0, 0.0))
+      totals[s.path] = (count + 1, seconds + s.duration)
+    return [{'path': p, 'count': c, 'seconds': round(t, 4)} for p, (c, t) in totals.items()]
+
+  def export_jsonl(self, directory):
+    if not self.finished:
+      return None
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{self.name}.jsonl')
+    with open(path, 'a') as f:
+      for s in self.finished:
+        f.write(json.dumps(s.to_dict(), default=str) + '\n')
+    return path
+
+  def log_to_mlflow(self, run_id=None):
+    # Everything goes out in log_batch calls: one metric per span (stepped when a path repeats) plus attribute tags
+    import mlflow
+    from mlflow.entities import Metric, RunTag
+    from mlflow.tracking import MlflowClient
+
+    if not self.finished:
+      return None
+    if run_id is None:
+      active = mlflow.active_run()
+      if active is None:
+        with mlflow.start_run(run_name=f'trace-{self.name}') as run:
+          return self.log_to_mlflow(run.info.run_id)
+      run_id = active.info.run_id
+
+    timestamp = int(time.time() * 1000)
+    steps, metrics, tags = {}, [], {'trace.id': self.trace_id, 'trace.name': self.name}
+    for s in self.finished:
+      key = _mlflow_key(s.path)
+      step = steps[key] = steps.get(key, -1) + 1
+      metrics.append(Metric(f'trace.{key}.seconds', s.duration, timestamp, step))
+      for k, v in s.attributes.items():
+        tags[_mlflow_key(f'trace.{s.path}.{k}')] = str(v)[:5000]
+
+    client = MlflowClient()
+    tags = [RunTag(k, v) for k, v in tags.items()]
+    for i in range(0, max(len(metrics), len(tags)), 100):
+      client.log_batch(run_id, metrics=metrics[i:i + 100], tags=tags[i:i + 100])
+    return run_id
+
+
+def _mlflow_key(key):
+  return re.sub(r'[^\w\-./ ]', '_', key)
+
+
+def delta_write_metrics(spark, table):
+  # Row/file/byte counts of the last commit to a Delta table (name or path), read from the log instead of rescanning
+  from delta.tables import DeltaTable
+
+  if '/' in table:
+    history = DeltaTable.forPath(spark, table).history(1)
+  else:
+    history = DeltaTable.forName(spark, table).history(1)
+  metrics = history.select('operationMetrics').first()[0] or {}
+  return {'rows': int(metrics.get('numOutputRows', 0)),
+          'files': int(metrics.get('numFiles', metrics.get('numAddedFiles', 0))),
+          'bytes': int(metrics.get('numOutputBytes', metrics.get('numAddedBytes', 0)))}
+
+
+tracer = Tracer(enabled=os.environ.get('CHURN_TRACING', '1') != '0')
+span = tracer.span
+traced = tracer.traced
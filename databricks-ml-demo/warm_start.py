@@ -0,0 +1,156 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Warm-start retraining
+# MAGIC
+# MAGIC An incremental alternative to rerunning AutoML from scratch (`07`). The Production pipeline is loaded as is, and its fitted preprocessing is reused unchanged so the booster's inputs keep their meaning. XGBoost then continues boosting from the incumbent's trees (cut at its `best_iteration`) on the feature rows that are new or changed since the incumbent was trained, plus a random replay of the rest so the added trees don't fit only the latest rows. Boosting stops early on a validation split.
+# MAGIC
+# MAGIC Rows are split by a hash of `customerID`, so the splits are stable across feature versions and retrains:
+# MAGIC
+# MAGIC - `early_stop`: the validation set for early stopping
+# MAGIC - `holdout`: never trained on or used to stop. The candidate and the incumbent are both scored on it, and the candidate is only registered if it wins.
+# MAGIC
+# MAGIC The fitted preprocessing never changes in an incremental retrain, so a full retrain still has to run now and then (`full_retrain_due`).
+
+# COMMAND ----------
+
+import time
+
+from pyspark.sql import functions as F
+
+retrain_modes = ['auto', 'incremental', 'full', 'compare']
+
+# Out of 10 hash buckets of the key
+early_stop_bucket, holdout_bucket = 0, 1
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Training data
+
+# COMMAND ----------
+
+def split_bucket(key_col='customerID', buckets=10):
+  return F.pmod(F.xxhash64(F.col(key_col)), F.lit(buckets))
+
+
+def holdout_split(features, key_col='customerID'):
+  # (train, early_stop, holdout)
+  bucket = split_bucket(key_col)
+  return (features.where(~bucket.isin(early_stop_bucket, holdout_bucket)),
+          features.where(bucket == early_stop_bucket),
+          features.where(bucket == holdout_bucket))
+
+
+def changed_rows(spark, feature_table, since_version):
+  # Rows of the current version that were not in `since_version` (inserted or updated since); all rows if unknown
+  current = spark.table(feature_table)
+  if since_version is None:
+    return current
+  previous = spark.sql(f'SELECT * FROM {feature_table} VERSION AS OF {int(since_version)}')
+  return current.exceptAll(previous.select(*current.columns))
+
+
+def incremental_training_rows(changed, train, replay_fraction=0.2, key_col='customerID', seed=42):
+  # Changed rows outside the early-stop and holdout buckets, plus a replay sample of the unchanged training rows
+  changed = changed.where(~split_bucket(key_col).isin(early_stop_bucket, holdout_bucket))
+  replay = train.join(changed.select(key_col), key_col, 'left_anti').sample(fraction=replay_fraction, seed=seed)
+  return changed.unionByName(replay)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Cadence
+
+# COMMAND ----------
+
+def plan_retrain(mode, incumbent_tags=None, full_every_days=7, now=None):
+  # -> ('full' | 'incremental' | 'compare', reason)
+  if mode != 'auto':
+    return mode, 'requested'
+  if incumbent_tags is None:
+    return 'full', 'no Production model'
+  full_retrain_at = incumbent_tags.get('full_retrain_at')
+  if full_retrain_at is None:
+    return 'full', 'Production model has no full_retrain_at tag'
+  age_days = ((now or time.time()) - float(full_retrain_at)) / 86400
+  if age_days >= full_every_days:
+    return 'full', f'last full retrain {age_days:.1f} days ago'
+  return 'incremental', f'last full retrain {age_days:.1f} days ago'
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC #### Continue boosting
+
+# COMMAND ----------
+
+def _xgb_step(model):
+  # The fitted XGBClassifier at the end of the pipeline, or the one inside AutoML's TransformedTargetClassifier
+  final = model.steps[-1][1]
+  for candidate in (final, getattr(final, 'classifier_', None)):
+    if candidate is not None and hasattr(candidate, 'get_booster'):
+      return candidate
+  raise ValueError(f'Cannot warm-start {final!r}: no XGBoost booster found')
+
+
+def warm_start_fit(model, train_pdf, early_stop_pdf, target_col='churn', rounds=100, early_stopping_rounds=10):
+  # Returns a new pipeline: the incumbent's fitted preprocessing and its trees, plus up to `rounds` more
+  import copy
+  from sklearn.pipeline import Pipeline
+  from xgboost import XGBClassifier
+
+  incumbent = _xgb_step(model)
+  preprocessor = Pipeline(model.steps[:-1])
+  X_train = preprocessor.transform(train_pdf.drop(columns=[target_col]))
+  X_early_stop = preprocessor.transform(early_stop_pdf.drop(columns=[target_col]))
+
+  booster = incumbent.get_booster()
+  best_iteration = getattr(incumbent, 'best_iteration', None)
+  if best_iteration is not None:
+    booster = booster[:best_iteration + 1]
+  base_rounds = booster.num_boosted_rounds()
+
+  params = {k: v for k, v in incumbent.get_params().items() if k not in ('n_estimators', 'early_stopping_rounds')}
+  candidate = XGBClassifier(**params, n_estimators=rounds, early_stopping_rounds=early_stopping_rounds)
+  candidate.fit(X_train, train_pdf[target_col], eval_set=[(X_early_stop, early_stop_pdf[target_col])],
+                xgb_model=booster, verbose=False)
+
+  name, final = model.steps[-1]
+  if final is incumbent:
+    final = candidate
+  else:
+    final = copy.deepcopy(final)
+    final.classifier_ = candidate
+  total_rounds = (candidate.best_iteration + 1) if getattr(candidate, 'best_iteration', None) is not None \
+    else candidate.get_booster().num_boosted_rounds()
+  return Pipeline(model.steps[:-1] + [(name, final)]), {'base_rounds': base_rounds,
+                                                         'added_rounds': total_rounds - base_rounds,
+                                                         'training_rows': len(train_pdf)}
+
+
+def holdout_metrics(model, holdout_pdf, target_col='churn'):
+  from sklearn.metrics import accuracy_score, f1_score
+
+  preds = model.predict(holdout_pdf.drop(columns=[target_col]))
+  return {'holdout_accuracy': accuracy_score(holdout_pdf[target_col], preds),
+          'holdout_f1': f1_score(holdout_pdf[target_col], preds)}
+
+
+def beats_incumbent(candidate_metrics, incumbent_metrics, min_improvement=0.0, metric='holdout_f1'):
+  return candidate_metrics[metric] >= incumbent_metrics[metric] + min_improvement
+
+# COMMAND ----------
+
+def log_warm_start_model(model, train_pdf, metrics, params=None, tags=None, experiment_name=None, target_col='churn'):
+  import mlflow
+  from mlflow.models import infer_signature
+
+  X = train_pdf.drop(columns=[target_col])
+  if experiment_name:
+    mlflow.set_experiment(experiment_name)
+  with mlflow.start_run() as mlflow_run:
+    mlflow.log_params(params or {})
+    mlflow.log_metrics(metrics)
+    mlflow.set_tags(tags or {})
+    mlflow.sklearn.log_model(model, 'model', signature=infer_signature(X, model.predict(X)), input_example=X.head(5))
+  return mlflow_run.info.run_id
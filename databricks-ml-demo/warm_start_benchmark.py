@@ -0,0 +1,76 @@
+# Local comparison of an incremental (warm-start) retrain with a full retrain.
+#
+# Builds the churn features on local Spark, holds back a share of the customers as "new" rows and trains the
+# incumbent model (train_churn_model) on the rest. Then, with the new rows arriving,
+#   1. retrains from scratch on everything (the full retrain),
+#   2. continues boosting the incumbent on the new rows plus a replay sample (warm_start_fit),
+# and prints wall-clock time and holdout accuracy/F1 for the incumbent and both candidates as JSON. The holdout
+# is the same hash bucket 07 uses, so none of the models train on it.
+#
+#   python warm_start_benchmark.py --rows 100000 --new-share 0.2
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import pipeline_stages as stages
+import warm_start
+from pipeline_benchmark import scale_telco_csv, telco_csv
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Warm-start incremental retrain vs full retrain: time and holdout metrics')
+  parser.add_argument('--rows', type=int, default=7043)
+  parser.add_argument('--new-share', type=float, default=0.2)
+  parser.add_argument('--replay-fraction', type=float, default=0.2)
+  parser.add_argument('--rounds', type=int, default=100)
+  parser.add_argument('--workdir', default=None)
+  args = parser.parse_args(argv)
+
+  import mlflow
+  from pyspark.sql import functions as F
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix='churn-warm-start-')
+  mlflow.set_tracking_uri('file:' + os.path.join(workdir, 'mlruns'))
+
+  spark = stages.local_spark('churn-warm-start')
+  csv_path = scale_telco_csv(telco_csv, os.path.join(workdir, f'telco_{args.rows}.csv'), args.rows)
+  bronze, _ = stages.ingest_bronze(spark, csv_path, os.path.join(workdir, 'bronze'))
+  features = stages.compute_churn_features(bronze).cache()
+
+  # A different hash than the holdout split, so new rows fall in every split
+  is_new = F.pmod(F.xxhash64(F.concat(F.col('customerID'), F.lit('new'))), F.lit(1000)) < int(args.new_share * 1000)
+  train_df, early_stop_df, holdout_df = warm_start.holdout_split(features)
+  holdout_pdf = holdout_df.toPandas()
+  trainable = features.where(warm_start.split_bucket() != warm_start.holdout_bucket)
+
+  incumbent_run = stages.train_churn_model(trainable.where(~is_new), experiment_name='churn_warm_start')
+  incumbent = mlflow.sklearn.load_model(f'runs:/{incumbent_run}/model')
+  report = {'rows': features.count(), 'new_rows': features.where(is_new).count(),
+            'incumbent': warm_start.holdout_metrics(incumbent, holdout_pdf)}
+
+  started = time.perf_counter()
+  full_run = stages.train_churn_model(trainable, experiment_name='churn_warm_start')
+  full_seconds = time.perf_counter() - started
+  report['full'] = dict(seconds=round(full_seconds, 3),
+                        **warm_start.holdout_metrics(mlflow.sklearn.load_model(f'runs:/{full_run}/model'), holdout_pdf))
+
+  started = time.perf_counter()
+  train_pdf = warm_start.incremental_training_rows(features.where(is_new), train_df, args.replay_fraction).toPandas()
+  warm_model, warm_info = warm_start.warm_start_fit(incumbent, train_pdf, early_stop_df.toPandas(), rounds=args.rounds)
+  warm_seconds = time.perf_counter() - started
+  report['incremental'] = dict(seconds=round(warm_seconds, 3), **warm_info,
+                               **warm_start.holdout_metrics(warm_model, holdout_pdf))
+  report['incremental']['beats_incumbent'] = warm_start.beats_incumbent(report['incremental'], report['incumbent'])
+  report['speedup'] = round(full_seconds / warm_seconds, 2) if warm_seconds else None
+
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()